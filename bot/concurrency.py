@@ -0,0 +1,78 @@
+import asyncio
+import logging
+from collections import OrderedDict
+from telegram.ext import BaseUpdateProcessor
+
+logger = logging.getLogger(__name__)
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """پردازش همزمان آپدیت‌های کاربران مختلف با حفظ ترتیب پیام‌های هر کاربر"""
+
+    def __init__(self, max_concurrent_updates, dedup_window=10000):
+        super().__init__(max_concurrent_updates)
+        # قفل هر کاربر: key -> [قفل، تعداد آپدیت‌های منتظر یا در حال پردازش]
+        self._locks = {}
+        # update_id های اخیر برای رد آپدیت‌های تکراری (ارسال مجدد توسط تلگرام یا وب‌هوک)
+        self._seen = OrderedDict()
+        self.dedup_window = dedup_window
+        self.stats = {"updates": 0, "duplicates": 0}
+
+    @staticmethod
+    def _update_key(update):
+        """کلید ترتیب پردازش: شناسه کاربر (یا چت در صورت نبود کاربر)"""
+        user = getattr(update, "effective_user", None)
+        if user is not None:
+            return ("user", user.id)
+        chat = getattr(update, "effective_chat", None)
+        if chat is not None:
+            return ("chat", chat.id)
+        return None
+
+    def _is_duplicate(self, update):
+        """ثبت update_id و تشخیص آپدیت تکراری"""
+        update_id = getattr(update, "update_id", None)
+        if update_id is None:
+            return False
+        if update_id in self._seen:
+            return True
+        self._seen[update_id] = None
+        if len(self._seen) > self.dedup_window:
+            self._seen.popitem(last=False)
+        return False
+
+    async def do_process_update(self, update, coroutine):
+        """حذف آپدیت‌های تکراری و اجرای آپدیت‌های هر کاربر به ترتیب
+        (process_update در کلاس پایه final است و ظرفیت سراسری را با semaphore محدود می‌کند)"""
+        self.stats["updates"] += 1
+        if self._is_duplicate(update):
+            self.stats["duplicates"] += 1
+            logger.debug(f"آپدیت تکراری {update.update_id} نادیده گرفته شد")
+            # coroutine ساخته شده ولی اجرا نمی‌شود؛ بستن آن از هشدار "never awaited" جلوگیری می‌کند
+            coroutine.close()
+            return
+
+        key = self._update_key(update)
+        if key is None:
+            await coroutine
+            return
+
+        entry = self._locks.get(key)
+        if entry is None:
+            entry = self._locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                await coroutine
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._locks[key]
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    def get_stats(self):
+        return dict(self.stats, tracked_update_ids=len(self._seen))
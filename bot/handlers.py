@@ -5,6 +5,9 @@ from telegram.ext import CallbackContext, ConversationHandler
 from db.models import save_chat_message, get_user_profile, update_user_profile
 from graph.builder import process_with_langgraph
 from bot.utils import format_message, create_profile_keyboard, create_main_keyboard
+from bot.streaming import StreamingReply
+from graph.memory import aget_memory, has_recent_greeting
+from graph.matcher import is_greeting
 
 import config
 
@@ -177,7 +180,31 @@ async def analysis_command(update: Update, context: CallbackContext) -> None:
     # ذخیره حالت کاربر برای تحلیل عملکرد
     context.user_data["state"] = "waiting_for_exam_results"
 
-# تغییرات پیشنهادی برای فایل bot/handlers.py:
+async def respond_with_langgraph(update: Update, context: CallbackContext, input_data: dict, error_message: str) -> None:
+    """پردازش درخواست با LangGraph، ارسال پاسخ (در صورت فعال بودن به صورت تدریجی) و ذخیره آن"""
+    user_id = update.effective_user.id
+    streaming_reply = None
+    try:
+        if config.STREAMING_ENABLED:
+            streaming_reply = StreamingReply(update.message)
+            await streaming_reply.start()
+            input_data["on_token"] = streaming_reply.on_token
+        
+        response = await process_with_langgraph(input_data, context.bot_data["workflow"])
+        formatted_response = format_message(response)
+        if streaming_reply is not None:
+            await streaming_reply.finish(formatted_response)
+        else:
+            await update.message.reply_text(formatted_response, parse_mode=ParseMode.MARKDOWN)
+        # ذخیره پاسخ بات در پایگاه داده (پس از ارسال پاسخ)
+        await save_chat_message(user_id, "bot", formatted_response)
+    except Exception as e:
+        logger.error(f"خطا در پردازش درخواست {input_data.get('type')}: {e}")
+        if streaming_reply is not None and streaming_reply.started:
+            await streaming_reply.finish(error_message)
+        else:
+            await update.message.reply_text(error_message)
+        await save_chat_message(user_id, "bot", error_message)
 
 async def text_message_handler(update: Update, context: CallbackContext) -> None:
     """پردازش پیام‌های متنی کاربر"""
@@ -202,17 +229,10 @@ async def text_message_handler(update: Update, context: CallbackContext) -> None
             "message": message_text
         }
         
-        try:
-            response = await process_with_langgraph(input_data)
-            formatted_response = format_message(response)
-            # ذخیره پاسخ بات در پایگاه داده
-            await save_chat_message(user_id, "bot", formatted_response)
-            await update.message.reply_text(formatted_response, parse_mode=ParseMode.MARKDOWN)
-        except Exception as e:
-            logger.error(f"خطا در پردازش درخواست برنامه مطالعاتی: {e}")
-            error_message = "متأسفانه در پردازش درخواست شما مشکلی پیش آمد. لطفاً دوباره تلاش کنید."
-            await save_chat_message(user_id, "bot", error_message)
-            await update.message.reply_text(error_message)
+        await respond_with_langgraph(
+            update, context, input_data,
+            "متأسفانه در پردازش درخواست شما مشکلی پیش آمد. لطفاً دوباره تلاش کنید."
+        )
     
     elif user_state == "waiting_for_exam_results":
         # پردازش تحلیل عملکرد
@@ -232,17 +252,10 @@ async def text_message_handler(update: Update, context: CallbackContext) -> None
             "exam_results": exam_results
         }
         
-        try:
-            response = await process_with_langgraph(input_data)
-            formatted_response = format_message(response)
-            # ذخیره پاسخ بات در پایگاه داده
-            await save_chat_message(user_id, "bot", formatted_response)
-            await update.message.reply_text(formatted_response, parse_mode=ParseMode.MARKDOWN)
-        except Exception as e:
-            logger.error(f"خطا در پردازش تحلیل عملکرد: {e}")
-            error_message = "متأسفانه در پردازش درخواست شما مشکلی پیش آمد. لطفاً دوباره تلاش کنید."
-            await save_chat_message(user_id, "bot", error_message)
-            await update.message.reply_text(error_message)
+        await respond_with_langgraph(
+            update, context, input_data,
+            "متأسفانه در پردازش درخواست شما مشکلی پیش آمد. لطفاً دوباره تلاش کنید."
+        )
     
     else:
         # گفتگوی عمومی
@@ -256,21 +269,10 @@ async def text_message_handler(update: Update, context: CallbackContext) -> None
             return
         
         # دریافت حافظه کاربر
-        from graph.memory import get_memory
-        user_memory = get_memory(user_id)
-        
-        # بررسی آیا پیام تکراری سلام است
-        is_greeting = any(word in message_text.lower() for word in ["سلام", "درود", "خوبی", "چطوری"])
-        has_recent_greeting = False
+        user_memory = await aget_memory(user_id)
         
-        # بررسی آخرین پیام‌های کاربر برای تشخیص تکرار سلام
-        if is_greeting and user_memory["short_term"]:
-            recent_messages = list(user_memory["short_term"])[-6:]  # بررسی 6 پیام آخر
-            for msg in recent_messages:
-                if msg["role"] == "user" and any(word in msg["content"].lower() for word in ["سلام", "درود", "خوبی", "چطوری"]):
-                    if msg["content"] != message_text:  # اگر پیام دقیقاً همین نباشد
-                        has_recent_greeting = True
-                        break
+        # بررسی آیا پیام تکراری سلام است (وضعیت سلام به صورت تدریجی در حافظه نگهداری می‌شود)
+        recent_greeting = is_greeting(message_text) and has_recent_greeting(user_memory, message_text)
         
         # ارسال به LangGraph برای پردازش
         input_data = {
@@ -278,17 +280,10 @@ async def text_message_handler(update: Update, context: CallbackContext) -> None
             "user_profile": user_profile,
             "message": message_text,
             "memory": user_memory,
-            "has_recent_greeting": has_recent_greeting  # اضافه کردن اطلاعات سلام تکراری
+            "has_recent_greeting": recent_greeting  # اضافه کردن اطلاعات سلام تکراری
         }
         
-        try:
-            response = await process_with_langgraph(input_data)
-            formatted_response = format_message(response)
-            # ذخیره پاسخ بات در پایگاه داده
-            await save_chat_message(user_id, "bot", formatted_response)
-            await update.message.reply_text(formatted_response, parse_mode=ParseMode.MARKDOWN)
-        except Exception as e:
-            logger.error(f"خطا در پردازش پیام عمومی: {e}")
-            error_message = "متأسفانه در پردازش پیام شما مشکلی پیش آمد. لطفاً دوباره تلاش کنید."
-            await save_chat_message(user_id, "bot", error_message)
-            await update.message.reply_text(error_message)
\ No newline at end of file
+        await respond_with_langgraph(
+            update, context, input_data,
+            "متأسفانه در پردازش پیام شما مشکلی پیش آمد. لطفاً دوباره تلاش کنید."
+        )
\ No newline at end of file
@@ -0,0 +1,121 @@
+import asyncio
+import logging
+import time
+from telegram.constants import ParseMode
+from telegram.error import BadRequest, RetryAfter
+import config
+
+logger = logging.getLogger(__name__)
+
+# حداکثر طول یک پیام تلگرام
+MAX_MESSAGE_LENGTH = 4096
+
+# آمار زمان رسیدن اولین بخش قابل مشاهده پاسخ به کاربر
+streaming_stats = {
+    "replies": 0,
+    "first_tokens": 0,
+    "first_token_total": 0.0,
+    "first_token_max": 0.0,
+    "edits": 0,
+    "rate_limited": 0,
+}
+
+def get_streaming_stats():
+    """آمار پاسخ‌های جریانی؛ شاخص اصلی: میانگین زمان نمایش اولین بخش پاسخ (میلی‌ثانیه)"""
+    count = streaming_stats["first_tokens"]
+    return dict(
+        streaming_stats,
+        avg_first_token_ms=1000 * streaming_stats["first_token_total"] / count if count else 0.0,
+        max_first_token_ms=1000 * streaming_stats["first_token_max"],
+    )
+
+class StreamingReply:
+    """ارسال پاسخ به صورت تدریجی: یک پیام موقت که با رسیدن توکن‌ها ویرایش می‌شود"""
+
+    def __init__(self, message, edit_interval=None, placeholder=None):
+        self.message = message
+        self.edit_interval = edit_interval or config.STREAM_EDIT_INTERVAL
+        self.placeholder = placeholder or config.STREAM_PLACEHOLDER
+        self.started_at = time.monotonic()
+        self.first_token_latency = None
+        self._sent = None
+        self._text = ""
+        self._shown = ""
+        self._task = None
+        self._next_edit_at = 0.0
+
+    @property
+    def started(self):
+        return self._sent is not None
+
+    async def start(self):
+        """ارسال پیام موقت و شروع ویرایش دوره‌ای"""
+        self._sent = await self.message.reply_text(self.placeholder)
+        self._task = asyncio.create_task(self._edit_loop())
+
+    async def on_token(self, text):
+        """دریافت متن تجمعی پاسخ (ویرایش پیام در پس‌زمینه و با محدودیت نرخ انجام می‌شود)"""
+        self._text = text
+
+    async def finish(self, text):
+        """نمایش متن نهایی با Markdown (در صورت خطای قالب‌بندی، به صورت متن ساده)"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+        # تلگرام متن خالی را نمی‌پذیرد و پیام موقت باقی می‌ماند؛ به جای آن پیام جایگزین نمایش داده می‌شود
+        if not text or not text.strip():
+            text = config.DEFAULT_MESSAGES["empty_reply"]
+        parts = [text[i:i + MAX_MESSAGE_LENGTH] for i in range(0, len(text), MAX_MESSAGE_LENGTH)]
+        await self._edit(parts[0], parse_mode=ParseMode.MARKDOWN, final=True)
+        for part in parts[1:]:
+            try:
+                await self.message.reply_text(part, parse_mode=ParseMode.MARKDOWN)
+            except BadRequest:
+                await self.message.reply_text(part)
+
+        streaming_stats["replies"] += 1
+        if self.first_token_latency is None:
+            self._record_first_token()
+
+    async def _edit_loop(self):
+        while True:
+            await asyncio.sleep(max(self._next_edit_at - time.monotonic(), self.edit_interval))
+            text = self._text[:MAX_MESSAGE_LENGTH]
+            if text.strip() and text != self._shown:
+                # در حین دریافت، متن ناقص ممکن است Markdown نامعتبر باشد؛ پس به صورت ساده نمایش داده می‌شود
+                await self._edit(text)
+
+    async def _edit(self, text, parse_mode=None, final=False):
+        if self._sent is None or (text == self._shown and not final):
+            return
+        try:
+            await self._sent.edit_text(text, parse_mode=parse_mode)
+        except RetryAfter as e:
+            streaming_stats["rate_limited"] += 1
+            self._next_edit_at = time.monotonic() + e.retry_after
+            if not final:
+                return
+            await asyncio.sleep(e.retry_after)
+            await self._edit(text, parse_mode=parse_mode, final=True)
+            return
+        except BadRequest as e:
+            if "not modified" in str(e).lower():
+                return
+            if parse_mode is None:
+                logger.warning(f"خطا در ویرایش پیام: {e}")
+                return
+            await self._edit(text, final=final)
+            return
+        streaming_stats["edits"] += 1
+        self._shown = text
+        if self.first_token_latency is None and text != self.placeholder:
+            self._record_first_token()
+
+    def _record_first_token(self):
+        self.first_token_latency = time.monotonic() - self.started_at
+        streaming_stats["first_tokens"] += 1
+        streaming_stats["first_token_total"] += self.first_token_latency
+        streaming_stats["first_token_max"] = max(streaming_stats["first_token_max"], self.first_token_latency)
+        logger.info(f"زمان نمایش اولین بخش پاسخ: {self.first_token_latency:.2f} ثانیه")
@@ -0,0 +1,262 @@
+import asyncio
+import hmac
+import json
+import logging
+import multiprocessing
+import queue
+import signal
+import time
+from aiohttp import web
+from telegram import Bot, Update
+import config
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+# بخش‌هایی از آپدیت که فرستنده (from) یا چت دارند
+_UPDATE_FIELDS = (
+    "message", "edited_message", "callback_query", "inline_query", "chosen_inline_result",
+    "channel_post", "edited_channel_post", "my_chat_member", "chat_member", "chat_join_request",
+)
+
+def update_owner(data):
+    """شناسه کاربر (یا چت) آپدیت خام برای انتخاب پردازه کارگر"""
+    for field in _UPDATE_FIELDS:
+        item = data.get(field)
+        if not isinstance(item, dict):
+            continue
+        sender = item.get("from") or item.get("chat")
+        if isinstance(sender, dict) and "id" in sender:
+            return sender["id"]
+    return data.get("update_id", 0)
+
+class WebhookServer:
+    """سرور HTTP دریافت آپدیت‌ها: بررسی secret token، تحویل آپدیت به صف داخلی و پاسخ فوری 200"""
+
+    def __init__(self, dispatch, path=None, secret_token=None):
+        # dispatch(data) آپدیت خام را بدون انتظار در صف قرار می‌دهد؛ False یعنی صف پر است
+        self._dispatch = dispatch
+        self.path = path or config.WEBHOOK_PATH
+        self.secret_token = config.WEBHOOK_SECRET_TOKEN if secret_token is None else secret_token
+        if not self.secret_token:
+            raise ValueError("WEBHOOK_SECRET_TOKEN تنظیم نشده است؛ حالت webhook بدون secret token اجرا نمی‌شود")
+        self._runner = None
+        self.stats = {"received": 0, "accepted": 0, "unauthorized": 0, "invalid": 0, "queue_full": 0}
+
+    async def handle(self, request):
+        self.stats["received"] += 1
+        # مقایسه bytes: compare_digest برای رشته‌های غیر ASCII خطای TypeError می‌دهد
+        if not hmac.compare_digest(
+            request.headers.get(SECRET_HEADER, "").encode(), self.secret_token.encode()
+        ):
+            self.stats["unauthorized"] += 1
+            return web.Response(status=403)
+        try:
+            data = json.loads(await request.read())
+        except ValueError:
+            self.stats["invalid"] += 1
+            return web.Response(status=400)
+        if not isinstance(data, dict):
+            self.stats["invalid"] += 1
+            return web.Response(status=400)
+        try:
+            dispatched = self._dispatch(data)
+        except ValueError:
+            self.stats["invalid"] += 1
+            return web.Response(status=400)
+        if not dispatched:
+            # تلگرام پاسخ‌های غیر 2xx را دوباره ارسال می‌کند
+            self.stats["queue_full"] += 1
+            return web.Response(status=503)
+        self.stats["accepted"] += 1
+        return web.Response()
+
+    async def start(self, listen=None, port=None):
+        app = web.Application()
+        app.router.add_post(self.path, self.handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(
+            self._runner, listen or config.WEBHOOK_LISTEN, port or config.WEBHOOK_PORT
+        )
+        await site.start()
+        logger.info(f"سرور webhook روی {listen or config.WEBHOOK_LISTEN}:{port or config.WEBHOOK_PORT}{self.path} آماده است")
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+        logger.info(f"آمار سرور webhook: {self.stats}")
+
+async def set_webhook(bot):
+    """ثبت آدرس webhook در تلگرام"""
+    await bot.set_webhook(
+        url=config.WEBHOOK_URL,
+        secret_token=config.WEBHOOK_SECRET_TOKEN,
+        allowed_updates=Update.ALL_TYPES,
+        max_connections=config.WEBHOOK_MAX_CONNECTIONS,
+    )
+    logger.info(f"webhook در آدرس {config.WEBHOOK_URL} ثبت شد")
+
+def _parse_update(data, bot):
+    """تبدیل آپدیت خام به Update؛ برای آپدیت نامعتبر ValueError می‌دهد"""
+    try:
+        return Update.de_json(data, bot)
+    except Exception as e:
+        logger.warning(f"آپدیت نامعتبر {data.get('update_id')}: {e!r}")
+        raise ValueError(e) from e
+
+def _stop_event():
+    """رویداد توقف با SIGINT/SIGTERM"""
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    return stop
+
+async def _run_application(application, feed):
+    """اجرای Application بدون run_polling؛ feed(application) تا زمان توقف آپدیت‌ها را وارد update_queue می‌کند
+    (application.stop پیش از پایان، آپدیت‌های باقی‌مانده در update_queue را پردازش می‌کند)"""
+    await application.initialize()
+    if application.post_init:
+        await application.post_init(application)
+    await application.start()
+    try:
+        await feed(application)
+    finally:
+        await application.stop()
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
+
+async def _feed_from_webhook(application):
+    stop = _stop_event()
+
+    def dispatch(data):
+        if application.update_queue.qsize() >= config.WEBHOOK_QUEUE_SIZE:
+            return False
+        application.update_queue.put_nowait(_parse_update(data, application.bot))
+        return True
+
+    server = WebhookServer(dispatch)
+    await server.start()
+    await set_webhook(application.bot)
+    try:
+        await stop.wait()
+    finally:
+        await server.stop()
+
+def run_webhook(application):
+    """حالت webhook در یک پردازه: سرور HTTP آپدیت‌ها را مستقیماً در update_queue بات قرار می‌دهد"""
+    asyncio.run(_run_application(application, _feed_from_webhook))
+
+_EMPTY = object()
+
+def _get(update_queue):
+    try:
+        return update_queue.get(timeout=1)
+    except queue.Empty:
+        return _EMPTY
+
+async def _feed_from_queue(application, update_queue):
+    """انتقال آپدیت‌ها از صف پردازه دریافت‌کننده تا رسیدن None؛ آپدیت‌هایی که پاسخ 200 گرفته‌اند
+    دوباره ارسال نمی‌شوند، پس صف پیش از توقف کامل خالی می‌شود"""
+    loop = asyncio.get_running_loop()
+    parent = multiprocessing.parent_process()
+    invalid = 0
+    while True:
+        data = await loop.run_in_executor(None, _get, update_queue)
+        if data is None:
+            break
+        if data is _EMPTY:
+            if parent is not None and not parent.is_alive():
+                logger.error("پردازه دریافت‌کننده آپدیت‌ها متوقف شده است")
+                break
+            continue
+        try:
+            update = _parse_update(data, application.bot)
+        except ValueError:
+            invalid += 1
+            continue
+        await application.update_queue.put(update)
+    if invalid:
+        logger.warning(f"{invalid} آپدیت نامعتبر کنار گذاشته شد")
+    return invalid
+
+def run_queue_worker(application, update_queue):
+    """پردازه کارگر: دریافت آپدیت‌های خام از صف پردازه دریافت‌کننده تا رسیدن None"""
+    # توقف کارگرها فقط با None پردازه دریافت‌کننده است (SIGINT ترمینال به همه پردازه‌ها می‌رسد)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    asyncio.run(_run_application(application, lambda app: _feed_from_queue(app, update_queue)))
+
+def _start_worker(context, worker_target, index, update_queue):
+    process = context.Process(target=worker_target, args=(update_queue,), name=f"bot-worker-{index}")
+    process.start()
+    return process
+
+async def _watch_workers(context, worker_target, queues, processes, stop, interval=1.0):
+    """راه‌اندازی مجدد کارگرهای متوقف شده تا صف آنها پر نشود و کاربرانشان پاسخ 503 نگیرند"""
+    while not stop.is_set():
+        for i, process in enumerate(processes):
+            if not process.is_alive():
+                logger.error(f"پردازه {process.name} با کد {process.exitcode} متوقف شد؛ راه‌اندازی مجدد")
+                processes[i] = _start_worker(context, worker_target, i, queues[i])
+        try:
+            await asyncio.wait_for(stop.wait(), interval)
+        except asyncio.TimeoutError:
+            pass
+
+async def _serve_ingress(context, worker_target, queues, processes):
+    stop = _stop_event()
+
+    def dispatch(data):
+        # آپدیت‌های هر کاربر به یک کارگر می‌روند تا ترتیب پیام‌ها و حذف تکراری‌ها حفظ شود
+        try:
+            queues[update_owner(data) % len(queues)].put_nowait(data)
+        except queue.Full:
+            return False
+        return True
+
+    server = WebhookServer(dispatch)
+    await server.start()
+    async with Bot(config.TELEGRAM_BOT_TOKEN) as bot:
+        await set_webhook(bot)
+    try:
+        await _watch_workers(context, worker_target, queues, processes, stop)
+    finally:
+        await server.stop()
+
+def _stop_workers(queues, processes, timeout=None):
+    """ارسال None به صف هر کارگر و انتظار تا پایان پردازش آپدیت‌های باقی‌مانده (حداکثر timeout ثانیه)"""
+    timeout = config.WEBHOOK_WORKER_STOP_TIMEOUT if timeout is None else timeout
+    deadline = time.monotonic() + timeout
+    # سرور متوقف شده و آپدیت جدیدی وارد صف‌ها نمی‌شود؛ None پس از آخرین آپدیت هر صف قرار می‌گیرد
+    for update_queue, process in zip(queues, processes):
+        while process.is_alive() and time.monotonic() < deadline:
+            try:
+                update_queue.put(None, timeout=1)
+                break
+            except queue.Full:
+                continue
+    for process in processes:
+        process.join(max(0, deadline - time.monotonic()))
+        if process.is_alive():
+            logger.error(f"پردازه {process.name} پس از {timeout} ثانیه متوقف نشد؛ پایان اجباری")
+            # کارگرها SIGTERM را نادیده می‌گیرند، پس terminate اثری ندارد
+            process.kill()
+            process.join()
+
+def run_webhook_ingress(worker_target, workers=None):
+    """حالت webhook چند پردازه‌ای: این پردازه فقط آپدیت‌ها را دریافت و بین پردازه‌های کارگر پخش می‌کند؛
+    worker_target(update_queue) در هر پردازه کارگر اجرا می‌شود"""
+    workers = workers or config.WEBHOOK_WORKERS
+    context = multiprocessing.get_context("spawn")
+    queues = [context.Queue(config.WEBHOOK_QUEUE_SIZE) for _ in range(workers)]
+    processes = [_start_worker(context, worker_target, i, update_queue) for i, update_queue in enumerate(queues)]
+    logger.info(f"{workers} پردازه کارگر بات شروع شد")
+    try:
+        asyncio.run(_serve_ingress(context, worker_target, queues, processes))
+    finally:
+        _stop_workers(queues, processes)
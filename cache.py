@@ -0,0 +1,115 @@
+import threading
+import time
+from collections import OrderedDict
+
+class LRUCache:
+    """کش LRU با محدودیت تعداد، حجم تقریبی (بایت) و زمان انقضا (TTL)"""
+
+    def __init__(self, max_entries=1024, ttl=None, max_bytes=None, sizeof=None, on_evict=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        # تابع تخمین حجم هر مقدار (فقط در صورت تعیین max_bytes استفاده می‌شود)
+        self._sizeof = sizeof
+        # فراخوانی هنگام حذف خودکار یک مورد (LRU یا انقضا): on_evict(key, value)
+        self._on_evict = on_evict
+        # key -> [value, expires_at, size]
+        self._data = OrderedDict()
+        self._lock = threading.RLock()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING, count=False) is not _MISSING
+
+    def get(self, key, default=None, count=True):
+        """دریافت مقدار و انتقال آن به انتهای صف LRU"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[1] is not None and entry[1] <= time.monotonic():
+                self._remove(key, evicted=True)
+                entry = None
+            if entry is None:
+                if count:
+                    self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            if count:
+                self.hits += 1
+            return entry[0]
+
+    def set(self, key, value, ttl=None):
+        """افزودن یا جایگزینی یک مقدار"""
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl else None
+        size = self._sizeof(value) if self._sizeof is not None else 0
+        with self._lock:
+            if key in self._data:
+                self.current_bytes -= self._data[key][2]
+            self._data[key] = [value, expires_at, size]
+            self._data.move_to_end(key)
+            self.current_bytes += size
+            self._shrink()
+
+    def resize(self, key):
+        """محاسبه دوباره حجم یک مقدار پس از تغییر درجای آن"""
+        if self._sizeof is None:
+            return
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return
+            size = self._sizeof(entry[0])
+            self.current_bytes += size - entry[2]
+            entry[2] = size
+            self._shrink()
+
+    def pop(self, key, default=None):
+        """حذف صریح یک مقدار (بدون فراخوانی on_evict)"""
+        with self._lock:
+            if key not in self._data:
+                return default
+            value = self._data[key][0]
+            self._remove(key)
+            return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.current_bytes = 0
+
+    def stats(self):
+        """شمارنده‌های کش"""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._data),
+            "bytes": self.current_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def _remove(self, key, evicted=False):
+        value, _, size = self._data.pop(key)
+        self.current_bytes -= size
+        if evicted:
+            self.evictions += 1
+            if self._on_evict is not None:
+                self._on_evict(key, value)
+
+    def _shrink(self):
+        # حذف قدیمی‌ترین موارد تا رسیدن به محدودیت تعداد و حجم
+        while self._data and (
+            len(self._data) > self.max_entries
+            or (self.max_bytes is not None and self.current_bytes > self.max_bytes)
+        ):
+            oldest = next(iter(self._data))
+            self._remove(oldest, evicted=True)
+
+_MISSING = object()
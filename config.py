@@ -6,19 +6,134 @@ load_dotenv()
 
 # تنظیمات بات تلگرام
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
+# نحوه دریافت آپدیت‌ها: polling یا webhook
+BOT_MODE = os.getenv("BOT_MODE", "polling").lower()
+
+# تنظیمات حالت webhook
+# آدرس عمومی (https) که تلگرام آپدیت‌ها را به آن ارسال می‌کند، شامل مسیر WEBHOOK_PATH
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram")
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8443"))
+# مقدار هدر X-Telegram-Bot-Api-Secret-Token که تلگرام همراه هر درخواست ارسال می‌کند
+WEBHOOK_SECRET_TOKEN = os.getenv("WEBHOOK_SECRET_TOKEN")
+# حداکثر آپدیت‌های منتظر در صف داخلی (هر پردازه کارگر)؛ در صورت پر بودن پاسخ 503 داده می‌شود تا تلگرام دوباره ارسال کند
+WEBHOOK_QUEUE_SIZE = int(os.getenv("WEBHOOK_QUEUE_SIZE", "10000"))
+# تعداد پردازه‌های کارگر؛ آپدیت‌های هر کاربر همیشه به یک کارگر ارسال می‌شوند
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "1"))
+# حداکثر انتظار (ثانیه) برای پردازش آپدیت‌های باقی‌مانده هر کارگر هنگام توقف، پیش از پایان اجباری آن
+WEBHOOK_WORKER_STOP_TIMEOUT = float(os.getenv("WEBHOOK_WORKER_STOP_TIMEOUT", "30"))
+# حداکثر اتصال همزمان تلگرام به webhook
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))
 
 # تنظیمات MongoDB
 MONGODB_URI = os.getenv("MONGODB_URI", "mongodb://localhost:27017/edubot")
 DB_NAME = os.getenv("DB_NAME", "edubot")
 
+# تنظیمات Connection Pool و زمان‌های انتظار MongoDB
+MONGODB_MAX_POOL_SIZE = int(os.getenv("MONGODB_MAX_POOL_SIZE", "50"))
+MONGODB_MIN_POOL_SIZE = int(os.getenv("MONGODB_MIN_POOL_SIZE", "0"))
+MONGODB_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGODB_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+MONGODB_CONNECT_TIMEOUT_MS = int(os.getenv("MONGODB_CONNECT_TIMEOUT_MS", "5000"))
+MONGODB_SOCKET_TIMEOUT_MS = int(os.getenv("MONGODB_SOCKET_TIMEOUT_MS", "10000"))
+# فاصله زمانی (ثانیه) بررسی سلامت اتصال در پس‌زمینه
+MONGODB_HEALTH_CHECK_INTERVAL = float(os.getenv("MONGODB_HEALTH_CHECK_INTERVAL", "30"))
+# تعداد thread های اجرای کوئری‌های pymongo خارج از event loop
+MONGODB_EXECUTOR_WORKERS = int(os.getenv("MONGODB_EXECUTOR_WORKERS", "16"))
+# ایجاد ایندکس‌ها و بررسی query plan کوئری‌های پرتکرار هنگام راه‌اندازی
+MONGODB_ENSURE_INDEXES = os.getenv("MONGODB_ENSURE_INDEXES", "true").lower() == "true"
+MONGODB_VERIFY_QUERY_PLANS = os.getenv("MONGODB_VERIFY_QUERY_PLANS", "true").lower() == "true"
+
+# تنظیمات کش پروفایل کاربران
+PROFILE_CACHE_MAX_ENTRIES = int(os.getenv("PROFILE_CACHE_MAX_ENTRIES", "10000"))
+PROFILE_CACHE_TTL = float(os.getenv("PROFILE_CACHE_TTL", "300"))
+# باطل‌سازی کش بین چند نمونه بات با change stream (نیازمند replica set)
+PROFILE_CACHE_CHANGE_STREAM = os.getenv("PROFILE_CACHE_CHANGE_STREAM", "false").lower() == "true"
+
+# نوشتن گروهی تاریخچه چت: اندازه هر دسته insert_many، فاصله زمانی (ثانیه) و حداکثر پیام‌های منتظر
+HISTORY_BATCH_SIZE = int(os.getenv("HISTORY_BATCH_SIZE", "100"))
+HISTORY_FLUSH_INTERVAL = float(os.getenv("HISTORY_FLUSH_INTERVAL", "1"))
+HISTORY_MAX_PENDING = int(os.getenv("HISTORY_MAX_PENDING", "10000"))
+
 # تنظیمات LLM (مدل زبانی)
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 MODEL_NAME = os.getenv("MODEL_NAME", "gpt-4o-mini")
+# مدل کوچک‌تر و سریع‌تر برای استخراج اطلاعات و پاسخ به پیام‌های کوتاه
+SMALL_MODEL_NAME = os.getenv("SMALL_MODEL_NAME", "gpt-4.1-nano")
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
+
+# مدل هر نود/کاربرد: نام مدل، temperature، حداکثر توکن خروجی و timeout (ثانیه)
+MODEL_REGISTRY = {
+    # برنامه‌ها و تحلیل‌های طولانی نباید ناقص بمانند؛ بدون سقف توکن خروجی
+    "study_plan": {"model": MODEL_NAME, "temperature": 0.7, "timeout": 60},
+    "performance_analysis": {"model": MODEL_NAME, "temperature": 0.7, "timeout": 60},
+    "general_chat": {"model": MODEL_NAME, "temperature": 0.7, "timeout": 30},
+    # پیام‌های کوتاه (کمتر از 10 کلمه) پاسخ کوتاه می‌گیرند
+    "general_chat_short": {"model": SMALL_MODEL_NAME, "temperature": 0.7, "max_tokens": 150, "timeout": 20},
+    # max_tokens بر اساس اندازه دسته استخراج تعیین می‌شود (پایین‌تر، کنار EXTRACTION_BATCH_SIZE)
+    "extraction": {"model": SMALL_MODEL_NAME, "temperature": 0.3, "timeout": 60},
+}
+
+# پایداری فراخوانی‌های مدل: تلاش مجدد با تأخیر تصادفی (jitter) در محدوده timeout هر فراخوانی
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_RETRY_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", "0.5"))
+LLM_RETRY_MAX_DELAY = float(os.getenv("LLM_RETRY_MAX_DELAY", "4"))
+# درخواست موازی دوم (hedge) اگر پاسخ اول از صدک تأخیر اخیر (پیش‌فرض p95) طولانی‌تر شود
+LLM_HEDGING_ENABLED = os.getenv("LLM_HEDGING_ENABLED", "false").lower() == "true"
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "0.95"))
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+# قطع موقت فراخوانی‌ها (circuit breaker) پس از چند خطای پشت سر هم
+LLM_BREAKER_FAILURE_THRESHOLD = int(os.getenv("LLM_BREAKER_FAILURE_THRESHOLD", "5"))
+LLM_BREAKER_RESET_TIMEOUT = float(os.getenv("LLM_BREAKER_RESET_TIMEOUT", "30"))
+# پاسخ جایگزین وقتی مدل در دسترس نیست
+LLM_DEGRADED_REPLY = "⚠️ در حال حاضر امکان پاسخ‌گویی کامل وجود ندارد. لطفاً چند دقیقه دیگر دوباره تلاش کنید."
+
+# کش پاسخ‌های برنامه مطالعاتی و تحلیل عملکرد
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() == "true"
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1000"))
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "86400"))
+# حداقل شباهت کسینوسی پیام برای استفاده از پاسخ مشابه (0 = فقط تطابق دقیق)
+RESPONSE_CACHE_SIMILARITY_THRESHOLD = float(os.getenv("RESPONSE_CACHE_SIMILARITY_THRESHOLD", "0"))
+
+# حداکثر تعداد آپدیت‌هایی که همزمان پردازش می‌شوند (پیام‌های هر کاربر همیشه به ترتیب پردازش می‌شوند)
+MAX_CONCURRENT_UPDATES = int(os.getenv("MAX_CONCURRENT_UPDATES", "64"))
+# تعداد update_id های اخیر که برای رد آپدیت‌های تکراری (ارسال مجدد تلگرام) نگهداری می‌شوند
+UPDATE_DEDUP_WINDOW = int(os.getenv("UPDATE_DEDUP_WINDOW", "10000"))
+
+# اشتراک پاسخ درخواست‌های یکسان یک کاربر (کلید: کاربر، نوع درخواست، پیام یکسان‌سازی شده)
+SINGLE_FLIGHT_ENABLED = os.getenv("SINGLE_FLIGHT_ENABLED", "true").lower() == "true"
+# مدت نگهداری پاسخ تکمیل شده برای درخواست تکراری بعدی (ثانیه)؛ پیام‌های هر کاربر به ترتیب پردازش
+# می‌شوند، پس درخواست تکراری (مثلاً دو بار زدن دکمه) معمولاً پس از پایان درخواست اول می‌رسد
+SINGLE_FLIGHT_RETAIN_SECONDS = float(os.getenv("SINGLE_FLIGHT_RETAIN_SECONDS", "10"))
+# نوع درخواست‌هایی که پاسخشان نگهداری می‌شود؛ در گفتگوی عمومی تکرار پیام کوتاه ("باشه"، "بعدی؟") عمدی است
+# و باید پاسخ تازه بگیرد و در حافظه ثبت شود
+SINGLE_FLIGHT_RETAIN_TYPES = [
+    t.strip() for t in os.getenv("SINGLE_FLIGHT_RETAIN_TYPES", "study_plan,performance_analysis").split(",") if t.strip()
+]
+
+# تشخیص محلی نوع پیام‌های آزاد (برنامه مطالعاتی / تحلیل عملکرد) در router_node
+INTENT_ROUTER_ENABLED = os.getenv("INTENT_ROUTER_ENABLED", "true").lower() == "true"
+
+# ارسال تدریجی پاسخ مدل با ویرایش پیام در تلگرام
+STREAMING_ENABLED = os.getenv("STREAMING_ENABLED", "true").lower() == "true"
+# حداقل فاصله (ثانیه) بین دو ویرایش پیام (محدودیت نرخ ویرایش تلگرام)
+STREAM_EDIT_INTERVAL = float(os.getenv("STREAM_EDIT_INTERVAL", "1.0"))
+STREAM_PLACEHOLDER = "⏳ در حال آماده‌سازی پاسخ..."
+
+# اجرای ابزارهای درخواست شده توسط مدل (مثل جستجوی وب) در نود tools
+TOOLS_ENABLED = os.getenv("TOOLS_ENABLED", "true").lower() == "true"
+# حداکثر تعداد دورهای فراخوانی ابزار در هر درخواست (پس از آن مدل باید پاسخ نهایی بدهد)
+MAX_TOOL_ROUNDS = int(os.getenv("MAX_TOOL_ROUNDS", "3"))
+TOOL_TIMEOUT = float(os.getenv("TOOL_TIMEOUT", "15"))
+# کش نتایج ابزارها بر اساس نام ابزار و ورودی
+TOOL_CACHE_MAX_ENTRIES = int(os.getenv("TOOL_CACHE_MAX_ENTRIES", "1000"))
+TOOL_CACHE_TTL = float(os.getenv("TOOL_CACHE_TTL", "600"))
 
 # پیام‌های پیش‌فرض بات
 DEFAULT_MESSAGES = {
     "welcome": "👋 سلام! من مشاور تحصیلی هوشمند شما هستم. چطور می‌تونم کمکتون کنم؟",
     "profile_incomplete": "برای ارائه مشاوره بهتر، لطفاً اطلاعات پروفایل خود را تکمیل کنید 📝",
+    "empty_reply": "متأسفانه پاسخی دریافت نشد. لطفاً دوباره تلاش کنید.",
     "help": """
 🧠 راهنمای بات مشاور تحصیلی:
 
@@ -33,4 +148,62 @@ DEFAULT_MESSAGES = {
 # حداکثر تعداد پیام‌های ذخیره شده در حافظه کوتاه مدت
 MAX_SHORT_TERM_MEMORY = 10
 
+# تنظیمات کش حافظه کاربران (LRU/TTL جلوی کالکشن memories در MongoDB)
+MEMORY_CACHE_MAX_ENTRIES = int(os.getenv("MEMORY_CACHE_MAX_ENTRIES", "10000"))
+MEMORY_CACHE_MAX_BYTES = int(os.getenv("MEMORY_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+MEMORY_CACHE_TTL = float(os.getenv("MEMORY_CACHE_TTL", "3600"))
+# فاصله زمانی (ثانیه) نوشتن تغییرات حافظه در پایگاه داده (write-behind)
+MEMORY_FLUSH_INTERVAL = float(os.getenv("MEMORY_FLUSH_INTERVAL", "5"))
+# بارگذاری گروهی حافظه کاربرانی که در این بازه (دقیقه) پیش از راه‌اندازی فعال بوده‌اند (0 = غیرفعال)
+MEMORY_WARMUP_WINDOW_MINUTES = int(os.getenv("MEMORY_WARMUP_WINDOW_MINUTES", "30"))
+MEMORY_WARMUP_MAX_USERS = int(os.getenv("MEMORY_WARMUP_MAX_USERS", "5000"))
+
+# بودجه توکن متن حافظه در پرامپت (مکالمات اخیر و اطلاعات کلیدی)
+MEMORY_CONTEXT_TOKEN_BUDGET = int(os.getenv("MEMORY_CONTEXT_TOKEN_BUDGET", "600"))
+# سهم رزرو شده از بودجه برای اطلاعات کلیدی حافظه بلند مدت
+MEMORY_CONTEXT_FACT_SHARE = float(os.getenv("MEMORY_CONTEXT_FACT_SHARE", "0.3"))
+# حداکثر توکن هر پیام مکالمه در متن حافظه
+MEMORY_CONTEXT_MAX_MESSAGE_TOKENS = int(os.getenv("MEMORY_CONTEXT_MAX_MESSAGE_TOKENS", "120"))
+
+# فشرده‌سازی دوره‌ای حافظه بلند مدت در برگه اطلاعات هر کاربر (fact_sheet)
+MEMORY_COMPACTION_INTERVAL = float(os.getenv("MEMORY_COMPACTION_INTERVAL", "300"))
+# حداقل تعداد موارد حافظه بلند مدت برای فشرده‌سازی و تعداد موارد اخیر که بدون ادغام می‌مانند
+MEMORY_COMPACTION_MIN_ENTRIES = int(os.getenv("MEMORY_COMPACTION_MIN_ENTRIES", "5"))
+MEMORY_COMPACTION_KEEP_RECENT = int(os.getenv("MEMORY_COMPACTION_KEEP_RECENT", "2"))
+# حداکثر تعداد اعضای فهرست‌ها (مثل subjects) در برگه اطلاعات
+FACT_SHEET_MAX_ITEMS = int(os.getenv("FACT_SHEET_MAX_ITEMS", "20"))
+
+# تنظیمات ایندکس برداری اطلاعات کلیدی هر کاربر (بازیابی معنایی از حافظه بلند مدت)
+FACT_INDEX_ENABLED = os.getenv("FACT_INDEX_ENABLED", "true").lower() == "true"
+FACT_INDEX_DIR = os.getenv("FACT_INDEX_DIR", "data/fact_index")
+# حداکثر تعداد اطلاعات کلیدی هر کاربر (قدیمی‌ترین موارد حذف می‌شوند)
+FACT_INDEX_CAPACITY = int(os.getenv("FACT_INDEX_CAPACITY", "10000"))
+# ابعاد بردار embedding (مدل‌های text-embedding-3 کاهش ابعاد را پشتیبانی می‌کنند)
+FACT_EMBEDDING_DIMENSIONS = int(os.getenv("FACT_EMBEDDING_DIMENSIONS", "256"))
+FACT_INDEX_CACHE_MAX_ENTRIES = int(os.getenv("FACT_INDEX_CACHE_MAX_ENTRIES", "1000"))
+FACT_INDEX_CACHE_MAX_BYTES = int(os.getenv("FACT_INDEX_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+FACT_INDEX_FLUSH_INTERVAL = float(os.getenv("FACT_INDEX_FLUSH_INTERVAL", "30"))
+# تعداد و حداقل شباهت اطلاعات بازیابی شده برای هر پیام
+FACT_RETRIEVAL_TOP_K = int(os.getenv("FACT_RETRIEVAL_TOP_K", "5"))
+FACT_RETRIEVAL_MIN_SCORE = float(os.getenv("FACT_RETRIEVAL_MIN_SCORE", "0.3"))
+# سقف زمان بازیابی اطلاعات در مسیر پاسخ (ثانیه)؛ پس از آن پاسخ بدون اطلاعات بازیابی شده ادامه می‌یابد
+FACT_RETRIEVAL_TIMEOUT = float(os.getenv("FACT_RETRIEVAL_TIMEOUT", "0.5"))
+# مهلت و تعداد تلاش مجدد هر درخواست embedding
+FACT_EMBEDDING_TIMEOUT = float(os.getenv("FACT_EMBEDDING_TIMEOUT", "10"))
+FACT_EMBEDDING_MAX_RETRIES = int(os.getenv("FACT_EMBEDDING_MAX_RETRIES", "1"))
+
+# تنظیمات صف پس‌زمینه استخراج اطلاعات کلیدی برای حافظه بلند مدت
+EXTRACTION_QUEUE_SIZE = int(os.getenv("EXTRACTION_QUEUE_SIZE", "1000"))
+EXTRACTION_WORKERS = int(os.getenv("EXTRACTION_WORKERS", "4"))
+# رفتار در صورت پر بودن صف: "drop_oldest" (حذف قدیمی‌ترین) یا "drop_new" (رد درخواست جدید)
+EXTRACTION_OVERFLOW_POLICY = os.getenv("EXTRACTION_OVERFLOW_POLICY", "drop_oldest")
+# ادغام درخواست‌های منتظر یک کاربر در یک استخراج
+EXTRACTION_COALESCE = os.getenv("EXTRACTION_COALESCE", "true").lower() == "true"
+# micro-batching: حداکثر تعداد درخواست در هر دسته و مدت انتظار (ثانیه) برای پر شدن دسته
+EXTRACTION_BATCH_SIZE = int(os.getenv("EXTRACTION_BATCH_SIZE", "16"))
+# سقف توکن خروجی هر مورد دسته؛ سقف کل پاسخ استخراج متناسب با اندازه دسته است تا آرایه JSON ناقص نماند
+EXTRACTION_MAX_TOKENS_PER_ITEM = int(os.getenv("EXTRACTION_MAX_TOKENS_PER_ITEM", "400"))
+MODEL_REGISTRY["extraction"]["max_tokens"] = EXTRACTION_MAX_TOKENS_PER_ITEM * max(1, EXTRACTION_BATCH_SIZE)
+EXTRACTION_BATCH_WINDOW = float(os.getenv("EXTRACTION_BATCH_WINDOW", "0.05"))
+
 event_based = False
\ No newline at end of file
@@ -1,31 +1,130 @@
 import pymongo
 from pymongo.errors import ConnectionFailure
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import functools
 import logging
+import threading
 import config
 
 logger = logging.getLogger(__name__)
 
+# کلاینت مشترک MongoDB برای کل پردازه (خود کلاینت یک Connection Pool دارد)
+_client = None
+_client_lock = threading.Lock()
+
+# وضعیت بررسی سلامت اتصال در پس‌زمینه
+_healthy = False
+_health_thread = None
+_health_stop = threading.Event()
+
+# thread pool محدود برای اجرای کوئری‌های blocking بدون متوقف کردن event loop
+_executor = None
+
 def connect_to_mongodb():
-    """اتصال به پایگاه داده MongoDB"""
-    try:
-        client = pymongo.MongoClient(config.MONGODB_URI)
-        # تست اتصال
-        client.admin.command('ping')
-        logger.info("اتصال به MongoDB با موفقیت برقرار شد")
-        return client
-    except ConnectionFailure as e:
-        logger.error(f"اتصال به MongoDB ناموفق بود: {e}")
-        return None
-    except Exception as e:
-        logger.error(f"خطای پیش‌بینی نشده در اتصال به MongoDB: {e}")
-        return None
+    """اتصال به پایگاه داده MongoDB (کلاینت فقط یک بار ساخته می‌شود)"""
+    global _client, _healthy
+    with _client_lock:
+        if _client is not None:
+            return _client
+        try:
+            client = pymongo.MongoClient(
+                config.MONGODB_URI,
+                maxPoolSize=config.MONGODB_MAX_POOL_SIZE,
+                minPoolSize=config.MONGODB_MIN_POOL_SIZE,
+                serverSelectionTimeoutMS=config.MONGODB_SERVER_SELECTION_TIMEOUT_MS,
+                connectTimeoutMS=config.MONGODB_CONNECT_TIMEOUT_MS,
+                socketTimeoutMS=config.MONGODB_SOCKET_TIMEOUT_MS,
+            )
+            # تست اتصال
+            client.admin.command('ping')
+            logger.info("اتصال به MongoDB با موفقیت برقرار شد")
+            _client = client
+            _healthy = True
+            return client
+        except ConnectionFailure as e:
+            logger.error(f"اتصال به MongoDB ناموفق بود: {e}")
+            return None
+        except Exception as e:
+            logger.error(f"خطای پیش‌بینی نشده در اتصال به MongoDB: {e}")
+            return None
+
+def get_client():
+    """دریافت کلاینت مشترک MongoDB (در صورت نبود، اتصال برقرار می‌شود)"""
+    if _client is not None:
+        return _client
+    return connect_to_mongodb()
 
 def get_db():
     """دریافت اشاره‌گر پایگاه داده"""
-    client = connect_to_mongodb()
+    client = get_client()
     if client:
-        db = client[config.DB_NAME]
-        logger.debug(f"پایگاه داده {config.DB_NAME} با موفقیت دریافت شد")
-        return db
+        return client[config.DB_NAME]
     logger.error("امکان دریافت پایگاه داده وجود ندارد (اتصال برقرار نیست)")
-    return None
\ No newline at end of file
+    return None
+
+def _get_executor():
+    """دریافت (یا ساخت) thread pool اختصاصی کوئری‌های پایگاه داده"""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=config.MONGODB_EXECUTOR_WORKERS,
+            thread_name_prefix="mongodb",
+        )
+    return _executor
+
+async def run_in_db_executor(func, *args, **kwargs):
+    """اجرای یک فراخوانی blocking پایگاه داده در thread pool و انتظار async برای نتیجه"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        _get_executor(), functools.partial(func, *args, **kwargs)
+    )
+
+def is_healthy():
+    """نتیجه آخرین بررسی سلامت اتصال به MongoDB"""
+    return _client is not None and _healthy
+
+def _health_check_loop():
+    """بررسی دوره‌ای سلامت اتصال با دستور ping"""
+    global _healthy
+    while not _health_stop.wait(config.MONGODB_HEALTH_CHECK_INTERVAL):
+        client = _client
+        if client is None:
+            continue
+        try:
+            client.admin.command('ping')
+            if not _healthy:
+                logger.info("اتصال به MongoDB دوباره برقرار شد")
+            _healthy = True
+        except Exception as e:
+            if _healthy:
+                logger.warning(f"بررسی سلامت MongoDB ناموفق بود: {e}")
+            _healthy = False
+
+def start_health_check():
+    """شروع بررسی سلامت اتصال در یک thread پس‌زمینه"""
+    global _health_thread
+    if _health_thread is not None and _health_thread.is_alive():
+        return
+    _health_stop.clear()
+    _health_thread = threading.Thread(
+        target=_health_check_loop, name="mongodb-health-check", daemon=True
+    )
+    _health_thread.start()
+
+def close_mongodb():
+    """توقف بررسی سلامت، thread pool و بستن کلاینت مشترک MongoDB"""
+    global _client, _healthy, _health_thread, _executor
+    _health_stop.set()
+    if _health_thread is not None:
+        _health_thread.join(timeout=5)
+        _health_thread = None
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+        _executor = None
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+            _client = None
+            _healthy = False
+            logger.info("اتصال به MongoDB بسته شد")
@@ -0,0 +1,119 @@
+import asyncio
+import logging
+import time
+from collections import deque
+import config
+from db.connection import get_db, run_in_db_executor
+
+logger = logging.getLogger(__name__)
+
+class ChatHistoryWriter:
+    """بافر محدود پیام‌های چت که به صورت گروهی با insert_many در پایگاه داده نوشته می‌شوند"""
+
+    def __init__(self, batch_size=None, flush_interval=None, max_pending=None):
+        self.batch_size = batch_size or config.HISTORY_BATCH_SIZE
+        self.flush_interval = flush_interval or config.HISTORY_FLUSH_INTERVAL
+        self.max_pending = max_pending or config.HISTORY_MAX_PENDING
+        # با پر شدن بافر، append قدیمی‌ترین پیام را در O(1) کنار می‌گذارد
+        self._buffer = deque(maxlen=self.max_pending)
+        # تأخیر نوشتن دسته‌های اخیر (برای p99)
+        self._latencies = deque(maxlen=1000)
+        self._wakeup = None
+        self._task = None
+        self._flush_lock = None
+        self._started_at = None
+        self.metrics = {
+            "inserted": 0,
+            "batches": 0,
+            "dropped": 0,
+            "failed": 0,
+        }
+
+    @property
+    def running(self):
+        return self._task is not None
+
+    async def start(self):
+        """شروع نوشتن دوره‌ای در پس‌زمینه (داخل event loop بات)"""
+        if self.running:
+            return
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._started_at = time.monotonic()
+        self._task = asyncio.create_task(self._run(), name="chat-history-writer")
+
+    async def stop(self):
+        """توقف نوشتن دوره‌ای و نوشتن پیام‌های باقی‌مانده"""
+        if not self.running:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        while self._buffer:
+            if not await self.flush():
+                break
+        logger.info(f"نویسنده تاریخچه چت متوقف شد: {self.stats()}")
+
+    def add(self, document):
+        """افزودن یک پیام به بافر بدون انتظار؛ اگر نویسنده فعال نباشد False برمی‌گرداند"""
+        if not self.running:
+            return False
+        if len(self._buffer) >= self.max_pending:
+            # محدود نگه داشتن حافظه: قدیمی‌ترین پیام کنار گذاشته می‌شود
+            self.metrics["dropped"] += 1
+        self._buffer.append(document)
+        if len(self._buffer) >= self.batch_size:
+            self._wakeup.set()
+        return True
+
+    async def flush(self):
+        """نوشتن یک دسته از پیام‌های بافر؛ در صورت موفقیت True برمی‌گرداند"""
+        async with self._flush_lock:
+            if not self._buffer:
+                return True
+            batch = [self._buffer.popleft() for _ in range(min(self.batch_size, len(self._buffer)))]
+            db = get_db()
+            started = time.perf_counter()
+            try:
+                if db is None:
+                    raise ConnectionError("اتصال به پایگاه داده برقرار نیست")
+                await run_in_db_executor(db.chat_history.insert_many, batch, ordered=False)
+            except Exception as e:
+                logger.error(f"خطا در ذخیره گروهی تاریخچه چت: {e}")
+                self.metrics["failed"] += 1
+                # بازگرداندن دسته به ابتدای بافر تا سقف مجاز
+                room = max(self.max_pending - len(self._buffer), 0)
+                self.metrics["dropped"] += len(batch) - min(room, len(batch))
+                self._buffer.extendleft(reversed(batch[:room]))
+                return False
+            self._latencies.append(time.perf_counter() - started)
+            self.metrics["inserted"] += len(batch)
+            self.metrics["batches"] += 1
+            logger.debug(f"{len(batch)} پیام در تاریخچه چت ذخیره شد")
+            return True
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            while self._buffer:
+                # لغو این task هنگام توقف نباید دسته در حال نوشتن را از دست بدهد؛
+                # stop پیش از نوشتن باقی‌مانده‌ها منتظر همین flush (flush_lock) می‌ماند
+                if not await asyncio.shield(self.flush()):
+                    break
+
+    def stats(self):
+        """شمارنده‌های نویسنده تاریخچه چت"""
+        stats = dict(self.metrics)
+        stats["pending"] = len(self._buffer)
+        elapsed = time.monotonic() - self._started_at if self._started_at else 0.0
+        stats["inserts_per_second"] = stats["inserted"] / elapsed if elapsed else 0.0
+        latencies = sorted(self._latencies)
+        stats["p99_batch_latency"] = latencies[min(len(latencies) - 1, int(0.99 * len(latencies)))] if latencies else 0.0
+        return stats
+
+# نمونه مشترک (در main هنگام راه‌اندازی بات شروع می‌شود)
+history_writer = ChatHistoryWriter()
@@ -0,0 +1,74 @@
+import logging
+import pymongo
+from pymongo import IndexModel
+from db.connection import get_db
+
+logger = logging.getLogger(__name__)
+
+# ایندکس‌های مورد نیاز هر کالکشن
+INDEXES = {
+    "users": [
+        IndexModel([("user_id", pymongo.ASCENDING)], unique=True, name="user_id_unique"),
+    ],
+    "chat_history": [
+        IndexModel([("user_id", pymongo.ASCENDING), ("timestamp", pymongo.DESCENDING)], name="user_id_timestamp"),
+        # برای پیدا کردن کاربران فعال اخیر هنگام راه‌اندازی
+        IndexModel([("timestamp", pymongo.DESCENDING)], name="timestamp"),
+    ],
+    "exam_results": [
+        IndexModel([("user_id", pymongo.ASCENDING), ("timestamp", pymongo.DESCENDING)], name="user_id_timestamp"),
+    ],
+}
+
+# کوئری‌های پرتکرار که باید حتماً از ایندکس استفاده کنند: (کالکشن، فیلتر، مرتب‌سازی، limit)
+HOT_QUERIES = [
+    ("users", {"user_id": 0}, None, 1),
+    ("chat_history", {"user_id": 0}, [("timestamp", pymongo.DESCENDING)], 10),
+    ("exam_results", {"user_id": 0}, [("timestamp", pymongo.DESCENDING)], 5),
+]
+
+class QueryPlanError(RuntimeError):
+    """یکی از کوئری‌های پرتکرار از ایندکس استفاده نمی‌کند"""
+
+def ensure_indexes(db=None):
+    """ایجاد ایندکس‌های مورد نیاز (در صورت وجود، تغییری ایجاد نمی‌شود)"""
+    db = db if db is not None else get_db()
+    if db is None:
+        raise ConnectionError("اتصال به پایگاه داده برقرار نیست")
+    for collection_name, indexes in INDEXES.items():
+        names = db[collection_name].create_indexes(indexes)
+        logger.info(f"ایندکس‌های کالکشن {collection_name}: {', '.join(names)}")
+
+def _plan_stages(plan):
+    """استخراج نام همه مراحل یک query plan (به صورت بازگشتی)"""
+    stages = []
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            stages.append(plan["stage"])
+        for value in plan.values():
+            stages.extend(_plan_stages(value))
+    elif isinstance(plan, list):
+        for item in plan:
+            stages.extend(_plan_stages(item))
+    return stages
+
+def verify_query_plans(db=None):
+    """بررسی explain کوئری‌های پرتکرار؛ در صورت اسکن کامل کالکشن QueryPlanError می‌دهد"""
+    db = db if db is not None else get_db()
+    if db is None:
+        raise ConnectionError("اتصال به پایگاه داده برقرار نیست")
+
+    failures = []
+    for collection_name, query, sort, limit in HOT_QUERIES:
+        cursor = db[collection_name].find(query).limit(limit)
+        if sort:
+            cursor = cursor.sort(sort)
+        explain = cursor.explain()
+        stages = _plan_stages(explain.get("queryPlanner", {}).get("winningPlan", {}))
+        uses_index = any("IXSCAN" in stage for stage in stages)
+        if "COLLSCAN" in stages or "SORT" in stages or not uses_index:
+            failures.append(f"{collection_name} {query} sort={sort}: {' -> '.join(stages)}")
+
+    if failures:
+        raise QueryPlanError("کوئری‌های زیر از ایندکس استفاده نمی‌کنند:\n" + "\n".join(failures))
+    logger.info("همه کوئری‌های پرتکرار از ایندکس استفاده می‌کنند")
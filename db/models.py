@@ -1,18 +1,27 @@
-from db.connection import get_db
+from db.connection import get_db, run_in_db_executor
+from db.profile_cache import get_cached_profile, cache_profile, invalidate_profile
+from db.history_writer import history_writer
 import logging
 import datetime
 
 logger = logging.getLogger(__name__)
 
+# همه کوئری‌های pymongo از طریق run_in_db_executor اجرا می‌شوند تا event loop بات متوقف نشود
+
 async def get_user_profile(user_id):
-    """دریافت پروفایل کاربر از پایگاه داده"""
+    """دریافت پروفایل کاربر از پایگاه داده (با کش)"""
+    found, user = get_cached_profile(user_id)
+    if found:
+        return user
+    
     db = get_db()
     if db is None:
         logger.error("اتصال به پایگاه داده برقرار نیست")
         return None
     
     users_collection = db.users
-    user = users_collection.find_one({"user_id": user_id})
+    user = await run_in_db_executor(users_collection.find_one, {"user_id": user_id})
+    cache_profile(user_id, user)
     return user
 
 async def update_user_profile(user_id, profile_data):
@@ -24,11 +33,13 @@ async def update_user_profile(user_id, profile_data):
     
     try:
         users_collection = db.users
-        result = users_collection.update_one(
+        result = await run_in_db_executor(
+            users_collection.update_one,
             {"user_id": user_id},
             {"$set": profile_data},
             upsert=True
         )
+        invalidate_profile(user_id)
         logger.info(f"نتیجه به‌روزرسانی پروفایل: {result.acknowledged}, modified: {result.modified_count}")
         return result.acknowledged
     except Exception as e:
@@ -43,7 +54,7 @@ async def save_exam_results(user_id, exam_results):
         return False
     
     exams_collection = db.exam_results
-    result = exams_collection.insert_one({
+    result = await run_in_db_executor(exams_collection.insert_one, {
         "user_id": user_id,
         "timestamp": datetime.datetime.now(),
         "results": exam_results
@@ -59,14 +70,26 @@ async def get_user_exam_history(user_id, limit=5):
         return []
     
     exams_collection = db.exam_results
-    cursor = exams_collection.find(
-        {"user_id": user_id}
-    ).sort("timestamp", -1).limit(limit)
     
-    return list(cursor)
+    def _query():
+        cursor = exams_collection.find(
+            {"user_id": user_id}
+        ).sort("timestamp", -1).limit(limit)
+        return list(cursor)
+    
+    return await run_in_db_executor(_query)
 
 async def save_chat_message(user_id, message_type, content):
-    """ذخیره پیام چت در پایگاه داده"""
+    """ذخیره پیام چت در پایگاه داده (در صورت فعال بودن نویسنده گروهی، بدون انتظار برای نوشتن)"""
+    document = {
+        "user_id": user_id,
+        "timestamp": datetime.datetime.now(),
+        "type": message_type,
+        "content": content
+    }
+    if history_writer.add(document):
+        return True
+    
     db = get_db()
     if db is None:
         logger.error("اتصال به پایگاه داده برقرار نیست")
@@ -74,13 +97,8 @@ async def save_chat_message(user_id, message_type, content):
     
     try:
         chat_collection = db.chat_history
-        result = chat_collection.insert_one({
-            "user_id": user_id,
-            "timestamp": datetime.datetime.now(),
-            "type": message_type,
-            "content": content
-        })
-        logger.info(f"پیام در تاریخچه چت ذخیره شد: {result.acknowledged}")
+        result = await run_in_db_executor(chat_collection.insert_one, document)
+        logger.debug(f"پیام در تاریخچه چت ذخیره شد: {result.acknowledged}")
         return result.acknowledged
     except Exception as e:
         logger.error(f"خطا در ذخیره پیام چت: {e}")
@@ -95,11 +113,14 @@ async def get_user_chat_history(user_id, limit=10):
     
     try:
         chat_collection = db.chat_history
-        cursor = chat_collection.find(
-            {"user_id": user_id}
-        ).sort("timestamp", -1).limit(limit)
         
-        return list(cursor)
+        def _query():
+            cursor = chat_collection.find(
+                {"user_id": user_id}
+            ).sort("timestamp", -1).limit(limit)
+            return list(cursor)
+        
+        return await run_in_db_executor(_query)
     except Exception as e:
         logger.error(f"خطا در دریافت تاریخچه چت: {e}")
-        return []
\ No newline at end of file
+        return []
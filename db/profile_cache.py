@@ -0,0 +1,81 @@
+import logging
+import threading
+import config
+from cache import LRUCache
+from db.connection import get_db
+
+logger = logging.getLogger(__name__)
+
+# کش پروفایل کاربران؛ نبود پروفایل هم (با _NO_PROFILE) کش می‌شود
+profile_cache = LRUCache(
+    max_entries=config.PROFILE_CACHE_MAX_ENTRIES,
+    ttl=config.PROFILE_CACHE_TTL,
+)
+_NO_PROFILE = object()
+_MISSING = object()
+
+_listener_thread = None
+_listener_stop = threading.Event()
+
+def get_cached_profile(user_id):
+    """دریافت پروفایل از کش؛ خروجی (یافت شد، پروفایل)"""
+    profile = profile_cache.get(user_id, _MISSING)
+    if profile is _MISSING:
+        return False, None
+    return True, None if profile is _NO_PROFILE else profile
+
+def cache_profile(user_id, profile):
+    """ذخیره پروفایل (یا نبود آن) در کش"""
+    profile_cache.set(user_id, _NO_PROFILE if profile is None else profile)
+
+def invalidate_profile(user_id):
+    """حذف پروفایل یک کاربر از کش"""
+    profile_cache.pop(user_id)
+
+def profile_cache_stats():
+    """شمارنده‌های hit/miss کش پروفایل"""
+    return profile_cache.stats()
+
+def _listen_for_changes():
+    """باطل‌سازی کش با تغییرات کالکشن users (از سایر نمونه‌های بات)"""
+    while not _listener_stop.is_set():
+        try:
+            db = get_db()
+            if db is None:
+                _listener_stop.wait(5)
+                continue
+            with db.users.watch(full_document="updateLookup", max_await_time_ms=1000) as stream:
+                while not _listener_stop.is_set():
+                    change = stream.try_next()
+                    if change is None:
+                        continue
+                    user_id = (change.get("fullDocument") or {}).get("user_id")
+                    if user_id is None:
+                        # برای حذف سند شناسه کاربر در دسترس نیست
+                        profile_cache.clear()
+                    else:
+                        invalidate_profile(user_id)
+        except Exception as e:
+            logger.error(f"خطا در دریافت تغییرات کالکشن users: {e}")
+            _listener_stop.wait(5)
+
+def start_profile_invalidation():
+    """شروع باطل‌سازی کش بین نمونه‌ها با change stream (در صورت فعال بودن در تنظیمات)"""
+    global _listener_thread
+    if not config.PROFILE_CACHE_CHANGE_STREAM:
+        return
+    if _listener_thread is not None and _listener_thread.is_alive():
+        return
+    _listener_stop.clear()
+    _listener_thread = threading.Thread(
+        target=_listen_for_changes, name="profile-cache-invalidation", daemon=True
+    )
+    _listener_thread.start()
+
+def stop_profile_invalidation():
+    """توقف دریافت تغییرات کالکشن users"""
+    global _listener_thread
+    _listener_stop.set()
+    if _listener_thread is not None:
+        _listener_thread.join(timeout=5)
+        _listener_thread = None
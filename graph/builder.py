@@ -1,25 +1,50 @@
+from typing import Callable, Optional, TypedDict
 from langgraph.graph import StateGraph, START, END
 from langchain.schema import HumanMessage, AIMessage
-from bot.utils import WebSearchTool
 import logging
+import config
 
 from graph.nodes import (
     profile_node, router_node, study_plan_node, 
     performance_analysis_node, general_chat_node
 )
-from graph.memory import get_memory, update_memory
+from graph.memory import aget_memory, update_memory
+from graph.models import get_model
+from graph.tools import tools_node
+from graph.singleflight import request_flight, request_key
 
 logger = logging.getLogger(__name__)
 
-def build_langgraph(llm):
-    """ساخت گراف LangGraph برای بات مشاور تحصیلی"""
-    # تعریف ساختار حالت اولیه
-    class State(dict):
-        messages: list
-        user_profile: dict
-        request_type: str
-        memory: dict
-        response: str = None
+class State(TypedDict, total=False):
+    """ساختار حالت گراف"""
+    messages: list
+    user_profile: dict
+    request_type: str
+    memory: dict
+    exam_results: dict
+    response: str
+    # تعداد توکن متن حافظه ارسال شده در پرامپت
+    memory_tokens: int
+    # پیام‌های گفتگو با مدل در حین اجرای ابزارها و تعداد دورهای اجرا شده
+    llm_messages: Optional[list]
+    tool_rounds: int
+    # پاسخ جایگزین به دلیل در دسترس نبودن مدل
+    degraded: bool
+    # خوشامدگویی با نام کاربر که هنگام ارسال به ابتدای پاسخ اضافه می‌شود
+    greeting: Optional[str]
+    # در حالت جریانی: coroutine دریافت متن تجمعی پاسخ
+    on_token: Optional[Callable]
+
+def build_langgraph(llms=None, tools=None):
+    """ساخت گراف LangGraph برای بات مشاور تحصیلی (فقط یک بار هنگام راه‌اندازی)
+
+    llms: مدل هر نود به صورت {کاربرد: مدل}؛ موارد تعیین نشده از config.MODEL_REGISTRY ساخته می‌شوند
+    tools: ابزارهای قابل استفاده توسط مدل (پیش‌فرض: TOOLS در graph.tools)
+    """
+    llms = llms or {}
+    
+    def model(purpose):
+        return llms.get(purpose) or get_model(purpose)
     
     # ایجاد گراف
     graph = StateGraph(State)
@@ -27,13 +52,26 @@ def build_langgraph(llm):
     # افزودن نودها (گره‌ها) به گراف
     graph.add_node("profile", profile_node)
     graph.add_node("router", router_node)
-    graph.add_node("study_plan", study_plan_node(llm))
-    graph.add_node("performance_analysis", performance_analysis_node(llm))
-    graph.add_node("general_chat", general_chat_node(llm))
+    graph.add_node("study_plan", study_plan_node(model("study_plan"), tools))
+    graph.add_node("performance_analysis", performance_analysis_node(model("performance_analysis"), tools))
+    graph.add_node("general_chat", general_chat_node(model("general_chat"), tools, model("general_chat_short")))
+    graph.add_node("tools", tools_node(tools))
 
     # تعریف مسیرها
     graph.add_edge(START, "profile")
-    graph.add_edge("profile", "router")
+    
+    # اگر نود پروفایل پاسخی تولید کرده باشد (پروفایل ناقص)، اجرا همان‌جا تمام می‌شود
+    def check_profile(state):
+        return "end" if state.get("response") else "router"
+    
+    graph.add_conditional_edges(
+        "profile",
+        check_profile,
+        {
+            "end": END,
+            "router": "router"
+        }
+    )
     
     # روتر تصمیم می‌گیرد کدام نود بعدی استفاده شود
     def route_request(state):
@@ -56,30 +94,62 @@ def build_langgraph(llm):
         }
     )
     
-    # همه نودها به END وصل شوند
-    graph.add_edge("study_plan", END)
-    graph.add_edge("performance_analysis", END)
-    graph.add_edge("general_chat", END)
+    # اگر مدل اجرای ابزار خواسته باشد به نود tools و در غیر این صورت به END
+    def check_tool_calls(state):
+        return "tools" if state.get("llm_messages") else "end"
+    
+    for node in ("study_plan", "performance_analysis", "general_chat"):
+        graph.add_conditional_edges(node, check_tool_calls, {"tools": "tools", "end": END})
+    
+    # پس از اجرای ابزارها، همان نودی که ابزار را خواسته بود پاسخ را ادامه می‌دهد
+    graph.add_conditional_edges(
+        "tools",
+        route_request,
+        {
+            "study_plan": "study_plan",
+            "performance_analysis": "performance_analysis",
+            "general_chat": "general_chat"
+        }
+    )
     
     # کامپایل کردن گراف
     workflow = graph.compile()
     
     return workflow
 
-async def process_with_langgraph(input_data):
-    """پردازش درخواست با استفاده از LangGraph"""
+# پاسخ خطای پردازش (در single-flight نگهداری نمی‌شود)
+PROCESSING_ERROR_REPLY = "متأسفانه در پردازش درخواست شما مشکلی پیش آمد. لطفاً دوباره تلاش کنید."
+
+def _shareable(response):
+    """پاسخ خطا و پاسخ جایگزین خطای مدل به درخواست تکراری بعدی داده نمی‌شوند"""
+    return response not in (PROCESSING_ERROR_REPLY, config.LLM_DEGRADED_REPLY)
+
+async def process_with_langgraph(input_data, workflow):
+    """پردازش درخواست با استفاده از گراف کامپایل شده LangGraph؛
+    درخواست‌های یکسان همزمان یک کاربر فقط یک بار اجرا می‌شوند و پاسخ انواع SINGLE_FLIGHT_RETAIN_TYPES
+    (مثلاً دو بار زدن /plan) برای مدت کوتاهی به درخواست تکراری داده می‌شود"""
+    if not config.SINGLE_FLIGHT_ENABLED:
+        return await _run_workflow(input_data, workflow)
+    return await request_flight.run(
+        request_key(input_data), lambda: _run_workflow(input_data, workflow), cacheable=_shareable,
+        retain=input_data.get("type", "general_chat") in config.SINGLE_FLIGHT_RETAIN_TYPES
+    )
+
+async def _run_workflow(input_data, workflow):
+    """اجرای گراف برای یک درخواست و به‌روزرسانی حافظه"""
     try:
         # آماده‌سازی ورودی برای LangGraph
-        from graph.memory import get_memory
-        user_id = input_data.get("user_profile", {}).get("user_id")
-        memory = input_data.get("memory", get_memory(user_id))
+        user_profile = input_data.get("user_profile") or {}
+        user_id = user_profile.get("user_id")
+        memory = input_data.get("memory") or await aget_memory(user_id)
 
         state = {
             "messages": [HumanMessage(content=input_data.get("message", ""))],
-            "user_profile": input_data.get("user_profile", {}),
+            "user_profile": user_profile,
             "request_type": input_data.get("type", "general_chat"),
             "memory": memory,
             "response": None,
+            "on_token": input_data.get("on_token"),
         }
         
         # اضافه کردن نتایج آزمون در صورت وجود
@@ -87,44 +157,22 @@ async def process_with_langgraph(input_data):
             state["exam_results"] = input_data["exam_results"]
         
         # اجرای گراف
-        from langchain_openai import ChatOpenAI
-        import config
-
-        # Create llm instance
-        llm = ChatOpenAI(
-            model=config.MODEL_NAME,
-            temperature=0.7,
-            api_key=config.OPENAI_API_KEY,
-            #model_kwargs={"tools": [{"type": "web_search"}]},
-        ).bind_tools([WebSearchTool()], tool_choice="auto")
-
-        # روش مستقیم: به جای استفاده از گراف، مستقیم به نودهای مناسب دسترسی پیدا کنیم
-        request_type = input_data.get("type", "general_chat")
-        
-        # ابتدا بررسی پروفایل
-        state = profile_node(state)
-        
-        # اگر پاسخی از پروفایل نود دریافت شد، آن را برگردانیم
-        if state.get("response"):
-            return state["response"]
+        result = await workflow.ainvoke(state)
+        response = result.get("response")
         
-        # اجرای نود مناسب بر اساس نوع درخواست
-        if request_type == "study_plan":
-            state = study_plan_node(llm)(state)
-        elif request_type == "performance_analysis":
-            state = performance_analysis_node(llm)(state)
-        else:
-            state = general_chat_node(llm)(state)
+        # پاسخ نود پروفایل (پروفایل ناقص) و پاسخ جایگزین خطای مدل در حافظه ذخیره نمی‌شوند
+        if not user_profile.get("complete", False) or result.get("degraded"):
+            return response
         
         # ذخیره در حافظه و برگرداندن پاسخ
-        if state.get("response"):
+        if response:
             user_message = input_data.get("message", "")
-            update_memory(memory, user_message, state["response"])
-            return state["response"]
+            update_memory(memory, user_message, response, user_id)
+            return response
         
         logger.error("نتیجه پردازش خالی است")
-        return "متأسفانه در پردازش درخواست شما مشکلی پیش آمد. لطفاً دوباره تلاش کنید."
+        return PROCESSING_ERROR_REPLY
     
     except Exception as e:
         logger.error(f"خطا در پردازش با LangGraph: {e}")
-        return "متأسفانه در پردازش درخواست شما مشکلی پیش آمد. لطفاً دوباره تلاش کنید."
\ No newline at end of file
+        return PROCESSING_ERROR_REPLY
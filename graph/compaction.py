@@ -0,0 +1,97 @@
+import asyncio
+import logging
+import config
+from graph.memory_store import estimate_memory_size
+
+logger = logging.getLogger(__name__)
+
+def merge_fact(fact_sheet, key, value):
+    """ادغام یک مورد اطلاعات کلیدی در برگه اطلاعات؛ مقدار جدیدتر بر قدیمی‌تر اولویت دارد"""
+    current = fact_sheet.get(key)
+    if isinstance(value, list) and isinstance(current, list):
+        # اجتماع بدون تکرار؛ موارد تکرار شده به انتها (جدیدترین) منتقل می‌شوند
+        merged = [item for item in current if item not in value]
+        for item in value:
+            if item not in merged:
+                merged.append(item)
+        fact_sheet[key] = merged[-config.FACT_SHEET_MAX_ITEMS:]
+    elif isinstance(value, dict) and isinstance(current, dict):
+        merged = dict(current)
+        merged.update(value)
+        fact_sheet[key] = merged
+    else:
+        fact_sheet[key] = value
+
+def compact_memory(memory, keep_recent=None):
+    """ادغام موارد حافظه بلند مدت در برگه اطلاعات (fact_sheet)؛ خروجی: تعداد بایت آزاد شده"""
+    keep_recent = config.MEMORY_COMPACTION_KEEP_RECENT if keep_recent is None else keep_recent
+    long_term = memory["long_term"]
+    count = len(long_term) - keep_recent
+    if count <= 0:
+        return 0
+
+    size_before = estimate_memory_size(memory)
+    fact_sheet = memory.setdefault("fact_sheet", {})
+    # موارد از قدیم به جدید ادغام می‌شوند تا مقدار جدیدتر باقی بماند
+    for item in long_term[:count]:
+        for key, value in item.info.items():
+            merge_fact(fact_sheet, key, value)
+    del long_term[:count]
+    return max(0, size_before - estimate_memory_size(memory))
+
+class MemoryCompactor:
+    """فشرده‌سازی دوره‌ای و تدریجی حافظه بلند مدت کاربرانی که اطلاعات جدید دارند"""
+
+    def __init__(self, on_compacted, interval=None, min_entries=None):
+        # on_compacted(key, memory): ثبت تغییر حافظه برای ذخیره
+        self._on_compacted = on_compacted
+        self.interval = interval or config.MEMORY_COMPACTION_INTERVAL
+        self.min_entries = min_entries or config.MEMORY_COMPACTION_MIN_ENTRIES
+        # کاربرانی که از آخرین اجرا اطلاعات جدید گرفته‌اند
+        self._pending = {}
+        self._task = None
+        self.stats = {"runs": 0, "compacted_users": 0, "compacted_entries": 0, "bytes_saved": 0}
+
+    def mark(self, key, memory):
+        """ثبت کاربر برای بررسی در اجرای بعدی"""
+        self._pending[key] = memory
+
+    def run_once(self):
+        """فشرده‌سازی حافظه کاربران ثبت شده؛ خروجی: تعداد بایت آزاد شده"""
+        pending, self._pending = self._pending, {}
+        saved = 0
+        for key, memory in pending.items():
+            entries = len(memory["long_term"])
+            if entries < self.min_entries:
+                continue
+            saved += compact_memory(memory)
+            self.stats["compacted_users"] += 1
+            self.stats["compacted_entries"] += entries - len(memory["long_term"])
+            self._on_compacted(key, memory)
+        self.stats["runs"] += 1
+        self.stats["bytes_saved"] += saved
+        if saved:
+            logger.info(f"فشرده‌سازی حافظه بلند مدت: {saved} بایت آزاد شد")
+        return saved
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error(f"خطا در فشرده‌سازی حافظه بلند مدت: {e}")
+
+    async def start(self):
+        """شروع فشرده‌سازی دوره‌ای در پس‌زمینه"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="memory-compaction")
+
+    async def stop(self):
+        """توقف فشرده‌سازی و اجرای نهایی برای کاربران باقی‌مانده"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        self.run_once()
+        logger.info(f"آمار فشرده‌سازی حافظه: {self.stats}")
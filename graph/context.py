@@ -0,0 +1,135 @@
+import asyncio
+import logging
+import config
+
+logger = logging.getLogger(__name__)
+
+_SHORT_TERM_HEADER = "آخرین مکالمات:"
+_LONG_TERM_HEADER = "اطلاعات کلیدی:"
+
+# اولویت انواع اطلاعات کلیدی در متن حافظه (عدد کمتر = مهم‌تر)
+FACT_PRIORITY = {"goals": 0, "scores": 1, "subjects": 2, "study_times": 3}
+
+_encoding = None
+_encoding_loaded = False
+
+def _get_encoding():
+    """توکنایزر محلی مدل (tiktoken)؛ در صورت نبود، None و شمارش تخمینی"""
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        _encoding_loaded = True
+        try:
+            import tiktoken
+            try:
+                _encoding = tiktoken.encoding_for_model(config.MODEL_NAME)
+            except KeyError:
+                _encoding = tiktoken.get_encoding("o200k_base")
+        except Exception as e:
+            logger.warning(f"توکنایزر محلی در دسترس نیست؛ تعداد توکن به صورت تخمینی محاسبه می‌شود: {e}")
+    return _encoding
+
+async def load_tokenizer():
+    """بارگذاری توکنایزر هنگام راه‌اندازی و خارج از event loop
+    (tiktoken ممکن است فایل BPE را به صورت blocking دانلود کند)"""
+    await asyncio.to_thread(_get_encoding)
+
+def count_tokens(text):
+    """تعداد توکن‌های یک متن"""
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is None:
+        return max(1, len(text) // 3)
+    return len(encoding.encode(text))
+
+def truncate_tokens(text, max_tokens):
+    """کوتاه کردن متن به حداکثر max_tokens توکن"""
+    encoding = _get_encoding()
+    if encoding is None:
+        limit = max_tokens * 3
+        return text if len(text) <= limit else text[:limit] + "..."
+    tokens = encoding.encode(text)
+    if len(tokens) <= max_tokens:
+        return text
+    # حذف کاراکتر ناقص احتمالی در محل برش
+    return encoding.decode(tokens[:max_tokens]).rstrip("\ufffd") + "..."
+
+def format_fact(key, value):
+    """متن یک مورد از اطلاعات کلیدی"""
+    return f"{key}: {_format_value(value)}"
+
+def _format_value(value):
+    if isinstance(value, dict):
+        return ", ".join(f"{k}: {v}" for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return ", ".join(str(v) for v in value)
+    return str(value)
+
+def _turn_lines(short_term):
+    """خطوط مکالمات اخیر از جدیدترین به قدیمی‌ترین"""
+    lines = []
+    for msg in reversed(list(short_term)[-config.MAX_SHORT_TERM_MEMORY:]):
+        role = "کاربر" if msg.role == "user" else "بات"
+        content = truncate_tokens(msg.content, config.MEMORY_CONTEXT_MAX_MESSAGE_TOKENS)
+        lines.append(f"- {role}: {content}")
+    return lines
+
+def _fact_lines(long_term, fact_sheet=None, relevant_facts=None):
+    """خطوط اطلاعات کلیدی: ابتدا موارد بازیابی شده مرتبط با پیام، سپس به ترتیب اولویت و تازگی، بدون تکرار"""
+    lines = [f"- {text}" for text in relevant_facts or []]
+    seen = set(lines)
+    candidates = []
+    # برگه اطلاعات ادغام شده قدیمی‌تر از همه موارد حافظه بلند مدت است
+    infos = [item.info for item in reversed(long_term)] + [fact_sheet or {}]
+    for recency, info in enumerate(infos):
+        for key, value in info.items():
+            line = f"- {format_fact(key, value)}"
+            if line in seen:
+                continue
+            seen.add(line)
+            candidates.append((FACT_PRIORITY.get(key, len(FACT_PRIORITY)), recency, line))
+    candidates.sort(key=lambda c: (c[0], c[1]))
+    return lines + [line for _, _, line in candidates]
+
+def _pack(lines, budget, header, contiguous):
+    """انتخاب حریصانه خطوط به ترتیب داده شده تا سقف بودجه؛ خروجی: (خطوط، توکن مصرفی)"""
+    used = count_tokens(header) + 1
+    selected = []
+    for line in lines:
+        cost = count_tokens(line) + 1
+        if used + cost > budget:
+            # مکالمات باید پیوسته بمانند؛ اطلاعات کلیدی کوتاه‌تر بعدی ممکن است جا شوند
+            if contiguous:
+                break
+            continue
+        selected.append(line)
+        used += cost
+    return (selected, used) if selected else ([], 0)
+
+def build_memory_context(memory, budget=None, relevant_facts=None):
+    """ساخت متن حافظه برای پرامپت در سقف بودجه توکن؛ خروجی: (متن، تعداد توکن)
+
+    relevant_facts: متن اطلاعات کلیدی بازیابی شده برای پیام فعلی که بر سایر موارد اولویت دارند
+    """
+    if budget is None:
+        budget = config.MEMORY_CONTEXT_TOKEN_BUDGET
+    facts = _fact_lines(memory.get("long_term") or [], memory.get("fact_sheet"), relevant_facts)
+
+    # ابتدا مکالمات اخیر (با رزرو سهم اطلاعات کلیدی) و سپس اطلاعات کلیدی در بودجه باقیمانده
+    fact_reserve = int(budget * config.MEMORY_CONTEXT_FACT_SHARE) if facts else 0
+    turns, turns_used = _pack(
+        _turn_lines(memory.get("short_term") or []), budget - fact_reserve, _SHORT_TERM_HEADER, contiguous=True
+    )
+    facts, _ = _pack(facts, budget - turns_used, _LONG_TERM_HEADER, contiguous=False)
+
+    parts = []
+    if turns:
+        parts.append(_SHORT_TERM_HEADER)
+        parts.extend(reversed(turns))
+    if facts:
+        if parts:
+            parts.append("")
+        parts.append(_LONG_TERM_HEADER)
+        parts.extend(facts)
+    text = "\n".join(parts)
+    return text, count_tokens(text)
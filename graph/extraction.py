@@ -0,0 +1,175 @@
+import asyncio
+import logging
+import time
+import config
+
+logger = logging.getLogger(__name__)
+
+class ExtractionJob:
+    """یک درخواست استخراج اطلاعات کلیدی برای حافظه یک کاربر"""
+    __slots__ = ("key", "memory", "pairs", "timestamp", "enqueued_at")
+
+    def __init__(self, key, memory, user_message, bot_response, timestamp):
+        self.key = key
+        self.memory = memory
+        self.pairs = [(user_message, bot_response)]
+        self.timestamp = timestamp
+        self.enqueued_at = time.monotonic()
+
+    @property
+    def user_message(self):
+        return "\n".join(user_message for user_message, _ in self.pairs)
+
+    @property
+    def bot_response(self):
+        return "\n".join(bot_response for _, bot_response in self.pairs)
+
+class ExtractionPipeline:
+    """صف محدود و worker های پس‌زمینه برای استخراج اطلاعات کلیدی خارج از مسیر پاسخ"""
+
+    def __init__(self, handler, max_size=None, workers=None, overflow_policy=None, coalesce=None,
+                 batch_size=None, batch_window=None):
+        # handler یک coroutine است که لیستی از ExtractionJob ها را پردازش می‌کند
+        # و تعداد فراخوانی‌های LLM انجام شده را برمی‌گرداند
+        self._handler = handler
+        self.max_size = max_size or config.EXTRACTION_QUEUE_SIZE
+        self.workers = workers or config.EXTRACTION_WORKERS
+        self.overflow_policy = overflow_policy or config.EXTRACTION_OVERFLOW_POLICY
+        self.coalesce = config.EXTRACTION_COALESCE if coalesce is None else coalesce
+        self.batch_size = batch_size or config.EXTRACTION_BATCH_SIZE
+        self.batch_window = config.EXTRACTION_BATCH_WINDOW if batch_window is None else batch_window
+        self._queue = None
+        self._tasks = []
+        # درخواست‌های منتظر در صف به ازای هر کاربر (برای ادغام)
+        self._pending = {}
+        self.metrics = {
+            "submitted": 0,
+            "processed": 0,
+            "failed": 0,
+            "dropped": 0,
+            "skipped": 0,
+            "coalesced": 0,
+            "batches": 0,
+            "llm_calls": 0,
+            "total_latency": 0.0,
+        }
+        self._started_at = None
+
+    @property
+    def running(self):
+        return bool(self._tasks)
+
+    async def start(self):
+        """شروع worker ها (باید داخل event loop بات فراخوانی شود)"""
+        if self.running:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_size)
+        self._started_at = time.monotonic()
+        self._tasks = [
+            asyncio.create_task(self._worker(), name=f"extraction-worker-{i}")
+            for i in range(self.workers)
+        ]
+        logger.info(f"صف استخراج اطلاعات با {self.workers} worker راه‌اندازی شد")
+
+    async def stop(self, timeout=10):
+        """تخلیه صف (تا حداکثر timeout ثانیه) و توقف worker ها"""
+        if not self.running:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"{self._queue.qsize()} درخواست استخراج پیش از توقف پردازش نشد")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._pending.clear()
+        logger.info(f"صف استخراج اطلاعات متوقف شد: {self.get_metrics()}")
+
+    def submit(self, key, memory, user_message, bot_response, timestamp):
+        """افزودن درخواست استخراج به صف بدون انتظار؛ در صورت پذیرش True برمی‌گرداند"""
+        if not self.running:
+            # خارج از event loop بات (مثلاً در اسکریپت‌ها) استخراج انجام نمی‌شود
+            if not self.metrics["skipped"]:
+                logger.warning("صف استخراج اطلاعات شروع نشده است؛ استخراج انجام نمی‌شود")
+            self.metrics["skipped"] += 1
+            return False
+        self.metrics["submitted"] += 1
+
+        # اگر درخواست دیگری از همین کاربر هنوز در صف است، پیام‌ها با آن ادغام می‌شوند
+        if self.coalesce and key in self._pending:
+            job = self._pending[key]
+            job.pairs.append((user_message, bot_response))
+            job.timestamp = timestamp
+            self.metrics["coalesced"] += 1
+            return True
+
+        job = ExtractionJob(key, memory, user_message, bot_response, timestamp)
+        if self._queue.full():
+            if self.overflow_policy == "drop_new":
+                self.metrics["dropped"] += 1
+                logger.warning("صف استخراج پر است؛ درخواست جدید کنار گذاشته شد")
+                return False
+            # حذف قدیمی‌ترین درخواست برای باز کردن جا
+            oldest = self._queue.get_nowait()
+            self._queue.task_done()
+            self._forget(oldest)
+            self.metrics["dropped"] += 1
+
+        self._queue.put_nowait(job)
+        self._pending[key] = job
+        return True
+
+    def get_metrics(self):
+        """وضعیت فعلی صف و شمارنده‌ها"""
+        metrics = dict(self.metrics)
+        metrics["queue_size"] = self._queue.qsize() if self._queue is not None else 0
+        done = metrics["processed"] + metrics["failed"]
+        metrics["avg_latency"] = metrics["total_latency"] / done if done else 0.0
+        metrics["avg_batch_size"] = done / metrics["batches"] if metrics["batches"] else 0.0
+        elapsed = time.monotonic() - self._started_at if self._started_at else 0.0
+        metrics["extractions_per_second"] = metrics["processed"] / elapsed if elapsed else 0.0
+        return metrics
+
+    def _forget(self, job):
+        if self._pending.get(job.key) is job:
+            del self._pending[job.key]
+
+    async def _collect_batch(self):
+        """انتظار برای اولین درخواست و جمع‌آوری درخواست‌های بعدی تا پر شدن دسته یا پایان پنجره زمانی"""
+        batch = [await self._queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.batch_window
+        while len(batch) < self.batch_size:
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _worker(self):
+        while True:
+            batch = await self._collect_batch()
+            # از این لحظه درخواست‌های جدید کاربران در job های تازه قرار می‌گیرند
+            for job in batch:
+                self._forget(job)
+            try:
+                self.metrics["llm_calls"] += await self._handler(batch) or 0
+                self.metrics["processed"] += len(batch)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.metrics["failed"] += len(batch)
+                logger.error(f"خطا در استخراج اطلاعات در پس‌زمینه: {e}")
+            finally:
+                self.metrics["batches"] += 1
+                now = time.monotonic()
+                for job in batch:
+                    self.metrics["total_latency"] += now - job.enqueued_at
+                    self._queue.task_done()
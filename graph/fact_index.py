@@ -0,0 +1,341 @@
+import asyncio
+import logging
+import os
+import time
+import numpy as np
+import config
+from cache import LRUCache
+from graph.context import format_fact
+
+logger = logging.getLogger(__name__)
+
+def fact_texts(info):
+    """متن اطلاعات کلیدی یک مورد حافظه بلند مدت برای ذخیره در ایندکس"""
+    return [format_fact(key, value) for key, value in info.items()]
+
+class FactIndex:
+    """ایندکس برداری اطلاعات کلیدی یک کاربر (بردارهای نرمال شده float32 در یک آرایه NumPy)"""
+
+    def __init__(self, dimensions, capacity):
+        self.dimensions = dimensions
+        self.capacity = capacity
+        self._vectors = np.empty((0, dimensions), dtype=np.float32)
+        self._size = 0
+        self.texts = []
+        self._text_set = set()
+
+    def __len__(self):
+        return self._size
+
+    def __contains__(self, text):
+        return text in self._text_set
+
+    @property
+    def nbytes(self):
+        return self._vectors.nbytes + sum(2 * len(text) + 64 for text in self.texts)
+
+    @property
+    def vectors(self):
+        return self._vectors[:self._size]
+
+    def _reserve(self, size):
+        # رشد دو برابری بافر تا سقف ظرفیت برای جلوگیری از کپی در هر افزودن
+        if size <= len(self._vectors):
+            return
+        new_capacity = min(self.capacity, max(size, 2 * len(self._vectors), 64))
+        vectors = np.empty((new_capacity, self.dimensions), dtype=np.float32)
+        vectors[:self._size] = self._vectors[:self._size]
+        self._vectors = vectors
+
+    def add(self, texts, vectors):
+        """افزودن اطلاعات جدید؛ در صورت عبور از ظرفیت، قدیمی‌ترین موارد حذف می‌شوند"""
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dimensions)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.maximum(norms, 1e-12)
+        texts = list(texts)
+        if len(texts) > self.capacity:
+            texts, vectors = texts[-self.capacity:], vectors[-self.capacity:]
+
+        overflow = self._size + len(texts) - self.capacity
+        if overflow > 0:
+            keep = self._size - overflow
+            self._vectors[:keep] = self._vectors[overflow:self._size]
+            for text in self.texts[:overflow]:
+                self._text_set.discard(text)
+            del self.texts[:overflow]
+            self._size = keep
+
+        self._reserve(self._size + len(texts))
+        self._vectors[self._size:self._size + len(texts)] = vectors
+        self._size += len(texts)
+        self.texts.extend(texts)
+        self._text_set.update(texts)
+
+    def search(self, query_vector, k):
+        """k مورد با بیشترین شباهت کسینوسی؛ خروجی: لیست (متن، امتیاز) از بیشترین به کمترین"""
+        if not self._size or k <= 0:
+            return []
+        query = np.asarray(query_vector, dtype=np.float32)
+        query = query / max(float(np.linalg.norm(query)), 1e-12)
+        scores = self.vectors @ query
+        if k < self._size:
+            top = np.argpartition(scores, -k)[-k:]
+            top = top[np.argsort(scores[top])[::-1]]
+        else:
+            top = np.argsort(scores)[::-1]
+        return [(self.texts[i], float(scores[i])) for i in top]
+
+    def snapshot(self):
+        """کپی سازگار بردارها و متن‌ها (در thread حلقه رویداد) برای ذخیره در thread دیگر"""
+        return self.vectors.copy(), list(self.texts)
+
+    @staticmethod
+    def write(path, snapshot):
+        """ذخیره snapshot ایندکس در فایل npz"""
+        vectors, texts = snapshot
+        tmp_path = path + ".tmp.npz"
+        np.savez(tmp_path, vectors=vectors, texts=np.array(texts, dtype=str))
+        os.replace(tmp_path, path)
+
+    def save(self, path):
+        """ذخیره ایندکس در فایل npz"""
+        self.write(path, self.snapshot())
+
+    @classmethod
+    def load(cls, path, dimensions, capacity):
+        """بارگذاری ایندکس از فایل npz؛ در صورت تغییر ابعاد بردار، None"""
+        with np.load(path, allow_pickle=False) as data:
+            vectors = data["vectors"]
+            texts = data["texts"].tolist()
+        if vectors.ndim != 2 or vectors.shape[1] != dimensions:
+            return None
+        index = cls(dimensions, capacity)
+        index.add(texts, vectors)
+        return index
+
+class FactIndexStore:
+    """کش LRU ایندکس‌های برداری کاربران با بارگذاری تنبل و ذخیره دوره‌ای روی دیسک"""
+
+    def __init__(self, directory=None, capacity=None, dimensions=None, embeddings=None, flush_interval=None):
+        self.directory = directory or config.FACT_INDEX_DIR
+        self.capacity = capacity or config.FACT_INDEX_CAPACITY
+        self.dimensions = dimensions or config.FACT_EMBEDDING_DIMENSIONS
+        self.flush_interval = flush_interval or config.FACT_INDEX_FLUSH_INTERVAL
+        self._embeddings = embeddings
+        self._cache = LRUCache(
+            max_entries=config.FACT_INDEX_CACHE_MAX_ENTRIES,
+            max_bytes=config.FACT_INDEX_CACHE_MAX_BYTES,
+            sizeof=lambda index: index.nbytes,
+        )
+        # ایندکس‌های تغییر کرده که هنوز روی دیسک ذخیره نشده‌اند
+        self._dirty = {}
+        self._loading = {}
+        # ساخت ایندکس از حافظه بلند مدت در پس‌زمینه (خارج از مسیر پاسخ)
+        self._backfills = set()
+        self._flush_task = None
+        self.stats = {"searches": 0, "search_seconds": 0.0, "embedded": 0, "timeouts": 0}
+
+    def _get_embeddings(self):
+        if self._embeddings is None:
+            from langchain_openai import OpenAIEmbeddings
+            self._embeddings = OpenAIEmbeddings(
+                model=config.EMBEDDING_MODEL, dimensions=self.dimensions, api_key=config.OPENAI_API_KEY,
+                request_timeout=config.FACT_EMBEDDING_TIMEOUT, max_retries=config.FACT_EMBEDDING_MAX_RETRIES
+            )
+        return self._embeddings
+
+    def _path(self, user_id):
+        return os.path.join(self.directory, f"{user_id}.npz")
+
+    def _load_blocking(self, user_id):
+        path = self._path(user_id)
+        if not os.path.exists(path):
+            return None
+        return FactIndex.load(path, self.dimensions, self.capacity)
+
+    async def aget(self, user_id, memory=None):
+        """دریافت ایندکس کاربر؛ اگر روی دیسک نباشد از حافظه بلند مدت ساخته می‌شود"""
+        index = self._cached(user_id)
+        if index is not None:
+            return index
+
+        loading = self._loading.get(user_id)
+        if loading is None:
+            loading = asyncio.ensure_future(self._load(user_id, memory))
+            self._loading[user_id] = loading
+            loading.add_done_callback(lambda _: self._loading.pop(user_id, None))
+        return await asyncio.shield(loading)
+
+    async def _load(self, user_id, memory):
+        try:
+            index = await asyncio.to_thread(self._load_blocking, user_id)
+        except Exception as e:
+            logger.error(f"خطا در بارگذاری ایندکس اطلاعات کاربر {user_id}: {e}")
+            index = None
+        backfill = index is None
+        if backfill:
+            index = FactIndex(self.dimensions, self.capacity)
+        cached = self._cached(user_id)
+        if cached is None:
+            cached = index
+            self._cache.set(user_id, index)
+            if backfill:
+                self._start_backfill(user_id, index, memory)
+        return cached
+
+    def _start_backfill(self, user_id, index, memory):
+        """ساخت ایندکس برای اطلاعاتی که پیش از فعال شدن ایندکس استخراج شده‌اند (در پس‌زمینه)"""
+        memory = memory or {}
+        texts = fact_texts(memory.get("fact_sheet") or {})
+        texts += [text for item in memory.get("long_term", []) for text in fact_texts(item.info)]
+        if not texts:
+            return
+        task = asyncio.create_task(self._backfill(user_id, index, texts), name=f"fact-index-backfill-{user_id}")
+        self._backfills.add(task)
+        task.add_done_callback(self._backfills.discard)
+
+    async def _backfill(self, user_id, index, texts):
+        try:
+            await self._embed_into({user_id: (index, texts)})
+        except Exception as e:
+            logger.error(f"خطا در ساخت ایندکس اطلاعات کاربر {user_id}: {e}")
+
+    def _cached(self, user_id):
+        index = self._cache.get(user_id)
+        if index is None and user_id in self._dirty:
+            index = self._dirty[user_id]
+            self._cache.set(user_id, index)
+        return index
+
+    def _current(self, user_id):
+        """ایندکسی که در حال حاضر برای کاربر استفاده می‌شود (بدون تغییر ترتیب LRU)"""
+        index = self._cache.get(user_id, count=False)
+        return index if index is not None else self._dirty.get(user_id)
+
+    async def _embed_into(self, targets):
+        """embedding متن‌های جدید چند کاربر با یک فراخوانی و افزودن به ایندکس هر کاربر"""
+        pending = []
+        for user_id, (index, texts) in targets.items():
+            new_texts = [text for text in dict.fromkeys(texts) if text not in index]
+            if new_texts:
+                pending.append((user_id, index, new_texts))
+        if not pending:
+            return
+        vectors = await self._get_embeddings().aembed_documents(
+            [text for _, _, texts in pending for text in texts]
+        )
+        offset = 0
+        for user_id, index, texts in pending:
+            batch = vectors[offset:offset + len(texts)]
+            offset += len(texts)
+            # ممکن است در حین embedding ایندکس از کش خارج (و ذخیره) و نسخه جدیدتری بارگذاری شده باشد؛
+            # نسخه قدیمی نباید روی آن ذخیره شود، پس متن‌ها به ایندکس فعلی اضافه می‌شوند
+            current = self._current(user_id)
+            if current is None:
+                continue
+            # ممکن است در حین embedding همین متن‌ها توسط فراخوانی دیگری اضافه شده باشند
+            new = [(text, vector) for text, vector in zip(texts, batch) if text not in current]
+            if not new:
+                continue
+            current.add([text for text, _ in new], [vector for _, vector in new])
+            self._dirty[user_id] = current
+            self._cache.resize(user_id)
+        self.stats["embedded"] += offset
+
+    async def add_many(self, facts):
+        """افزودن اطلاعات استخراج شده چند کاربر: {user_id: (حافظه، لیست متن‌ها)}"""
+        try:
+            targets = {}
+            for user_id, (memory, texts) in facts.items():
+                targets[user_id] = (await self.aget(user_id, memory), texts)
+            await self._embed_into(targets)
+        except Exception as e:
+            logger.error(f"خطا در embedding اطلاعات کلیدی: {e}")
+
+    async def search(self, user_id, query, memory=None, k=None, min_score=None):
+        """بازیابی مرتبط‌ترین اطلاعات کلیدی کاربر با پیام فعلی؛ خروجی: لیست (متن، امتیاز)
+
+        در مسیر پاسخ اجرا می‌شود؛ اگر در FACT_RETRIEVAL_TIMEOUT کامل نشود، پاسخ بدون این اطلاعات ادامه می‌یابد
+        """
+        k = config.FACT_RETRIEVAL_TOP_K if k is None else k
+        min_score = config.FACT_RETRIEVAL_MIN_SCORE if min_score is None else min_score
+        if not query:
+            return []
+        try:
+            found = await asyncio.wait_for(self._query(user_id, query, memory), config.FACT_RETRIEVAL_TIMEOUT)
+        except asyncio.TimeoutError:
+            self.stats["timeouts"] += 1
+            logger.warning(f"بازیابی اطلاعات کلیدی کاربر {user_id} از سقف زمان گذشت")
+            return []
+        except Exception as e:
+            logger.error(f"خطا در بازیابی اطلاعات کلیدی کاربر {user_id}: {e}")
+            return []
+        if found is None:
+            return []
+        index, query_vector = found
+        started = time.perf_counter()
+        results = index.search(query_vector, k)
+        self.stats["searches"] += 1
+        self.stats["search_seconds"] += time.perf_counter() - started
+        return [(text, score) for text, score in results if score >= min_score]
+
+    async def _query(self, user_id, query, memory):
+        index = await self.aget(user_id, memory)
+        if not len(index):
+            return None
+        return index, await self._get_embeddings().aembed_query(query)
+
+    def _save_many_blocking(self, snapshots):
+        os.makedirs(self.directory, exist_ok=True)
+        for user_id, snapshot in snapshots.items():
+            FactIndex.write(self._path(user_id), snapshot)
+
+    async def flush(self):
+        """ذخیره ایندکس‌های تغییر کرده روی دیسک"""
+        if not self._dirty:
+            return 0
+        dirty, self._dirty = self._dirty, {}
+        # snapshot در همین thread گرفته می‌شود تا افزودن همزمان، متن‌ها و بردارهای ناهمخوان ذخیره نکند
+        snapshots = {user_id: index.snapshot() for user_id, index in dirty.items()}
+        try:
+            await asyncio.to_thread(self._save_many_blocking, snapshots)
+        except Exception as e:
+            logger.error(f"خطا در ذخیره ایندکس اطلاعات کلیدی: {e}")
+            for user_id, index in dirty.items():
+                self._dirty.setdefault(user_id, index)
+            return 0
+        return len(dirty)
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def start(self):
+        """شروع ذخیره دوره‌ای ایندکس‌ها"""
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_loop(), name="fact-index-flush")
+
+    async def stop(self):
+        """توقف ذخیره دوره‌ای و ذخیره تغییرات باقی‌مانده"""
+        for task in list(self._backfills):
+            task.cancel()
+        await asyncio.gather(*self._backfills, return_exceptions=True)
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            await asyncio.gather(self._flush_task, return_exceptions=True)
+            self._flush_task = None
+        flushed = await self.flush()
+        logger.info(f"ایندکس اطلاعات کلیدی ذخیره شد ({flushed} کاربر): {self.get_stats()}")
+
+    def get_stats(self):
+        """شمارنده‌های کش و میانگین زمان جستجو (میلی‌ثانیه)"""
+        stats = self._cache.stats()
+        stats.update(self.stats)
+        stats["dirty"] = len(self._dirty)
+        searches = self.stats["searches"]
+        stats["avg_search_ms"] = 1000 * self.stats["search_seconds"] / searches if searches else 0.0
+        return stats
+
+# نمونه مشترک برای نود گفتگوی عمومی و صف استخراج اطلاعات
+fact_index_store = FactIndexStore()
@@ -0,0 +1,74 @@
+import re
+from graph.text import normalize_text
+
+# عبارت‌های کلیدی هر نوع درخواست (هر عبارت کامل امتیاز KEYWORD_WEIGHT دارد)
+INTENT_KEYWORDS = {
+    "study_plan": [
+        "برنامه مطالعاتی", "برنامه مطالعه", "برنامه درسی", "برنامه ریزی", "برنامه بده",
+        "برنامه بریز", "برنامه بنویس", "زمان بندی", "زمانبندی", "جدول مطالعه",
+        "چطور بخونم", "چجوری بخونم", "چطوری بخونم", "study plan", "schedule",
+    ],
+    "performance_analysis": [
+        "تحلیل", "کارنامه", "نتایج آزمون", "نتیجه آزمون", "نتایج کنکور", "آزمون آزمایشی",
+        "عملکردم", "تراز", "درصدهام", "درصد هام", "رتبه", "analysis",
+    ],
+}
+
+# وزن از پیش محاسبه شده کلمات تکی برای هر نوع درخواست
+TOKEN_WEIGHTS = {
+    "study_plan": {
+        "برنامه": 1.2, "مطالعاتی": 1.2, "مطالعه": 0.6, "بخونم": 0.6, "روزانه": 0.6,
+        "هفتگی": 0.6, "هفته": 0.4, "ساعت": 0.4, "ماه": 0.3, "روز": 0.3, "زمان": 0.3,
+    },
+    "performance_analysis": {
+        "عملکرد": 1.0, "نتایج": 0.8, "نتیجه": 0.6, "آزمون": 0.5, "درصد": 0.8,
+        "نمره": 0.6, "نمرات": 0.6, "قلم": 0.4, "ضعیف": 0.3,
+    },
+}
+
+KEYWORD_WEIGHT = 2.0
+# حداقل امتیاز لازم برای انتخاب یک نوع درخواست به جای گفتگوی عمومی
+INTENT_THRESHOLD = 2.0
+
+_TOKEN = re.compile(r"\w+")
+# نمره عددی (ارقام فارسی یا لاتین، با اعشار و علامت درصد اختیاری)
+_SCORE = re.compile(r"^[-+]?\d+(?:[.٫]\d+)?\s*[%٪]?$")
+
+def _compile_keywords(keywords):
+    # عبارت‌های طولانی‌تر اول می‌آیند تا در تطبیق اولویت داشته باشند
+    phrases = sorted({normalize_text(k) for k in keywords}, key=len, reverse=True)
+    return re.compile(r"(?<!\w)(?:" + "|".join(re.escape(p) for p in phrases) + r")")
+
+_INTENT_PATTERNS = {intent: _compile_keywords(keywords) for intent, keywords in INTENT_KEYWORDS.items()}
+
+def score_intents(text):
+    """امتیاز هر نوع درخواست برای یک متن"""
+    text = normalize_text(text)
+    tokens = set(_TOKEN.findall(text))
+    scores = {}
+    for intent, pattern in _INTENT_PATTERNS.items():
+        score = KEYWORD_WEIGHT * len(set(pattern.findall(text)))
+        weights = TOKEN_WEIGHTS.get(intent, {})
+        score += sum(weights.get(token, 0.0) for token in tokens)
+        scores[intent] = score
+    return scores
+
+def classify_intent(text):
+    """تشخیص نوع درخواست بدون فراخوانی LLM؛ خروجی: (نوع درخواست، امتیاز)"""
+    if not text:
+        return "general_chat", 0.0
+    scores = score_intents(text)
+    intent, score = max(scores.items(), key=lambda item: item[1])
+    if score < INTENT_THRESHOLD:
+        return "general_chat", score
+    return intent, score
+
+def exam_scores(exam_results):
+    """فقط موارد نتایج آزمون با نمره عددی (مثلاً "ریاضی: ۱۸" یا "تراز: 6500")"""
+    scores = {}
+    for subject, score in exam_results.items():
+        if isinstance(score, (int, float)):
+            scores[subject] = score
+        elif isinstance(score, str) and _SCORE.match(score.strip()):
+            scores[subject] = score.strip()
+    return scores
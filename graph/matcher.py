@@ -0,0 +1,58 @@
+import re
+from graph.text import normalize_text
+
+class KeywordMatcher:
+    """تطبیق همزمان چند الگو با یک عبارت منظم کامپایل شده (پیمایش متن در موتور re)"""
+
+    def __init__(self, patterns):
+        # patterns: لیست جفت‌های (الگو، برچسب)
+        labels = {}
+        for pattern, label in patterns:
+            if pattern:
+                labels.setdefault(pattern, set()).add(label)
+        # الگوهای طولانی‌تر اول؛ تطبیق‌ها هم‌پوشانی ندارند، پس برچسب الگوهایی که داخل
+        # یک الگوی طولانی‌تر هستند (مثل «تحصیل» در «سال تحصیلی») هم به آن اضافه می‌شود
+        ordered = sorted(labels, key=len, reverse=True)
+        self._labels = {
+            pattern: frozenset().union(*(labels[inner] for inner in labels if inner in pattern))
+            for pattern in ordered
+        }
+        self._regex = re.compile("|".join(map(re.escape, ordered))) if ordered else None
+
+    def find_labels(self, text):
+        """برچسب همه الگوهای موجود در متن"""
+        if self._regex is None:
+            return set()
+        return set().union(*(self._labels[match] for match in set(self._regex.findall(text))))
+
+# کلمات کلیدی هر بخش پروفایل
+PROFILE_KEYWORDS = {
+    "grade": ["پایه", "کلاس", "سال تحصیلی", "دهم", "یازدهم", "دوازدهم"],
+    "exam_date": ["کنکور", "آزمون", "تاریخ", "زمان", "امتحان"],
+    "favorite_subjects": ["علاقه", "دوست دارم", "درس مورد علاقه", "علاقمندم"],
+    "disliked_subjects": ["متنفر", "بدم میاد", "سخت", "مشکل دارم", "ضعیف"],
+    "desired_major": ["رشته", "دانشگاه", "هدف", "آینده", "ادامه تحصیل", "تحصیل"]
+}
+
+GREETING_WORDS = ["سلام", "درود", "خوبی", "چطوری"]
+GREETING = "greeting"
+
+def _build_keyword_matcher():
+    patterns = [
+        (normalize_text(keyword), info_key)
+        for info_key, key_list in PROFILE_KEYWORDS.items()
+        for keyword in key_list
+    ]
+    patterns += [(normalize_text(word), GREETING) for word in GREETING_WORDS]
+    return KeywordMatcher(patterns)
+
+# یک بار هنگام import ساخته می‌شود
+keyword_matcher = _build_keyword_matcher()
+
+def match_keywords(text):
+    """همه بخش‌های پروفایل و سلام‌های موجود در متن با یک بار پیمایش"""
+    return keyword_matcher.find_labels(normalize_text(text))
+
+def is_greeting(text):
+    """آیا پیام شامل سلام و احوالپرسی است"""
+    return GREETING in match_keywords(text)
@@ -1,145 +1,208 @@
 import config
-from collections import deque
-import datetime
-from langchain_openai import ChatOpenAI
-from langchain.prompts import ChatPromptTemplate
-from bot.utils import WebSearchTool
-
-_memory_store = {
-    "global": {
-        "short_term": deque(maxlen=config.MAX_SHORT_TERM_MEMORY),
-        "long_term": []
-    }
-}
-
-# ایجاد نمونه مدل زبانی برای استخراج اطلاعات
-ai_extractor = ChatOpenAI(
-    model=config.MODEL_NAME,
-    temperature=0.3,
-    api_key=config.OPENAI_API_KEY,
-   # model_kwargs={"tools": [{"type": "web_search"}]},
-).bind_tools([WebSearchTool()], tool_choice="auto")
-
-def get_memory(user_id=None):
-    """دریافت حافظه کوتاه مدت و بلند مدت برای یک کاربر خاص"""
+import time
+import json
+import logging
+from graph.extraction import ExtractionPipeline
+from graph.memory_store import MemoryStore, MongoMemoryBackend, new_memory
+from graph.matcher import is_greeting
+from graph.compaction import MemoryCompactor
+from graph.context import build_memory_context
+from graph.fact_index import fact_index_store, fact_texts
+from graph.records import MemoryFact, MemoryMessage
+from graph.models import get_model
+from graph.prompts import EXTRACTION_PROMPT, BATCH_EXTRACTION_PROMPT
+from graph.usage import usage_stats
+
+logger = logging.getLogger(__name__)
+
+# حافظه عمومی (بدون کاربر مشخص) فقط در همین پردازه نگهداری می‌شود
+_GLOBAL_KEY = "global"
+_global_memory = new_memory()
+
+# حافظه کاربران: کش LRU/TTL محدود جلوی کالکشن memories در MongoDB
+memory_store = MemoryStore(MongoMemoryBackend())
+
+# مدل زبانی استخراج اطلاعات (config.MODEL_REGISTRY["extraction"])
+# (بدون ابزار: خروجی باید JSON باشد و پاسخ شامل فراخوانی ابزار، متن خالی برمی‌گرداند)
+ai_extractor = get_model("extraction")
+
+async def aget_memory(user_id=None):
+    """دریافت حافظه یک کاربر؛ در صورت نبود در کش، از پایگاه داده بارگذاری می‌شود"""
     if user_id is None:
-        return _memory_store["global"]
-    
-    # اگر کاربر قبلاً حافظه نداشته، یک حافظه جدید برایش ایجاد می‌کنیم
-    if user_id not in _memory_store:
-        _memory_store[user_id] = {
-            "short_term": deque(maxlen=config.MAX_SHORT_TERM_MEMORY),
-            "long_term": []
-        }
-    
-    return _memory_store[user_id]
+        return _global_memory
+    return await memory_store.aget(user_id)
 
-def update_memory(memory, user_message, bot_response):
-    """به‌روزرسانی حافظه با پیام‌های جدید"""
-    # افزودن به حافظه کوتاه مدت با زمان
-    timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    memory["short_term"].append({
-        "role": "user",
-        "content": user_message,
-        "timestamp": timestamp
-    })
-    memory["short_term"].append({
-        "role": "bot",
-        "content": bot_response,
-        "timestamp": timestamp
-    })
-    
-    # استخراج اطلاعات کلیدی و ذخیره در حافظه بلند مدت
-    key_info = extract_key_information(user_message, bot_response)
-    if key_info:
-        memory["long_term"].append({
-            "info": key_info,
-            "timestamp": timestamp
-        })
-    
-    return memory
+def has_recent_greeting(memory, message, window=3):
+    """آیا کاربر در چند نوبت اخیر (به جز همین پیام) سلام کرده است"""
+    last_greeting = memory.get("last_greeting")
+    if not last_greeting or last_greeting["content"] == message:
+        return False
+    return memory.get("turns", 0) - last_greeting["turn"] < window
 
-def extract_key_information(user_message, bot_response=""):
-    """استخراج اطلاعات کلیدی از پیام‌ها با استفاده از سرویس AI"""
-    # تعریف پرامپت برای مدل AI
-    template = """
-    تو یک استخراج‌کننده اطلاعات تحصیلی هستی. از متن داده شده اطلاعات کلیدی را استخراج کن.
-    
-    متن کاربر:
-    {user_message}
-    
-    پاسخ بات (اگر موجود باشد):
-    {bot_response}
+def _mark_dirty(key, memory):
+    """ثبت تغییر حافظه برای نوشتن در پایگاه داده"""
+    if key != _GLOBAL_KEY:
+        memory_store.mark_dirty(key, memory)
+
+def update_memory(memory, user_message, bot_response, user_id=None):
+    """به‌روزرسانی حافظه با پیام‌های جدید"""
+    # افزودن به حافظه کوتاه مدت با زمان (ثانیه epoch؛ قالب‌بندی فقط هنگام نمایش)
+    timestamp = int(time.time())
+    memory["short_term"].append(MemoryMessage("user", user_message, timestamp))
+    memory["short_term"].append(MemoryMessage("bot", bot_response, timestamp))
     
-    لطفاً اطلاعات زیر را به صورت JSON استخراج کن:
-    1. دروس مورد اشاره در متن (subjects): لیست اسامی دروس
-    2. نمرات و ترازها (scores): شامل عدد تراز و نمرات درسی
-    3. زمان‌های مطالعه (study_times): ساعات یا مدت زمان‌های مطالعه
-    4. اهداف تحصیلی (goals): هرگونه هدف تحصیلی اشاره شده
+    # به‌روزرسانی تدریجی وضعیت سلام کاربر
+    memory["turns"] += 1
+    if is_greeting(user_message):
+        memory["last_greeting"] = {"turn": memory["turns"], "content": user_message}
     
-    تنها اطلاعاتی که با اطمینان در متن وجود دارند را استخراج کن.
-    پاسخ را به صورت یک JSON ساده برگردان بدون هیچ توضیح اضافی.
-    مثال خروجی:
-    {{"subjects": ["ریاضی", "فیزیک"], "scores": {{"traz": "6500", "math": "18"}}, "study_times": {{"hours": "4", "schedule": "8 تا 12"}}, "goals": {{"main": "قبولی پزشکی"}}}}
+    key = user_id if user_id is not None else _GLOBAL_KEY
+    _mark_dirty(key, memory)
     
-    اگر هیچ اطلاعاتی برای یک فیلد وجود نداشت، آن را در خروجی قرار نده.
-    """
+    # استخراج اطلاعات کلیدی در پس‌زمینه انجام می‌شود تا پاسخ کاربر منتظر آن نماند
+    # (اگر صف استخراج شروع نشده باشد، استخراج انجام نمی‌شود و event loop مسدود نمی‌شود)
+    extraction_pipeline.submit(key, memory, user_message, bot_response, timestamp)
     
-    prompt = ChatPromptTemplate.from_template(template)
+    return memory
+
+def _store_key_information(key, memory, key_info, timestamp):
+    """ذخیره اطلاعات کلیدی استخراج شده در حافظه بلند مدت"""
+    if key_info:
+        memory["long_term"].append(MemoryFact(key_info, timestamp))
+        _mark_dirty(key, memory)
+        memory_compactor.mark(key, memory)
+
+async def _process_extraction_batch(jobs):
+    """استخراج یک دسته از درخواست‌های صف و توزیع نتایج در حافظه بلند مدت هر کاربر"""
+    items = [(job.user_message, job.bot_response) for job in jobs]
+    results, llm_calls = await aextract_key_information_batch(items)
+    new_facts = {}
+    for job, key_info in zip(jobs, results):
+        _store_key_information(job.key, job.memory, key_info, job.timestamp)
+        # حافظه موقت (خطای backend) ذخیره نمی‌شود، پس ایندکس آن هم ساخته نمی‌شود
+        if key_info and job.key != _GLOBAL_KEY and not job.memory.get("transient"):
+            new_facts.setdefault(job.key, (job.memory, []))[1].extend(fact_texts(key_info))
     
+    # embedding اطلاعات جدید همه کاربران دسته با یک فراخوانی
+    if new_facts and config.FACT_INDEX_ENABLED:
+        await fact_index_store.add_many(new_facts)
+    return llm_calls
+
+# ادغام دوره‌ای موارد حافظه بلند مدت در برگه اطلاعات هر کاربر (در main شروع می‌شود)
+memory_compactor = MemoryCompactor(_mark_dirty)
+
+# صف پس‌زمینه استخراج اطلاعات (در main هنگام راه‌اندازی بات شروع می‌شود)
+extraction_pipeline = ExtractionPipeline(_process_extraction_batch)
+
+def _build_extraction_messages(user_message, bot_response):
+    """ساخت پیام‌های پرامپت استخراج اطلاعات"""
     prompt_values = {
         "user_message": user_message,
         "bot_response": bot_response
     }
-    
+    return EXTRACTION_PROMPT.format_messages(**prompt_values)
+
+def _parse_key_information(content):
+    """تبدیل پاسخ JSON مدل به دیکشنری"""
+    try:
+        # حذف کاراکترهای اضافی احتمالی JSON (مانند ```json و ```)
+        if "```json" in content:
+            content = content.split("```json")[1].split("```")[0].strip()
+        elif "```" in content:
+            content = content.split("```")[1].strip()
+        
+        key_info = json.loads(content)
+        return key_info
+    except json.JSONDecodeError:
+        return {}
+
+def _build_batch_extraction_messages(items):
+    """ساخت پرامپت چند‌موردی برای استخراج یک دسته در یک فراخوانی LLM"""
+    items_text = "\n".join(
+        json.dumps({"id": i, "user_message": user_message, "bot_response": bot_response}, ensure_ascii=False)
+        for i, (user_message, bot_response) in enumerate(items)
+    )
+    return BATCH_EXTRACTION_PROMPT.format_messages(items=items_text)
+
+def _parse_batch_key_information(content, count):
+    """تبدیل آرایه JSON پاسخ مدل به لیست نتایج به ترتیب شناسه‌ها؛ در صورت خطا None"""
+    content = content.strip()
+    if "```json" in content:
+        content = content.split("```json")[1].split("```")[0].strip()
+    elif "```" in content:
+        content = content.split("```")[1].strip()
     try:
-        # دریافت پاسخ از LLM
-        messages = prompt.format_messages(**prompt_values)
-        response = ai_extractor.invoke(messages)
-        # تبدیل پاسخ JSON به دیکشنری
-        import json
+        parsed = json.loads(content)
+    except json.JSONDecodeError:
+        return None
+    if not isinstance(parsed, list):
+        return None
+    
+    results = [{} for _ in range(count)]
+    for item in parsed:
+        if not isinstance(item, dict):
+            continue
+        item_id = item.pop("id", None)
         try:
-            # حذف کاراکترهای اضافی احتمالی JSON (مانند ```json و ```)
-            content = response.content
-            if "```json" in content:
-                content = content.split("```json")[1].split("```")[0].strip()
-            elif "```" in content:
-                content = content.split("```")[1].strip()
-            
-            key_info = json.loads(content)
-            return key_info
-        except json.JSONDecodeError:
-            return {}
-            
+            item_id = int(item_id)
+        except (TypeError, ValueError):
+            continue
+        if 0 <= item_id < count:
+            results[item_id] = item
+    return results
+
+async def aextract_key_information(user_message, bot_response=""):
+    """استخراج اطلاعات کلیدی از پیام‌ها با استفاده از سرویس AI (در worker های پس‌زمینه)"""
+    try:
+        messages = _build_extraction_messages(user_message, bot_response)
+        started = time.perf_counter()
+        response = await ai_extractor.ainvoke(messages)
+        usage_stats.record("extraction", response, time.perf_counter() - started)
+        return _parse_key_information(response.content)
     except Exception as e:
-        print(f"خطا در استخراج اطلاعات با AI: {e}")
+        logger.error(f"خطا در استخراج اطلاعات با AI: {e}")
         return {}
 
-def get_formatted_memory(memory):
-    """تبدیل حافظه به فرمت مناسب برای ارسال به مدل زبانی"""
-    formatted = ""
+async def aextract_key_information_batch(items):
+    """استخراج اطلاعات کلیدی برای چند جفت (پیام کاربر، پاسخ بات)؛ خروجی: (نتایج، تعداد فراخوانی LLM)"""
+    if not items:
+        return [], 0
+    if len(items) == 1:
+        return [await aextract_key_information(*items[0])], 1
     
-    # افزودن حافظه کوتاه مدت
-    if memory["short_term"]:
-        formatted += "آخرین مکالمات:\n"
-        messages = list(memory["short_term"])
-        # مرتب‌سازی پیام‌ها بر اساس زمان
-        for i, msg in enumerate(messages[-10:]):  # آخرین 10 پیام
-            role = "کاربر" if msg['role'] == 'user' else "بات"
-            content = msg['content']
-            # محدود کردن طول پیام‌ها برای جلوگیری از شلوغی
-            if len(content) > 100:
-                content = content[:100] + "..."
-            formatted += f"{i+1}. {role}: {content}\n"
-    
-    # افزودن اطلاعات کلیدی از حافظه بلند مدت
-    if memory["long_term"]:
-        formatted += "\nاطلاعات کلیدی:\n"
-        for i, item in enumerate(memory["long_term"][-3:]):  # آخرین 3 مورد اطلاعات کلیدی
-            info = item["info"]
-            timestamp = item.get("timestamp", "")
-            formatted += f"مورد {i+1} ({timestamp}):\n"
-            for key, value in info.items():
-                formatted += f"- {key}: {value}\n"
+    # ابتدا یک پرامپت چند‌موردی؛ اگر خروجی قابل تفکیک نبود، استخراج تکی به صورت abatch
+    try:
+        started = time.perf_counter()
+        response = await ai_extractor.ainvoke(_build_batch_extraction_messages(items))
+        usage_stats.record("extraction_batch", response, time.perf_counter() - started)
+        results = _parse_batch_key_information(response.content, len(items))
+        if results is not None:
+            return results, 1
+        logger.warning("خروجی استخراج دسته‌ای قابل تفکیک نبود؛ استخراج تکی انجام می‌شود")
+    except Exception as e:
+        logger.error(f"خطا در استخراج دسته‌ای اطلاعات با AI: {e}")
     
-    return formatted
\ No newline at end of file
+    started = time.perf_counter()
+    try:
+        responses = await ai_extractor.abatch(
+            [_build_extraction_messages(user_message, bot_response) for user_message, bot_response in items],
+            return_exceptions=True
+        )
+    except Exception as e:
+        logger.error(f"خطا در استخراج اطلاعات با AI: {e}")
+        return [{} for _ in items], 1
+    # فراخوانی‌های abatch همزمان اجرا می‌شوند؛ تأخیر هر کدام تقریباً برابر کل دسته است
+    latency = time.perf_counter() - started
+    results = []
+    for response in responses:
+        if isinstance(response, Exception):
+            results.append({})
+            continue
+        usage_stats.record("extraction", response, latency)
+        results.append(_parse_key_information(response.content))
+    return results, 1 + len(items)
+
+def get_formatted_memory(memory, budget=None):
+    """تبدیل حافظه به فرمت مناسب برای ارسال به مدل زبانی (در سقف بودجه توکن)"""
+    text, _ = build_memory_context(memory, budget)
+    return text
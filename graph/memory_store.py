@@ -0,0 +1,330 @@
+import asyncio
+import datetime
+import logging
+from collections import deque
+from pymongo import ReplaceOne
+import config
+from cache import LRUCache
+from db.connection import get_db, run_in_db_executor
+from graph.records import MemoryFact, MemoryMessage, to_epoch
+
+logger = logging.getLogger(__name__)
+
+def new_memory():
+    """ساخت حافظه خالی کوتاه مدت و بلند مدت"""
+    return {
+        "short_term": deque(maxlen=config.MAX_SHORT_TERM_MEMORY),
+        "long_term": [],
+        # اطلاعات کلیدی ادغام شده موارد قدیمی حافظه بلند مدت
+        "fact_sheet": {},
+        # تعداد نوبت‌های گفتگو و آخرین سلام کاربر (برای تشخیص سلام تکراری بدون بررسی تاریخچه)
+        "turns": 0,
+        "last_greeting": None
+    }
+
+def transient_memory():
+    """حافظه خالی موقت (در صورت خطای backend)؛ در کش قرار نمی‌گیرد و هرگز ذخیره نمی‌شود
+    تا جایگزین حافظه واقعی کاربر در پایگاه داده نشود"""
+    memory = new_memory()
+    memory["transient"] = True
+    return memory
+
+def memory_to_document(user_id, memory):
+    """تبدیل حافظه به سند قابل ذخیره در MongoDB"""
+    return {
+        "_id": user_id,
+        "short_term": [msg.to_document() for msg in memory["short_term"]],
+        "long_term": [item.to_document() for item in memory["long_term"]],
+        "fact_sheet": memory.get("fact_sheet", {}),
+        "turns": memory["turns"],
+        "last_greeting": memory["last_greeting"],
+        "updated_at": datetime.datetime.now()
+    }
+
+def memory_from_document(document):
+    """ساخت حافظه از سند ذخیره شده در MongoDB"""
+    memory = new_memory()
+    memory["short_term"].extend(MemoryMessage.from_document(doc) for doc in document.get("short_term", []))
+    memory["long_term"].extend(MemoryFact.from_document(doc) for doc in document.get("long_term", []))
+    memory["fact_sheet"] = document.get("fact_sheet", {})
+    memory["turns"] = document.get("turns", 0)
+    memory["last_greeting"] = document.get("last_greeting")
+    return memory
+
+def memory_from_chat_history(rows):
+    """بازسازی حافظه کوتاه مدت از ردیف‌های chat_history (از جدید به قدیم)"""
+    memory = new_memory()
+    # پیام‌های کاربر پس از آخرین پاسخ بات کنار گذاشته می‌شوند: پیام فعلی پیش از بارگذاری حافظه
+    # در chat_history ذخیره شده و update_memory آن را همراه پاسخش دوباره اضافه می‌کند
+    unanswered = 0
+    while unanswered < len(rows) and rows[unanswered].get("type", "user") == "user":
+        unanswered += 1
+    rows = rows[unanswered:]
+    for row in reversed(rows):
+        memory["short_term"].append(
+            MemoryMessage(row.get("type", "user"), row.get("content", ""), to_epoch(row.get("timestamp")))
+        )
+    return memory
+
+def estimate_memory_size(memory):
+    """تخمین تقریبی حجم حافظه یک کاربر (بایت) برای محدودیت کش"""
+    size = 256
+    for msg in memory["short_term"]:
+        size += 96 + 2 * len(msg.content)
+    for item in memory["long_term"]:
+        size += 128 + 2 * len(str(item.info))
+    if memory.get("fact_sheet"):
+        size += 128 + 2 * len(str(memory["fact_sheet"]))
+    return size
+
+class MemoryBackend:
+    """رابط ذخیره‌ساز دائمی حافظه کاربران (متدها blocking هستند و در executor اجرا می‌شوند)"""
+
+    def load(self, user_id):
+        """دریافت سند حافظه یک کاربر یا None"""
+        raise NotImplementedError
+
+    def save_many(self, documents):
+        """ذخیره (upsert) چند سند حافظه"""
+        raise NotImplementedError
+
+    def load_many(self, user_ids):
+        """دریافت اسناد حافظه چند کاربر به صورت {user_id: سند}"""
+        return {user_id: doc for user_id in user_ids if (doc := self.load(user_id))}
+
+    def load_recent_messages(self, user_id, limit):
+        """آخرین پیام‌های ذخیره شده کاربر (از جدید به قدیم) برای بازسازی حافظه کوتاه مدت"""
+        return []
+
+    def load_recent_messages_bulk(self, user_ids, limit):
+        """آخرین پیام‌های چند کاربر به صورت {user_id: ردیف‌ها}"""
+        return {}
+
+    def recently_active_users(self, since, limit):
+        """شناسه کاربرانی که پس از زمان since پیام داده‌اند"""
+        return []
+
+class MongoMemoryBackend(MemoryBackend):
+    """ذخیره حافظه کاربران در کالکشن memories با کلید user_id"""
+
+    def __init__(self, collection_name="memories"):
+        self.collection_name = collection_name
+
+    def _db(self):
+        db = get_db()
+        if db is None:
+            raise ConnectionError("اتصال به پایگاه داده برقرار نیست")
+        return db
+
+    def _collection(self):
+        return self._db()[self.collection_name]
+
+    def load(self, user_id):
+        return self._collection().find_one({"_id": user_id})
+
+    def save_many(self, documents):
+        if not documents:
+            return
+        self._collection().bulk_write(
+            [ReplaceOne({"_id": doc["_id"]}, doc, upsert=True) for doc in documents],
+            ordered=False
+        )
+
+    def load_many(self, user_ids):
+        cursor = self._collection().find({"_id": {"$in": list(user_ids)}})
+        return {doc["_id"]: doc for doc in cursor}
+
+    def load_recent_messages(self, user_id, limit):
+        # از ایندکس (user_id, timestamp) کالکشن chat_history استفاده می‌کند
+        cursor = self._db().chat_history.find(
+            {"user_id": user_id},
+            {"_id": 0, "type": 1, "content": 1, "timestamp": 1}
+        ).sort("timestamp", -1).limit(limit)
+        return list(cursor)
+
+    def load_recent_messages_bulk(self, user_ids, limit):
+        # یک aggregation با $in به جای یک کوئری برای هر کاربر؛
+        # $topN در هر گروه فقط limit پیام آخر را نگه می‌دارد (نه کل تاریخچه کاربر) - MongoDB 5.2+
+        pipeline = [
+            {"$match": {"user_id": {"$in": list(user_ids)}}},
+            {"$group": {
+                "_id": "$user_id",
+                "messages": {"$topN": {
+                    "n": limit,
+                    "sortBy": {"timestamp": -1},
+                    "output": {"type": "$type", "content": "$content", "timestamp": "$timestamp"}
+                }}
+            }}
+        ]
+        return {row["_id"]: row["messages"] for row in self._db().chat_history.aggregate(pipeline)}
+
+    def recently_active_users(self, since, limit):
+        pipeline = [
+            {"$match": {"timestamp": {"$gte": since}}},
+            {"$group": {"_id": "$user_id", "last": {"$max": "$timestamp"}}},
+            {"$sort": {"last": -1}},
+            {"$limit": limit}
+        ]
+        return [row["_id"] for row in self._db().chat_history.aggregate(pipeline)]
+
+class MemoryStore:
+    """کش LRU/TTL حافظه کاربران با بارگذاری تنبل و نوشتن با تأخیر (write-behind) در backend"""
+
+    def __init__(self, backend, max_entries=None, max_bytes=None, ttl=None, flush_interval=None):
+        self.backend = backend
+        self.flush_interval = flush_interval or config.MEMORY_FLUSH_INTERVAL
+        self._cache = LRUCache(
+            max_entries=max_entries or config.MEMORY_CACHE_MAX_ENTRIES,
+            max_bytes=max_bytes or config.MEMORY_CACHE_MAX_BYTES,
+            ttl=config.MEMORY_CACHE_TTL if ttl is None else ttl,
+            sizeof=estimate_memory_size,
+        )
+        # حافظه‌های تغییر کرده که هنوز در backend نوشته نشده‌اند (حتی اگر از کش حذف شده باشند)
+        self._dirty = {}
+        # بارگذاری‌های در جریان برای جلوگیری از خواندن همزمان یک کاربر
+        self._loading = {}
+        self._flush_task = None
+        self._warmup_task = None
+
+    async def aget(self, user_id):
+        """دریافت حافظه؛ در صورت نبود در کش از backend بارگذاری می‌شود"""
+        memory = self._cached(user_id)
+        if memory is not None:
+            return memory
+
+        loading = self._loading.get(user_id)
+        if loading is None:
+            loading = asyncio.ensure_future(self._load(user_id))
+            self._loading[user_id] = loading
+            loading.add_done_callback(lambda _: self._loading.pop(user_id, None))
+        return await asyncio.shield(loading)
+
+    def _load_blocking(self, user_id):
+        # اگر سند حافظه وجود نداشت (مثلاً اولین اجرا پس از استقرار)، حافظه کوتاه مدت از chat_history ساخته می‌شود
+        document = self.backend.load(user_id)
+        if document:
+            return memory_from_document(document)
+        rows = self.backend.load_recent_messages(user_id, config.MAX_SHORT_TERM_MEMORY)
+        return memory_from_chat_history(rows)
+
+    async def _load(self, user_id):
+        try:
+            loaded = await run_in_db_executor(self._load_blocking, user_id)
+        except Exception as e:
+            # این نوبت بدون حافظه پاسخ داده می‌شود و درخواست بعدی دوباره از backend بارگذاری می‌کند
+            logger.error(f"خطا در بارگذاری حافظه کاربر {user_id}: {e}")
+            return self._cached(user_id) or transient_memory()
+        # ممکن است در حین بارگذاری حافظه‌ای برای کاربر ساخته شده باشد
+        memory = self._cached(user_id)
+        if memory is None:
+            memory = loaded
+            self._cache.set(user_id, memory)
+        return memory
+
+    def _load_many_blocking(self, user_ids):
+        documents = self.backend.load_many(user_ids)
+        missing = [user_id for user_id in user_ids if user_id not in documents]
+        histories = self.backend.load_recent_messages_bulk(missing, config.MAX_SHORT_TERM_MEMORY) if missing else {}
+        loaded = {user_id: memory_from_document(doc) for user_id, doc in documents.items()}
+        for user_id in missing:
+            loaded[user_id] = memory_from_chat_history(histories.get(user_id, []))
+        return loaded
+
+    async def warm_up(self, user_ids):
+        """بارگذاری گروهی حافظه چند کاربر در کش با حداقل تعداد کوئری"""
+        user_ids = [user_id for user_id in user_ids if self._cache.get(user_id, count=False) is None]
+        if not user_ids:
+            return 0
+        loaded = await run_in_db_executor(self._load_many_blocking, user_ids)
+        count = 0
+        for user_id, memory in loaded.items():
+            if self._cached(user_id) is None:
+                self._cache.set(user_id, memory)
+                count += 1
+        return count
+
+    async def warm_up_recent(self, minutes=None, max_users=None):
+        """بارگذاری حافظه کاربرانی که اخیراً فعال بوده‌اند (پس از راه‌اندازی مجدد)"""
+        minutes = config.MEMORY_WARMUP_WINDOW_MINUTES if minutes is None else minutes
+        max_users = max_users or config.MEMORY_WARMUP_MAX_USERS
+        if minutes <= 0:
+            return 0
+        since = datetime.datetime.now() - datetime.timedelta(minutes=minutes)
+        try:
+            user_ids = await run_in_db_executor(self.backend.recently_active_users, since, max_users)
+            count = await self.warm_up(user_ids)
+        except Exception as e:
+            logger.error(f"خطا در بارگذاری اولیه حافظه کاربران: {e}")
+            return 0
+        logger.info(f"حافظه {count} کاربر فعال اخیر بارگذاری شد")
+        return count
+
+    def _cached(self, user_id):
+        memory = self._cache.get(user_id)
+        if memory is None and user_id in self._dirty:
+            # حافظه‌ای که از کش حذف شده ولی هنوز ذخیره نشده، دوباره به کش برمی‌گردد
+            memory = self._dirty[user_id]
+            self._cache.set(user_id, memory)
+        return memory
+
+    def mark_dirty(self, user_id, memory):
+        """علامت‌گذاری حافظه برای نوشتن در flush بعدی"""
+        if memory.get("transient"):
+            return
+        # حافظه‌ای که از کش حذف شده (و شاید نسخه جدیدتری از آن بارگذاری شده باشد) ذخیره نمی‌شود
+        # تا روی نسخه جدیدتر در backend نوشته نشود
+        current = self._cache.get(user_id, count=False)
+        if current is None:
+            current = self._dirty.get(user_id)
+        if current is not memory:
+            logger.debug(f"تغییر حافظه قدیمی کاربر {user_id} (خارج از کش) نادیده گرفته شد")
+            return
+        self._dirty[user_id] = memory
+        self._cache.resize(user_id)
+
+    async def flush(self):
+        """نوشتن همه حافظه‌های تغییر کرده در backend"""
+        if not self._dirty:
+            return 0
+        dirty, self._dirty = self._dirty, {}
+        documents = [memory_to_document(user_id, memory) for user_id, memory in dirty.items()]
+        try:
+            await run_in_db_executor(self.backend.save_many, documents)
+        except Exception as e:
+            logger.error(f"خطا در ذخیره حافظه کاربران: {e}")
+            # بازگرداندن به لیست تغییرات (مگر اینکه نسخه جدیدتری ثبت شده باشد)
+            for user_id, memory in dirty.items():
+                self._dirty.setdefault(user_id, memory)
+            return 0
+        return len(documents)
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def start(self):
+        """شروع نوشتن دوره‌ای تغییرات و بارگذاری اولیه کاربران فعال در پس‌زمینه"""
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_loop(), name="memory-flush")
+        if self._warmup_task is None:
+            self._warmup_task = asyncio.create_task(self.warm_up_recent(), name="memory-warmup")
+
+    async def stop(self):
+        """توقف نوشتن دوره‌ای و ذخیره تغییرات باقی‌مانده"""
+        if self._warmup_task is not None:
+            self._warmup_task.cancel()
+            await asyncio.gather(self._warmup_task, return_exceptions=True)
+            self._warmup_task = None
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            await asyncio.gather(self._flush_task, return_exceptions=True)
+            self._flush_task = None
+        flushed = await self.flush()
+        logger.info(f"حافظه کاربران ذخیره شد ({flushed} مورد): {self.stats()}")
+
+    def stats(self):
+        """شمارنده‌های کش حافظه"""
+        stats = self._cache.stats()
+        stats["dirty"] = len(self._dirty)
+        return stats
@@ -0,0 +1,31 @@
+from langchain_openai import ChatOpenAI
+import config
+from graph.resilience import ResilientLLM
+
+# نمونه‌های ساخته شده مدل به تفکیک کاربرد (هر کاربرد فقط یک بار ساخته می‌شود)
+_models = {}
+
+def get_model(purpose):
+    """مدل زبانی یک نود/کاربرد بر اساس config.MODEL_REGISTRY (با deadline، تلاش مجدد و circuit breaker)"""
+    model = _models.get(purpose)
+    if model is None:
+        spec = config.MODEL_REGISTRY[purpose]
+        timeout = spec.get("timeout", 60)
+        chat_model = ChatOpenAI(
+            model=spec["model"],
+            temperature=spec.get("temperature", 0.7),
+            max_tokens=spec.get("max_tokens"),
+            timeout=timeout,
+            # تلاش مجدد در ResilientLLM و در محدوده deadline هر فراخوانی انجام می‌شود
+            max_retries=0,
+            api_key=config.OPENAI_API_KEY,
+            # usage_metadata (از جمله توکن‌های کش شده) در پاسخ‌های جریانی هم برگردانده شود
+            stream_usage=True,
+        )
+        model = ResilientLLM(chat_model, purpose, timeout)
+        _models[purpose] = model
+    return model
+
+def get_model_stats():
+    """شمارنده‌های پایداری (تلاش مجدد، hedge، breaker) هر مدل"""
+    return {purpose: model.get_stats() for purpose, model in _models.items()}
@@ -1,7 +1,18 @@
 import logging
+import time
 from langchain.schema import HumanMessage, AIMessage
-from langchain.prompts import ChatPromptTemplate
 from db.models import save_chat_message
+from graph.response_cache import response_cache
+from graph.context import build_memory_context
+from graph.fact_index import fact_index_store
+from graph.prompts import STUDY_PLAN_PROMPT, PERFORMANCE_ANALYSIS_PROMPT, GENERAL_CHAT_PROMPT, PERSONAL_GREETING
+from graph.usage import usage_stats
+from graph.tools import bind_tools
+from graph.resilience import LLMUnavailableError
+from graph.intent import classify_intent, exam_scores
+from graph.matcher import match_keywords, PROFILE_KEYWORDS
+from bot.utils import parse_exam_results
+import config
 
 logger = logging.getLogger(__name__)
 
@@ -20,47 +31,111 @@ def profile_node(state):
     # پروفایل کامل است، ادامه می‌دهیم
     return state
 
+def greet(state, text):
+    """افزودن خوشامدگویی شخصی (state["greeting"]) به ابتدای پاسخ؛ پاسخ جایگزین خطا بدون خوشامدگویی است"""
+    if not state.get("greeting") or state.get("degraded"):
+        return text
+    return state["greeting"] + text
+
+async def generate_response(llm, messages, state, node):
+    """فراخوانی مدل زبانی؛ اگر state شامل on_token باشد، پاسخ به صورت جریانی (astream) دریافت می‌شود"""
+    on_token = state.get("on_token")
+    started = time.perf_counter()
+    if on_token is None:
+        response = await llm.ainvoke(messages)
+        usage_stats.record(node, response, time.perf_counter() - started)
+        return response
+    
+    # تجمیع بخش‌های پاسخ (متن، فراخوانی ابزارها و مصرف توکن) و ارسال متن تجمعی پس از رسیدن هر بخش
+    response = None
+    async for chunk in llm.astream(messages):
+        response = chunk if response is None else response + chunk
+        if chunk.content:
+            await on_token(greet(state, response.content))
+    usage_stats.record(node, response, time.perf_counter() - started)
+    return response
+
+async def run_llm(llms, messages, state, node):
+    """اجرای مدل با امکان فراخوانی ابزار؛ خروجی: متن پاسخ، یا None اگر مدل اجرای ابزار خواسته باشد
+
+    llms: جفت (مدل با ابزار، مدل بدون فراخوانی ابزار برای پاسخ نهایی)
+    """
+    tool_llm, final_llm = llms
+    # پس از اجرای ابزارها، گفتگو با همان پیام‌ها و نتایج ابزارها ادامه می‌یابد
+    messages = state.get("llm_messages") or messages
+    llm = tool_llm if state.get("tool_rounds", 0) < config.MAX_TOOL_ROUNDS else final_llm
+    try:
+        response = await generate_response(llm, messages, state, node)
+    except LLMUnavailableError as e:
+        # پاسخ جایگزین به جای پیام خطای عمومی؛ این پاسخ در کش و حافظه ذخیره نمی‌شود
+        logger.error(f"پاسخ جایگزین برای {node}: {e}")
+        state["llm_messages"] = None
+        state["degraded"] = True
+        if state.get("on_token") is not None:
+            await state["on_token"](config.LLM_DEGRADED_REPLY)
+        return config.LLM_DEGRADED_REPLY
+    if getattr(response, "tool_calls", None) and llm is not final_llm:
+        state["llm_messages"] = list(messages) + [response]
+        return None
+    state["llm_messages"] = None
+    return response.content
+
+async def resume_after_tools(llms, state, node):
+    """ادامه پاسخ نود با نتایج ابزارهای اجرا شده در نود tools (این پاسخ‌ها در کش پاسخ ذخیره نمی‌شوند)"""
+    response = await run_llm(llms, state["llm_messages"], state, node)
+    if response is not None:
+        state["response"] = greet(state, response)
+    return state
+
+def bind_node_tools(llm, tools=None):
+    """مدل‌های یک نود: با ابزار و بدون فراخوانی ابزار (برای پاسخ نهایی پس از سقف دورها)"""
+    return bind_tools(llm, tools), bind_tools(llm, tools, tool_choice="none")
+
+async def cached_response(node, prompt_values, state):
+    """جستجوی پاسخ در کش پاسخ‌ها؛ در حالت جریانی، پاسخ کش شده یکجا نمایش داده می‌شود"""
+    if not config.RESPONSE_CACHE_ENABLED:
+        return None, None
+    cached, vector = await response_cache.lookup(node, prompt_values)
+    if cached is not None and state.get("on_token") is not None:
+        await state["on_token"](greet(state, cached))
+    return cached, vector
+
 def router_node(state):
     """گره تشخیص نوع درخواست و مسیریابی"""
-    # نوع درخواست از قبل تعیین شده است (در process_with_langgraph)
+    # درخواست‌های دستوری (/plan و /analysis) از قبل نوع مشخص دارند
+    if not config.INTENT_ROUTER_ENABLED or state.get("request_type", "general_chat") != "general_chat":
+        return state
+    
+    # تشخیص محلی نوع پیام‌های آزاد (بدون فراخوانی LLM)
+    message = state["messages"][-1].content if state["messages"] else ""
+    intent, score = classify_intent(message)
+    if intent == "study_plan":
+        state["request_type"] = "study_plan"
+    elif intent == "performance_analysis":
+        # تحلیل عملکرد فقط وقتی ممکن است که نتایج آزمون (حداقل یک نمره عددی) در خود پیام آمده باشد؛
+        # سؤال‌هایی مثل "سوال: رتبه ۵۰۰۰ برای پزشکی کافیه؟" در گفتگوی عمومی می‌مانند
+        exam_results = exam_scores(parse_exam_results(message))
+        if exam_results:
+            state["exam_results"] = exam_results
+            state["request_type"] = "performance_analysis"
+    if state["request_type"] != "general_chat":
+        logger.debug(f"نوع درخواست تشخیص داده شد: {state['request_type']} (امتیاز {score:.1f})")
     return state
 
-def study_plan_node(llm):
+def study_plan_node(llm, tools=None):
     """گره ایجاد برنامه مطالعاتی"""
-    def generate_study_plan(state):
+    llms = bind_node_tools(llm, tools)
+    
+    async def generate_study_plan(state):
+        if state.get("llm_messages"):
+            return await resume_after_tools(llms, state, "study_plan")
+        
         user_profile = state["user_profile"]
         message = state["messages"][-1].content if state["messages"] else ""
         
-        # ساخت پرامپت برای LLM
-        template = """
-        شما مشاور تحصیلی دانش‌آموز هستید و باید یک برنامه مطالعاتی شخصی‌سازی شده ایجاد کنید.
-        
-        اطلاعات دانش‌آموز:
-        - نام: {name}
-        - پایه تحصیلی: {grade}
-        - تاریخ کنکور: {exam_date}
-        - دروس مورد علاقه: {favorite_subjects}
-        - دروس مورد نفرت: {disliked_subjects}
-        - رشته مورد نظر: {desired_major}
-        
-        درخواست دانش‌آموز: {message}
-        
-        لطفاً یک برنامه مطالعاتی دقیق و مناسب با توجه به اطلاعات فوق ارائه دهید.
-        پاسخ را به فارسی بنویسید و لحن دوستانه و مشاورانه داشته باشید.
-        برنامه باید شامل موارد زیر باشد:
-        1. زمان‌بندی روزانه
-        2. اولویت‌بندی دروس
-        3. توصیه‌های خاص برای دروس مورد نفرت
-        4. استراتژی‌های مطالعه مؤثر
-        
-        از ایموجی استفاده کنید تا پاسخ جذاب‌تر شود. 📚✏️⏰📝
-        """
-        
         # پر کردن پرامپت با اطلاعات پروفایل کاربر
-        prompt = ChatPromptTemplate.from_template(template)
-        
+        state["greeting"] = PERSONAL_GREETING.format(name=user_profile.get("name", "دانش‌آموز"))
         prompt_values = {
-            "name": user_profile.get("name", "دانش‌آموز"),
             "grade": user_profile.get("grade", "نامشخص"),
             "exam_date": user_profile.get("exam_date", "نامشخص"),
             "favorite_subjects": ", ".join(user_profile.get("favorite_subjects", [])),
@@ -69,56 +144,44 @@ def study_plan_node(llm):
             "message": message
         }
         
+        # پاسخ درخواست‌های مشابه قبلی از کش
+        cached, vector = await cached_response("study_plan", prompt_values, state)
+        if cached is not None:
+            state["response"] = greet(state, cached)
+            return state
+        
         # دریافت پاسخ از LLM
-        messages = prompt.format_messages(**prompt_values)
-        response = llm.invoke(messages)
+        messages = STUDY_PLAN_PROMPT.format_messages(**prompt_values)
+        response = await run_llm(llms, messages, state, "study_plan")
+        if response is None:
+            # اجرای ابزارهای درخواست شده در نود tools و بازگشت به همین نود
+            return state
+        if config.RESPONSE_CACHE_ENABLED and not state.get("degraded"):
+            await response_cache.store("study_plan", prompt_values, response, vector)
         
         # ذخیره پاسخ در state
-        state["response"] = response.content
+        state["response"] = greet(state, response)
         return state
     
     return generate_study_plan
 
-def performance_analysis_node(llm):
+def performance_analysis_node(llm, tools=None):
     """گره تحلیل عملکرد آزمون"""
-    def analyze_performance(state):
+    llms = bind_node_tools(llm, tools)
+    
+    async def analyze_performance(state):
+        if state.get("llm_messages"):
+            return await resume_after_tools(llms, state, "performance_analysis")
+        
         user_profile = state["user_profile"]
         exam_results = state.get("exam_results", {})
         
-        # ساخت پرامپت برای LLM
-        template = """
-        شما مشاور تحصیلی دانش‌آموز هستید و باید نتایج آزمون او را تحلیل کنید.
-        
-        اطلاعات دانش‌آموز:
-        - نام: {name}
-        - پایه تحصیلی: {grade}
-        - تاریخ کنکور: {exam_date}
-        - دروس مورد علاقه: {favorite_subjects}
-        - دروس مورد نفرت: {disliked_subjects}
-        - رشته مورد نظر: {desired_major}
-        
-        نتایج آزمون:
-        {exam_results}
-        
-        لطفاً تحلیل دقیقی از نتایج آزمون با توجه به اطلاعات فوق ارائه دهید.
-        پاسخ را به فارسی بنویسید و لحن دوستانه و مشاورانه داشته باشید.
-        تحلیل باید شامل موارد زیر باشد:
-        1. نقاط قوت و ضعف
-        2. مقایسه عملکرد در دروس مختلف
-        3. توصیه‌های بهبود برای دروس ضعیف‌تر
-        4. استراتژی‌های مطالعه برای پیشرفت
-        
-        از ایموجی استفاده کنید تا پاسخ جذاب‌تر شود. 📊📈📉📚
-        """
-        
         # آماده‌سازی متن نتایج آزمون
         exam_results_text = "\n".join([f"- {subject}: {score}" for subject, score in exam_results.items()])
         
         # پر کردن پرامپت با اطلاعات پروفایل کاربر و نتایج آزمون
-        prompt = ChatPromptTemplate.from_template(template)
-        
+        state["greeting"] = PERSONAL_GREETING.format(name=user_profile.get("name", "دانش‌آموز"))
         prompt_values = {
-            "name": user_profile.get("name", "دانش‌آموز"),
             "grade": user_profile.get("grade", "نامشخص"),
             "exam_date": user_profile.get("exam_date", "نامشخص"),
             "favorite_subjects": ", ".join(user_profile.get("favorite_subjects", [])),
@@ -127,53 +190,60 @@ def performance_analysis_node(llm):
             "exam_results": exam_results_text
         }
         
+        # پاسخ تحلیل نتایج یکسان از کش
+        cached, vector = await cached_response("performance_analysis", prompt_values, state)
+        if cached is not None:
+            state["response"] = greet(state, cached)
+            return state
+        
         # دریافت پاسخ از LLM
-        messages = prompt.format_messages(**prompt_values)
-        response = llm.invoke(messages)
+        messages = PERFORMANCE_ANALYSIS_PROMPT.format_messages(**prompt_values)
+        response = await run_llm(llms, messages, state, "performance_analysis")
+        if response is None:
+            # اجرای ابزارهای درخواست شده در نود tools و بازگشت به همین نود
+            return state
+        if config.RESPONSE_CACHE_ENABLED and not state.get("degraded"):
+            await response_cache.store("performance_analysis", prompt_values, response, vector)
         
         # ذخیره پاسخ در state
-        state["response"] = response.content
+        state["response"] = greet(state, response)
         return state
     
     return analyze_performance
 
-def general_chat_node(llm):
-    """گره پاسخ به پیام‌های عمومی"""
-    def generate_general_response(state):
-        user_profile = state["user_profile"]
+def general_chat_node(llm, tools=None, short_llm=None):
+    """گره پاسخ به پیام‌های عمومی؛ پیام‌های کوتاه با short_llm (مدل کوچک‌تر با سقف توکن کمتر) پاسخ داده می‌شوند"""
+    llms = bind_node_tools(llm, tools)
+    short_llms = bind_node_tools(short_llm, tools) if short_llm is not None else llms
+    
+    async def generate_general_response(state):
         message = state["messages"][-1].content if state["messages"] else ""
-        memory = state["memory"]
-        
-        # دریافت حافظه کوتاه مدت به صورت فرمت‌بندی شده
-        from graph.memory import get_formatted_memory
-        memory_context = get_formatted_memory(memory)
         
-        # تشخیص اطلاعات مرتبط با پیام
-        relevant_info = get_relevant_profile_info(message, user_profile)
-        
-        # تعیین طول پاسخ بر اساس طول پیام کاربر
+        # تعیین مدل و طول پاسخ بر اساس طول پیام کاربر
         is_short_message = len(message.split()) < 10
+        node, node_llms = ("general_chat_short", short_llms) if is_short_message else ("general_chat", llms)
         length_instruction = "پاسخ را کوتاه و مختصر بنویسید (حداکثر 2-3 جمله)." if is_short_message else ""
         
-        # ساخت پرامپت هوشمند برای LLM
-        template = """
-        شما مشاور تحصیلی دانش‌آموز هستید و باید به سؤال یا پیام او پاسخ دهید.
+        if state.get("llm_messages"):
+            return await resume_after_tools(node_llms, state, node)
         
-        اطلاعات دانش‌آموز:
-        - نام: {name}
-        
-        {relevant_info_text}
+        user_profile = state["user_profile"]
+        memory = state["memory"]
         
-        تاریخچه مکالمات قبلی:
-        {memory_context}
+        # بازیابی اطلاعات کلیدی مرتبط با پیام از ایندکس برداری کاربر
+        relevant_facts = []
+        user_id = user_profile.get("user_id")
+        if config.FACT_INDEX_ENABLED and user_id is not None and (memory.get("long_term") or memory.get("fact_sheet")):
+            results = await fact_index_store.search(user_id, message, memory)
+            relevant_facts = [text for text, _ in results]
         
-        پیام جدید دانش‌آموز: {message}
+        # متن حافظه (مکالمات اخیر و اطلاعات کلیدی) در سقف بودجه توکن
+        memory_context, memory_tokens = build_memory_context(memory, relevant_facts=relevant_facts)
+        state["memory_tokens"] = memory_tokens
+        logger.debug(f"توکن‌های متن حافظه: {memory_tokens}")
         
-        مهم: به مکالمات قبلی توجه کنید و از تکرار خوشامدگویی یا سلام در صورتی که قبلاً انجام شده خودداری کنید.
-        پاسخ را به فارسی بنویسید و لحن دوستانه و محاوره‌ای داشته باشید.
-        تنها به پیام فعلی کاربر پاسخ دهید و به صورت طبیعی مکالمه را ادامه دهید.
-        {length_instruction}
-        """
+        # تشخیص اطلاعات مرتبط با پیام
+        relevant_info = get_relevant_profile_info(message, user_profile)
         
         # آماده‌سازی اطلاعات مرتبط به فرمت مناسب
         relevant_info_text = ""
@@ -193,8 +263,6 @@ def general_chat_node(llm):
             relevant_info_text += f"- {key_name}: {value}\n"
             
         # پر کردن پرامپت
-        prompt = ChatPromptTemplate.from_template(template)
-        
         prompt_values = {
             "name": user_profile.get("name", "دانش‌آموز"),
             "message": message,
@@ -204,11 +272,13 @@ def general_chat_node(llm):
         }
         
         # دریافت پاسخ از LLM
-        messages = prompt.format_messages(**prompt_values)
-        response = llm.invoke(messages)
+        messages = GENERAL_CHAT_PROMPT.format_messages(**prompt_values)
+        response = await run_llm(node_llms, messages, state, node)
+        if response is None:
+            return state
         
         # ذخیره پاسخ در state
-        state["response"] = response.content
+        state["response"] = response
         return state
     
     return generate_general_response
@@ -217,23 +287,9 @@ def get_relevant_profile_info(message, user_profile):
     """تشخیص اطلاعات پروفایل مرتبط با پیام کاربر"""
     relevant_info = {"name": user_profile.get("name", "دانش‌آموز")}
     
-    # کلمات کلیدی برای هر بخش پروفایل
-    keywords = {
-        "grade": ["پایه", "کلاس", "سال تحصیلی", "دهم", "یازدهم", "دوازدهم"],
-        "exam_date": ["کنکور", "آزمون", "تاریخ", "زمان", "امتحان"],
-        "favorite_subjects": ["علاقه", "دوست دارم", "درس مورد علاقه", "علاقمندم"],
-        "disliked_subjects": ["متنفر", "بدم میاد", "سخت", "مشکل دارم", "ضعیف"],
-        "desired_major": ["رشته", "دانشگاه", "هدف", "آینده", "ادامه تحصیل", "تحصیل"]
-    }
-    
-    # تبدیل پیام به حروف کوچک برای تطبیق آسان‌تر
-    message_lower = message.lower()
-    
-    # بررسی کلمات کلیدی در پیام
-    for info_key, key_list in keywords.items():
-        for keyword in key_list:
-            if keyword in message_lower:
-                relevant_info[info_key] = user_profile.get(info_key, "نامشخص")
-                break
+    # همه کلمات کلیدی پروفایل با یک بار پیمایش پیام (Aho-Corasick) بررسی می‌شوند
+    for info_key in match_keywords(message):
+        if info_key in PROFILE_KEYWORDS:
+            relevant_info[info_key] = user_profile.get(info_key, "نامشخص")
     
-    return relevant_info
\ No newline at end of file
+    return relevant_info
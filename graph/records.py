@@ -0,0 +1,70 @@
+import datetime
+import sys
+
+# قالب نمایش زمان (فقط هنگام نیاز ساخته می‌شود)
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+def to_epoch(value):
+    """تبدیل زمان (datetime، رشته قالب قدیمی یا عدد) به ثانیه epoch صحیح"""
+    if value is None or value == "":
+        return 0
+    if isinstance(value, (int, float)):
+        return int(value)
+    if isinstance(value, datetime.datetime):
+        return int(value.timestamp())
+    try:
+        return int(datetime.datetime.strptime(value, TIMESTAMP_FORMAT).timestamp())
+    except (TypeError, ValueError):
+        return 0
+
+def format_timestamp(ts):
+    """نمایش زمان epoch با قالب TIMESTAMP_FORMAT"""
+    return datetime.datetime.fromtimestamp(ts).strftime(TIMESTAMP_FORMAT) if ts else ""
+
+class MemoryMessage:
+    """یک پیام حافظه کوتاه مدت"""
+    __slots__ = ("role", "content", "ts")
+
+    def __init__(self, role, content, ts):
+        self.role = sys.intern(role)
+        self.content = content
+        self.ts = ts
+
+    @property
+    def timestamp(self):
+        return format_timestamp(self.ts)
+
+    def to_document(self):
+        return {"role": self.role, "content": self.content, "ts": self.ts}
+
+    @classmethod
+    def from_document(cls, document):
+        # اسناد قدیمی زمان را به صورت رشته در فیلد timestamp دارند
+        ts = document.get("ts", document.get("timestamp"))
+        return cls(document.get("role", "user"), document.get("content", ""), to_epoch(ts))
+
+    def __repr__(self):
+        return f"MemoryMessage({self.role!r}, {self.content!r}, {self.ts})"
+
+class MemoryFact:
+    """یک مورد اطلاعات کلیدی حافظه بلند مدت"""
+    __slots__ = ("info", "ts")
+
+    def __init__(self, info, ts):
+        self.info = info
+        self.ts = ts
+
+    @property
+    def timestamp(self):
+        return format_timestamp(self.ts)
+
+    def to_document(self):
+        return {"info": self.info, "ts": self.ts}
+
+    @classmethod
+    def from_document(cls, document):
+        ts = document.get("ts", document.get("timestamp"))
+        return cls(document.get("info", {}), to_epoch(ts))
+
+    def __repr__(self):
+        return f"MemoryFact({self.info!r}, {self.ts})"
@@ -0,0 +1,272 @@
+import asyncio
+import logging
+import random
+import time
+from collections import deque
+import openai
+import config
+
+logger = logging.getLogger(__name__)
+
+class LLMUnavailableError(RuntimeError):
+    """فراخوانی مدل پس از همه تلاش‌ها ناموفق بود یا circuit breaker باز است"""
+
+class CircuitOpenError(LLMUnavailableError):
+    """circuit breaker باز است و فراخوانی بدون ارسال درخواست رد شد"""
+
+# خطاهای موقتی که ارزش تلاش مجدد دارند (APITimeoutError زیرکلاس APIConnectionError است)
+RETRYABLE_ERRORS = (
+    asyncio.TimeoutError,
+    openai.APIConnectionError,
+    openai.RateLimitError,
+    openai.InternalServerError,
+)
+
+class CircuitBreaker:
+    """پس از failure_threshold خطای پشت سر هم باز می‌شود و پس از reset_timeout یک درخواست آزمایشی را می‌پذیرد"""
+
+    def __init__(self, failure_threshold=None, reset_timeout=None):
+        self.failure_threshold = failure_threshold or config.LLM_BREAKER_FAILURE_THRESHOLD
+        self.reset_timeout = config.LLM_BREAKER_RESET_TIMEOUT if reset_timeout is None else reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self):
+        """آیا درخواست جدید مجاز است"""
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self._trial_running:
+            self._trial_running = True
+            return True
+        return False
+
+    def release_trial(self):
+        """آزاد کردن نوبت درخواست آزمایشی که بدون نتیجه (مثلاً با لغو) پایان یافته است"""
+        self._trial_running = False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self._trial_running or (self.opened_at is None and self.failures >= self.failure_threshold):
+            logger.warning(f"circuit breaker مدل زبانی باز شد ({self.failures} خطای پشت سر هم)")
+            self.opened_at = time.monotonic()
+        self._trial_running = False
+
+class LatencyTracker:
+    """نگهداری تأخیرهای اخیر موفق برای محاسبه آستانه hedge"""
+
+    def __init__(self, window=200):
+        self._samples = deque(maxlen=window)
+
+    def record(self, latency):
+        self._samples.append(latency)
+
+    def percentile(self, q):
+        if len(self._samples) < config.LLM_HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+class ResilientLLM:
+    """پوشش مدل زبانی با deadline هر فراخوانی، تلاش مجدد با jitter، درخواست hedge و circuit breaker"""
+
+    def __init__(self, model, name, timeout, breaker=None, tracker=None, stats=None):
+        self.model = model
+        self.name = name
+        self.timeout = timeout
+        # breaker، آمار تأخیر و شمارنده‌ها بین نسخه‌های متصل به ابزار یک مدل مشترک هستند
+        self.breaker = breaker or CircuitBreaker()
+        self.tracker = tracker or LatencyTracker()
+        self.stats = stats if stats is not None else {
+            "calls": 0, "retries": 0, "timeouts": 0, "failures": 0,
+            "short_circuited": 0, "hedged": 0, "hedge_wins": 0
+        }
+
+    def bind_tools(self, tools, **kwargs):
+        return ResilientLLM(
+            self.model.bind_tools(tools, **kwargs), self.name, self.timeout,
+            self.breaker, self.tracker, self.stats
+        )
+
+    def _check_breaker(self):
+        """بررسی breaker؛ خروجی: آیا این فراخوانی درخواست آزمایشی حالت half_open است"""
+        self.stats["calls"] += 1
+        if not self.breaker.allow():
+            self.stats["short_circuited"] += 1
+            raise CircuitOpenError(f"مدل {self.name} موقتاً در دسترس نیست")
+        return self.breaker.state == "half_open"
+
+    def _backoff(self, attempt):
+        delay = min(config.LLM_RETRY_MAX_DELAY, config.LLM_RETRY_BASE_DELAY * 2 ** (attempt - 1))
+        return delay * random.uniform(0.5, 1.5)
+
+    def _should_retry(self, error, attempt, remaining):
+        """در صورت امکان تلاش مجدد، مدت انتظار و در غیر این صورت None"""
+        if not isinstance(error, RETRYABLE_ERRORS) or attempt > config.LLM_MAX_RETRIES:
+            return None
+        delay = self._backoff(attempt)
+        return delay if delay < remaining else None
+
+    def _fail(self, error):
+        self.stats["failures"] += 1
+        # فقط خطاهای زیرساختی (قطعی، کندی، محدودیت نرخ) در وضعیت breaker اثر دارند؛
+        # خطای درخواست (مثلاً ورودی نامعتبر) یعنی سرویس پاسخ داده است
+        if isinstance(error, RETRYABLE_ERRORS):
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        if isinstance(error, asyncio.TimeoutError):
+            self.stats["timeouts"] += 1
+        return LLMUnavailableError(f"فراخوانی مدل {self.name} ناموفق بود: {error!r}")
+
+    async def _attempt(self, messages, deadline, kwargs):
+        """یک تلاش با امکان درخواست hedge؛ اولین پاسخ موفق برگردانده می‌شود"""
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        tasks = {asyncio.ensure_future(self.model.ainvoke(messages, **kwargs))}
+        primary = next(iter(tasks))
+        hedge_after = self.tracker.percentile(config.LLM_HEDGE_PERCENTILE) if config.LLM_HEDGING_ENABLED else None
+        error = None
+        try:
+            if hedge_after is not None and started + hedge_after < deadline:
+                done, _ = await asyncio.wait(tasks, timeout=hedge_after)
+                if not done:
+                    self.stats["hedged"] += 1
+                    tasks.add(asyncio.ensure_future(self.model.ainvoke(messages, **kwargs)))
+            while tasks:
+                done, tasks = await asyncio.wait(
+                    tasks, timeout=max(0, deadline - loop.time()), return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    raise asyncio.TimeoutError()
+                for task in done:
+                    if task.exception() is None:
+                        self.tracker.record(loop.time() - started)
+                        if task is not primary:
+                            self.stats["hedge_wins"] += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def ainvoke(self, messages, **kwargs):
+        trial = self._check_breaker()
+        try:
+            return await self._ainvoke(messages, kwargs)
+        finally:
+            # در صورت لغو، نتیجه‌ای ثبت نشده و نوبت آزمایشی باید آزاد شود
+            if trial:
+                self.breaker.release_trial()
+
+    async def _ainvoke(self, messages, kwargs):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.timeout
+        attempt = 0
+        while True:
+            try:
+                result = await self._attempt(messages, deadline, kwargs)
+            except Exception as e:
+                attempt += 1
+                delay = self._should_retry(e, attempt, deadline - loop.time())
+                if delay is None:
+                    raise self._fail(e) from e
+                self.stats["retries"] += 1
+                logger.warning(f"خطای موقت مدل {self.name} ({e!r})؛ تلاش مجدد پس از {delay:.2f} ثانیه")
+                await asyncio.sleep(delay)
+                continue
+            self.breaker.record_success()
+            return result
+
+    async def astream(self, messages, **kwargs):
+        """پاسخ جریانی با deadline؛ تلاش مجدد فقط تا پیش از رسیدن اولین بخش پاسخ"""
+        trial = self._check_breaker()
+        stream = self._astream(messages, kwargs)
+        try:
+            async for chunk in stream:
+                yield chunk
+        finally:
+            try:
+                await stream.aclose()
+            finally:
+                # لغو یا رها شدن generator (GeneratorExit) نتیجه‌ای ثبت نمی‌کند
+                if trial:
+                    self.breaker.release_trial()
+
+    async def _astream(self, messages, kwargs):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.timeout
+        attempt = 0
+        while True:
+            emitted = False
+            stream = self.model.astream(messages, **kwargs)
+            try:
+                while True:
+                    try:
+                        chunk = await asyncio.wait_for(stream.__anext__(), max(0, deadline - loop.time()))
+                    except StopAsyncIteration:
+                        break
+                    emitted = True
+                    yield chunk
+            except Exception as e:
+                attempt += 1
+                delay = None if emitted else self._should_retry(e, attempt, deadline - loop.time())
+                if delay is None:
+                    raise self._fail(e) from e
+                self.stats["retries"] += 1
+                logger.warning(f"خطای موقت مدل {self.name} ({e!r})؛ تلاش مجدد پس از {delay:.2f} ثانیه")
+                await asyncio.sleep(delay)
+                continue
+            finally:
+                await stream.aclose()
+            self.breaker.record_success()
+            return
+
+    async def abatch(self, inputs, return_exceptions=False, **kwargs):
+        return await asyncio.gather(
+            *(self.ainvoke(messages, **kwargs) for messages in inputs), return_exceptions=return_exceptions
+        )
+
+    def invoke(self, messages, **kwargs):
+        """نسخه همزمان (بدون hedge) برای استفاده خارج از event loop"""
+        trial = self._check_breaker()
+        try:
+            return self._invoke(messages, kwargs)
+        finally:
+            if trial:
+                self.breaker.release_trial()
+
+    def _invoke(self, messages, kwargs):
+        deadline = time.monotonic() + self.timeout
+        attempt = 0
+        while True:
+            try:
+                result = self.model.invoke(messages, **kwargs)
+            except Exception as e:
+                attempt += 1
+                delay = self._should_retry(e, attempt, deadline - time.monotonic())
+                if delay is None:
+                    raise self._fail(e) from e
+                self.stats["retries"] += 1
+                time.sleep(delay)
+                continue
+            self.breaker.record_success()
+            return result
+
+    def get_stats(self):
+        return dict(self.stats, breaker=self.breaker.state)
@@ -0,0 +1,121 @@
+import hashlib
+import json
+import logging
+import math
+import config
+from cache import LRUCache
+from graph.text import normalize_text
+
+logger = logging.getLogger(__name__)
+
+def _hash(data):
+    return hashlib.sha256(json.dumps(data, ensure_ascii=False, sort_keys=True).encode()).hexdigest()
+
+def _normalize_vector(vector):
+    norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+    return [x / norm for x in vector]
+
+class ResponseCache:
+    """کش پاسخ مدل بر اساس ورودی‌های یکسان‌سازی شده پرامپت، با تطابق دقیق و (اختیاری) شباهت معنایی پیام"""
+
+    def __init__(self, max_entries=None, ttl=None, similarity_threshold=None, embeddings=None):
+        self._cache = LRUCache(
+            max_entries=max_entries or config.RESPONSE_CACHE_MAX_ENTRIES,
+            ttl=config.RESPONSE_CACHE_TTL if ttl is None else ttl,
+        )
+        self.similarity_threshold = (
+            config.RESPONSE_CACHE_SIMILARITY_THRESHOLD if similarity_threshold is None else similarity_threshold
+        )
+        self._embeddings = embeddings
+        # بردارهای پیام به تفکیک سایر ورودی‌ها: context_key -> {key: بردار نرمال شده}
+        self._vectors = {}
+        self.stats = {}
+
+    @property
+    def semantic_enabled(self):
+        return self.similarity_threshold > 0
+
+    def _get_embeddings(self):
+        if self._embeddings is None:
+            from langchain_openai import OpenAIEmbeddings
+            self._embeddings = OpenAIEmbeddings(model=config.EMBEDDING_MODEL, api_key=config.OPENAI_API_KEY)
+        return self._embeddings
+
+    def _node_stats(self, node):
+        return self.stats.setdefault(node, {"hits": 0, "semantic_hits": 0, "misses": 0})
+
+    @staticmethod
+    def _keys(node, prompt_values, text_field):
+        values = {k: normalize_text(v) for k, v in prompt_values.items()}
+        text = values.pop(text_field, "")
+        context_key = _hash([node, values])
+        return context_key, _hash([context_key, text]), text
+
+    async def lookup(self, node, prompt_values, text_field="message"):
+        """جستجوی پاسخ؛ خروجی (پاسخ یا None، بردار پیام برای استفاده در store)"""
+        stats = self._node_stats(node)
+        context_key, key, text = self._keys(node, prompt_values, text_field)
+
+        response = self._cache.get(key)
+        if response is not None:
+            stats["hits"] += 1
+            return response, None
+
+        vector = None
+        if self.semantic_enabled and text:
+            try:
+                vector = _normalize_vector(await self._get_embeddings().aembed_query(text))
+                response = self._most_similar(context_key, vector)
+            except Exception as e:
+                logger.error(f"خطا در جستجوی معنایی کش پاسخ: {e}")
+            if response is not None:
+                stats["semantic_hits"] += 1
+                return response, vector
+
+        stats["misses"] += 1
+        return None, vector
+
+    def _most_similar(self, context_key, vector):
+        bucket = self._vectors.get(context_key)
+        if not bucket:
+            return None
+        best_score, best_response = 0.0, None
+        for key, candidate in list(bucket.items()):
+            response = self._cache.get(key, count=False)
+            if response is None:
+                # مورد منقضی یا حذف شده
+                del bucket[key]
+                continue
+            score = sum(a * b for a, b in zip(vector, candidate))
+            if score > best_score:
+                best_score, best_response = score, response
+        if not bucket:
+            del self._vectors[context_key]
+        return best_response if best_score >= self.similarity_threshold else None
+
+    async def store(self, node, prompt_values, response, vector=None, text_field="message"):
+        """ذخیره پاسخ تولید شده"""
+        if not response:
+            return
+        context_key, key, text = self._keys(node, prompt_values, text_field)
+        self._cache.set(key, response)
+
+        if self.semantic_enabled and text:
+            if vector is None:
+                try:
+                    vector = _normalize_vector(await self._get_embeddings().aembed_query(text))
+                except Exception as e:
+                    logger.error(f"خطا در محاسبه بردار پیام برای کش پاسخ: {e}")
+                    return
+            self._vectors.setdefault(context_key, {})[key] = vector
+
+    def get_stats(self):
+        """نرخ موفقیت کش به تفکیک نود"""
+        result = {}
+        for node, stats in self.stats.items():
+            lookups = stats["hits"] + stats["semantic_hits"] + stats["misses"]
+            result[node] = dict(stats, hit_rate=(stats["hits"] + stats["semantic_hits"]) / lookups if lookups else 0.0)
+        return result
+
+# نمونه مشترک برای نودهای برنامه مطالعاتی و تحلیل عملکرد
+response_cache = ResponseCache()
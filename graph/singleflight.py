@@ -0,0 +1,62 @@
+import asyncio
+import hashlib
+import json
+import logging
+import config
+from cache import LRUCache
+from graph.text import normalize_text
+
+logger = logging.getLogger(__name__)
+
+def request_key(input_data):
+    """کلید درخواست: (شناسه کاربر، نوع درخواست، پیام یکسان‌سازی شده یا نتایج آزمون)"""
+    user_id = (input_data.get("user_profile") or {}).get("user_id")
+    payload = normalize_text(input_data.get("message", ""))
+    if input_data.get("exam_results"):
+        payload += json.dumps(input_data["exam_results"], ensure_ascii=False, sort_keys=True)
+    digest = hashlib.sha256(payload.encode()).hexdigest()
+    return (user_id, input_data.get("type", "general_chat"), digest)
+
+class SingleFlight:
+    """اجرای یک بار درخواست‌های یکسان: درخواست‌های همزمان یک future مشترک دارند
+    و پاسخ تکمیل شده برای مدت کوتاهی به درخواست تکراری بعدی داده می‌شود"""
+
+    def __init__(self, retain_seconds=None, max_entries=10000):
+        retain_seconds = config.SINGLE_FLIGHT_RETAIN_SECONDS if retain_seconds is None else retain_seconds
+        self._inflight = {}
+        self._recent = LRUCache(max_entries=max_entries, ttl=retain_seconds) if retain_seconds > 0 else None
+        self.stats = {"executed": 0, "shared_inflight": 0, "shared_recent": 0}
+
+    async def run(self, key, factory, cacheable=lambda result: True, retain=True):
+        """اجرای factory() یا دریافت نتیجه اجرای یکسان در جریان/اخیر؛
+        retain=False: نتیجه فقط با درخواست‌های همزمان به اشتراک گذاشته می‌شود و پس از پایان نگهداری نمی‌شود"""
+        future = self._inflight.get(key)
+        if future is not None:
+            self.stats["shared_inflight"] += 1
+            logger.debug(f"درخواست تکراری به درخواست در جریان متصل شد: {key[:2]}")
+            return await asyncio.shield(future)
+        if self._recent is not None and retain:
+            result = self._recent.get(key)
+            if result is not None:
+                self.stats["shared_recent"] += 1
+                logger.debug(f"پاسخ درخواست تکراری از نتیجه اخیر داده شد: {key[:2]}")
+                return result
+
+        self.stats["executed"] += 1
+        future = asyncio.ensure_future(factory())
+        self._inflight[key] = future
+        try:
+            result = await asyncio.shield(future)
+        finally:
+            self._inflight.pop(key, None)
+        if self._recent is not None and retain and result is not None and cacheable(result):
+            self._recent.set(key, result)
+        return result
+
+    def get_stats(self):
+        """تعداد اجرای واقعی گراف و تعداد پاسخ‌های مشترک (اجرای گراف انجام نشده؛ پاسخ نگهداری شده ممکن است
+        در غیر این صورت از کش پاسخ‌ها می‌آمد، پس این عدد تعداد فراخوانی صرفه‌جویی شده مدل نیست)"""
+        return dict(self.stats, shared_replies=self.stats["shared_inflight"] + self.stats["shared_recent"])
+
+# نمونه مشترک برای process_with_langgraph
+request_flight = SingleFlight()
@@ -0,0 +1,9 @@
+import re
+
+_WHITESPACE = re.compile(r"\s+")
+
+def normalize_text(text):
+    """یکسان‌سازی متن فارسی: حروف کوچک، نویسه‌های عربی، نیم‌فاصله و فاصله‌های تکراری"""
+    text = str(text).strip().lower()
+    text = text.replace("ي", "ی").replace("ك", "ک").replace("\u200c", " ")
+    return _WHITESPACE.sub(" ", text)
@@ -0,0 +1,86 @@
+import asyncio
+import json
+import logging
+from langchain_core.messages import ToolMessage
+import config
+from cache import LRUCache
+from bot.utils import WebSearchTool
+from graph.text import normalize_text
+
+logger = logging.getLogger(__name__)
+
+# ابزارهای پیش‌فرض قابل استفاده توسط مدل
+TOOLS = [WebSearchTool()]
+
+# کش نتایج ابزارها (مثلاً نتیجه جستجو برای یک query) با زمان انقضا
+tool_cache = LRUCache(max_entries=config.TOOL_CACHE_MAX_ENTRIES, ttl=config.TOOL_CACHE_TTL)
+tool_stats = {"calls": 0, "cache_hits": 0, "errors": 0, "rounds": 0}
+
+def bind_tools(llm, tools=None, tool_choice="auto"):
+    """اتصال ابزارها به مدل؛ اگر ابزارها غیرفعال باشند، خود مدل برگردانده می‌شود"""
+    tools = TOOLS if tools is None else tools
+    if not config.TOOLS_ENABLED or not tools:
+        return llm
+    return llm.bind_tools(tools, tool_choice=tool_choice)
+
+def _cache_key(name, args):
+    if isinstance(args, dict):
+        args = {k: normalize_text(v) if isinstance(v, str) else v for k, v in args.items()}
+    return name + ":" + json.dumps(args, ensure_ascii=False, sort_keys=True)
+
+async def _execute(tool, args):
+    result = await asyncio.wait_for(tool.ainvoke(args), timeout=config.TOOL_TIMEOUT)
+    return result if isinstance(result, str) else json.dumps(result, ensure_ascii=False, default=str)
+
+async def run_tool_calls(tool_calls, tools=None):
+    """اجرای همزمان فراخوانی‌های ابزار یک نوبت مدل؛ خروجی: لیست ToolMessage به همان ترتیب"""
+    tools_by_name = {tool.name: tool for tool in (TOOLS if tools is None else tools)}
+    # فراخوانی‌های یکسان در یک نوبت فقط یک بار اجرا می‌شوند
+    running = {}
+
+    async def run(tool_call):
+        name, args = tool_call["name"], tool_call.get("args", {})
+        tool_stats["calls"] += 1
+        tool = tools_by_name.get(name)
+        if tool is None:
+            tool_stats["errors"] += 1
+            return f"ابزار {name} وجود ندارد"
+        key = _cache_key(name, args)
+        cached = tool_cache.get(key)
+        if cached is not None:
+            tool_stats["cache_hits"] += 1
+            return cached
+        if key not in running:
+            running[key] = asyncio.ensure_future(_execute(tool, args))
+        try:
+            result = await asyncio.shield(running[key])
+        except Exception as e:
+            tool_stats["errors"] += 1
+            logger.error(f"خطا در اجرای ابزار {name}: {e!r}")
+            return f"خطا در اجرای ابزار {name}"
+        tool_cache.set(key, result)
+        return result
+
+    results = await asyncio.gather(*(run(tool_call) for tool_call in tool_calls))
+    return [
+        ToolMessage(content=result, tool_call_id=tool_call["id"], name=tool_call["name"])
+        for tool_call, result in zip(tool_calls, results)
+    ]
+
+def tools_node(tools=None):
+    """گره اجرای ابزارهای درخواست شده در آخرین پاسخ مدل"""
+    async def execute_tools(state):
+        messages = state["llm_messages"]
+        tool_calls = messages[-1].tool_calls
+        tool_messages = await run_tool_calls(tool_calls, tools)
+        state["llm_messages"] = messages + tool_messages
+        state["tool_rounds"] = state.get("tool_rounds", 0) + 1
+        tool_stats["rounds"] += 1
+        logger.debug(f"{len(tool_calls)} فراخوانی ابزار اجرا شد (دور {state['tool_rounds']})")
+        return state
+
+    return execute_tools
+
+def get_tool_stats():
+    """شمارنده‌های اجرای ابزارها و کش نتایج"""
+    return dict(tool_stats, cache=tool_cache.stats())
@@ -0,0 +1,48 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+class PromptUsageStats:
+    """آمار فراخوانی‌های مدل به تفکیک نود: تأخیر، توکن‌های خروجی و توکن‌های پرامپت (شامل توکن‌های کش پیشوند پرامپت سرویس‌دهنده)"""
+
+    def __init__(self):
+        self.stats = {}
+
+    def record(self, node, usage, latency=None):
+        """ثبت usage_metadata یک پاسخ مدل (پیام کامل یا پاسخ جریانی تجمیع شده) و مدت فراخوانی (ثانیه)"""
+        if hasattr(usage, "usage_metadata"):
+            usage = usage.usage_metadata
+        stats = self.stats.setdefault(node, {
+            "calls": 0, "latency_seconds": 0.0, "max_latency_seconds": 0.0,
+            "input_tokens": 0, "cached_tokens": 0, "output_tokens": 0
+        })
+        stats["calls"] += 1
+        if latency is not None:
+            stats["latency_seconds"] += latency
+            stats["max_latency_seconds"] = max(stats["max_latency_seconds"], latency)
+        if not usage:
+            return
+        details = usage.get("input_token_details") or {}
+        cached = details.get("cache_read") or 0
+        stats["input_tokens"] += usage.get("input_tokens", 0)
+        stats["cached_tokens"] += cached
+        stats["output_tokens"] += usage.get("output_tokens", 0)
+        logger.debug(f"مصرف توکن {node}: ورودی {usage.get('input_tokens', 0)} (کش شده {cached})، خروجی {usage.get('output_tokens', 0)}")
+
+    def get_stats(self):
+        """تأخیر میانگین و توکن‌های کش شده و کش نشده پرامپت به تفکیک نود"""
+        result = {}
+        for node, stats in self.stats.items():
+            input_tokens = stats["input_tokens"]
+            calls = stats["calls"]
+            result[node] = dict(
+                stats,
+                avg_latency_ms=1000 * stats["latency_seconds"] / calls if calls else 0.0,
+                avg_output_tokens=stats["output_tokens"] / calls if calls else 0.0,
+                uncached_tokens=input_tokens - stats["cached_tokens"],
+                cached_ratio=stats["cached_tokens"] / input_tokens if input_tokens else 0.0,
+            )
+        return result
+
+# نمونه مشترک برای نودهای گراف و استخراج اطلاعات
+usage_stats = PromptUsageStats()
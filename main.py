@@ -4,10 +4,11 @@ from telegram.ext import (
     ApplicationBuilder, CommandHandler, MessageHandler, filters, 
     CallbackContext, ConversationHandler
 )
-from langchain_openai import ChatOpenAI
 from langgraph.graph import StateGraph
 import pymongo
-from bot.utils import WebSearchTool
+from bot.concurrency import PerUserUpdateProcessor
+from bot.streaming import get_streaming_stats
+from bot.webhook import run_queue_worker, run_webhook, run_webhook_ingress
 import config
 from bot.handlers import (
     start_command, help_command, profile_command, 
@@ -18,8 +19,19 @@ from bot.handlers import (
     WAITING_FOR_FAVORITE_SUBJECTS, WAITING_FOR_DISLIKED_SUBJECTS, 
     WAITING_FOR_DESIRED_MAJOR
 )
-from db.connection import connect_to_mongodb
+from db.connection import connect_to_mongodb, start_health_check, close_mongodb
+from db.indexes import ensure_indexes, verify_query_plans
+from db.history_writer import history_writer
+from db.profile_cache import start_profile_invalidation, stop_profile_invalidation, profile_cache_stats
 from graph.builder import build_langgraph
+from graph.context import load_tokenizer
+from graph.fact_index import fact_index_store
+from graph.memory import extraction_pipeline, memory_compactor, memory_store
+from graph.response_cache import response_cache
+from graph.models import get_model_stats
+from graph.tools import get_tool_stats
+from graph.singleflight import request_flight
+from graph.usage import usage_stats
 
 # تنظیم لاگر
 logging.basicConfig(
@@ -28,9 +40,45 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+async def on_startup(application):
+    """شروع سرویس‌های پس‌زمینه داخل event loop بات"""
+    start_profile_invalidation()
+    await load_tokenizer()
+    await history_writer.start()
+    await memory_store.start()
+    await extraction_pipeline.start()
+    await fact_index_store.start()
+    await memory_compactor.start()
+
+async def on_shutdown(application):
+    """توقف سرویس‌های پس‌زمینه هنگام خاموش شدن بات"""
+    await extraction_pipeline.stop()
+    await memory_compactor.stop()
+    # پس از تخلیه صف استخراج، تغییرات باقی‌مانده حافظه ذخیره می‌شوند
+    await memory_store.stop()
+    await fact_index_store.stop()
+    await history_writer.stop()
+    stop_profile_invalidation()
+    logger.info(f"آمار کش پروفایل: {profile_cache_stats()}")
+    logger.info(f"آمار کش پاسخ‌ها: {response_cache.get_stats()}")
+    logger.info(f"آمار پاسخ‌های جریانی (زمان نمایش اولین بخش پاسخ): {get_streaming_stats()}")
+    logger.info(f"آمار فراخوانی‌های مدل (تأخیر و توکن): {usage_stats.get_stats()}")
+    logger.info(f"آمار اجرای ابزارها: {get_tool_stats()}")
+    logger.info(f"آمار پایداری مدل‌ها: {get_model_stats()}")
+    logger.info(f"آمار آپدیت‌های تکراری: {application.update_processor.get_stats()}")
+    logger.info(f"آمار درخواست‌های یکسان (اجرای گراف و پاسخ‌های مشترک): {request_flight.get_stats()}")
+
 def setup_bot():
     """راه‌اندازی بات تلگرام و ثبت هندلرها"""
-    application = ApplicationBuilder().token(config.TELEGRAM_BOT_TOKEN).build()
+    application = (
+        ApplicationBuilder()
+        .token(config.TELEGRAM_BOT_TOKEN)
+        # پردازش همزمان کاربران مختلف و پردازش ترتیبی پیام‌های هر کاربر
+        .concurrent_updates(PerUserUpdateProcessor(config.MAX_CONCURRENT_UPDATES, config.UPDATE_DEDUP_WINDOW))
+        .post_init(on_startup)
+        .post_shutdown(on_shutdown)
+        .build()
+    )
     
     # ثبت هندلر مکالمه برای تکمیل پروفایل
     profile_conv_handler = ConversationHandler(
@@ -60,46 +108,74 @@ def setup_bot():
 
 def setup_langgraph():
     """راه‌اندازی LangGraph"""
-    # ایجاد مدل زبانی
-    llm = ChatOpenAI(
-        model=config.MODEL_NAME,
-        temperature=0.7,
-        api_key=config.OPENAI_API_KEY,
-        #model_kwargs={"tools": [{"type": "web_search"}]}
-    ).bind_tools([WebSearchTool()], tool_choice="auto")
-    
-    # ساخت گراف
-    workflow_graph = build_langgraph(llm)
+    # مدل هر نود از config.MODEL_REGISTRY ساخته می‌شود؛
+    # ابزارها در نودهای گراف به مدل متصل و در نود tools اجرا می‌شوند
+    workflow_graph = build_langgraph()
     
     return workflow_graph
 
 def main():
     """تابع اصلی برای راه‌اندازی بات"""
-    # اتصال به پایگاه داده
+    if config.BOT_MODE == "webhook" and not (config.WEBHOOK_URL and config.WEBHOOK_SECRET_TOKEN):
+        logger.error("برای حالت webhook تنظیم WEBHOOK_URL و WEBHOOK_SECRET_TOKEN الزامی است")
+        return
+    if config.BOT_MODE == "webhook" and config.WEBHOOK_WORKERS > 1:
+        # این پردازه فقط آپدیت‌ها را دریافت می‌کند و پردازه‌های کارگر هر کدام یک بات کامل اجرا می‌کنند
+        run_webhook_ingress(_webhook_worker)
+        return
+    serve(run_webhook if config.BOT_MODE == "webhook" else _run_polling)
+
+def _run_polling(app):
+    app.run_polling()
+
+def _webhook_worker(update_queue):
+    """اجرای بات در پردازه کارگر حالت webhook"""
+    serve(lambda app: run_queue_worker(app, update_queue))
+
+def serve(run):
+    """اتصال به پایگاه داده، ساخت گراف و بات و اجرای آن با run(app)"""
+    # اتصال به پایگاه داده (یک کلاینت مشترک برای کل پردازه)
     db_client = connect_to_mongodb()
     if not db_client:
         logger.error("خطا در اتصال به پایگاه داده MongoDB")
         return
+    start_health_check()
     
-    # راه‌اندازی LangGraph
-    try:
-        workflow_graph = setup_langgraph()
-        logger.info("LangGraph با موفقیت راه‌اندازی شد")
-    except Exception as e:
-        logger.error(f"خطا در راه‌اندازی LangGraph: {e}")
-        return
-    
-    # راه‌اندازی بات تلگرام
     try:
-        app = setup_bot()
-        logger.info("بات تلگرام با موفقیت راه‌اندازی شد")
+        # ایجاد ایندکس‌ها و اطمینان از استفاده کوئری‌های پرتکرار از آنها
+        try:
+            if config.MONGODB_ENSURE_INDEXES:
+                ensure_indexes()
+            if config.MONGODB_VERIFY_QUERY_PLANS:
+                verify_query_plans()
+        except Exception as e:
+            logger.error(f"خطا در بررسی ایندکس‌های پایگاه داده: {e}")
+            return
         
-        # شروع به کار بات
-        app.run_polling()
-        logger.info("بات در حال اجراست...")
+        # راه‌اندازی LangGraph
+        try:
+            workflow_graph = setup_langgraph()
+            logger.info("LangGraph با موفقیت راه‌اندازی شد")
+        except Exception as e:
+            logger.error(f"خطا در راه‌اندازی LangGraph: {e}")
+            return
         
-    except Exception as e:
-        logger.error(f"خطا در راه‌اندازی بات تلگرام: {e}")
+        # راه‌اندازی بات تلگرام
+        try:
+            app = setup_bot()
+            # گراف و مدل زبانی فقط یک بار ساخته می‌شوند و از طریق bot_data در اختیار هندلرها قرار می‌گیرند
+            app.bot_data["workflow"] = workflow_graph
+            logger.info("بات تلگرام با موفقیت راه‌اندازی شد")
+            
+            # شروع به کار بات (polling یا webhook)
+            run(app)
+            logger.info("بات در حال اجراست...")
+            
+        except Exception as e:
+            logger.error(f"خطا در راه‌اندازی بات تلگرام: {e}")
+    finally:
+        # بستن اتصال‌ها هنگام خروج
+        close_mongodb()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# ساخت مدل‌ها هنگام import به کلید API نیاز دارد (در تست‌ها هیچ درخواستی ارسال نمی‌شود)
+os.environ.setdefault("OPENAI_API_KEY", "test")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,66 @@
+import asyncio
+import random
+from types import SimpleNamespace
+from telegram.ext import BaseUpdateProcessor
+from bot.concurrency import PerUserUpdateProcessor
+
+def make_update(update_id, user_id):
+    return SimpleNamespace(update_id=update_id, effective_user=SimpleNamespace(id=user_id), effective_chat=None)
+
+class FakeLLM:
+    """مدل ساختگی با تأخیر تصادفی که ترتیب پاسخ‌ها و حداکثر همزمانی را ثبت می‌کند"""
+
+    def __init__(self, seed=0):
+        self.random = random.Random(seed)
+        self.replies = {}
+        self.running = 0
+        self.max_running = 0
+
+    async def reply(self, user_id, text):
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        await asyncio.sleep(self.random.uniform(0, 0.01))
+        self.running -= 1
+        self.replies.setdefault(user_id, []).append(text)
+
+def test_interleaved_users_keep_per_user_order():
+    users, messages_per_user = 5, 8
+
+    async def scenario():
+        processor = PerUserUpdateProcessor(max_concurrent_updates=4)
+        llm = FakeLLM()
+        # پیام‌های کاربران به صورت درهم و همزمان می‌رسند
+        updates = [
+            (make_update(n * users + u, u), f"پیام {n}")
+            for n in range(messages_per_user) for u in range(users)
+        ]
+        await asyncio.gather(*(
+            processor.process_update(update, llm.reply(update.effective_user.id, text))
+            for update, text in updates
+        ))
+        return processor, llm
+
+    processor, llm = asyncio.run(scenario())
+    expected = [f"پیام {n}" for n in range(messages_per_user)]
+    assert all(llm.replies[u] == expected for u in range(users))
+    # کاربران مختلف همزمان و در سقف ظرفیت پردازش شده‌اند
+    assert 1 < llm.max_running <= 4
+    # قفل کاربران پس از پایان پردازش آزاد می‌شود
+    assert processor._locks == {}
+
+def test_duplicate_update_ids_are_dropped():
+    async def scenario():
+        processor = PerUserUpdateProcessor(max_concurrent_updates=4, dedup_window=2)
+        llm = FakeLLM()
+        for update_id in (1, 2, 1, 3, 1):
+            await processor.process_update(make_update(update_id, 7), llm.reply(7, update_id))
+        return processor, llm
+
+    processor, llm = asyncio.run(scenario())
+    # با پنجره ۲، شناسه 1 پس از دیدن 2 و 3 فراموش شده و دوباره پردازش می‌شود
+    assert llm.replies[7] == [1, 2, 3, 1]
+    assert processor.get_stats()["duplicates"] == 1
+
+def test_base_class_process_update_is_not_overridden():
+    # process_update در python-telegram-bot با final علامت‌گذاری شده است
+    assert PerUserUpdateProcessor.process_update is BaseUpdateProcessor.process_update
@@ -0,0 +1,101 @@
+import asyncio
+import threading
+import time
+import pymongo
+import config
+from db import connection
+
+DELAY = 0.01
+
+class FakePool:
+    """Connection Pool ساختگی: هر کوئری یک اتصال از pool می‌گیرد و تعداد اتصال‌های باز را می‌شمارد"""
+
+    def __init__(self, max_size):
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._lock = threading.Lock()
+        self.opened = 0
+        self.in_use = 0
+        self.max_in_use = 0
+        self._idle = 0
+
+    def query(self):
+        with self._slots:
+            with self._lock:
+                if self._idle:
+                    self._idle -= 1
+                else:
+                    self.opened += 1
+                self.in_use += 1
+                self.max_in_use = max(self.max_in_use, self.in_use)
+            time.sleep(DELAY)
+            with self._lock:
+                self.in_use -= 1
+                self._idle += 1
+        return {"user_id": 1}
+
+class FakeCollection:
+    def __init__(self, pool):
+        self._pool = pool
+
+    def find_one(self, *args, **kwargs):
+        return self._pool.query()
+
+class FakeAdmin:
+    def command(self, name):
+        return {"ok": 1}
+
+class FakeMongoClient:
+    instances = []
+
+    def __init__(self, uri, maxPoolSize, **kwargs):
+        self.pool = FakePool(maxPoolSize)
+        self.admin = FakeAdmin()
+        FakeMongoClient.instances.append(self)
+
+    def __getitem__(self, name):
+        return {"users": FakeCollection(self.pool)}
+
+    def close(self):
+        pass
+
+def test_one_pooled_client_serves_concurrent_requests(monkeypatch):
+    FakeMongoClient.instances = []
+    monkeypatch.setattr(pymongo, "MongoClient", FakeMongoClient)
+    monkeypatch.setattr(connection, "_client", None)
+    monkeypatch.setattr(connection, "_executor", None)
+    monkeypatch.setattr(config, "MONGODB_MAX_POOL_SIZE", 8)
+    monkeypatch.setattr(config, "MONGODB_EXECUTOR_WORKERS", 16)
+    requests = 64
+
+    def find_user(user_id):
+        # هر درخواست مانند مدل‌ها کلاینت را از get_db دریافت می‌کند
+        return connection.get_db()["users"].find_one({"user_id": user_id})
+
+    async def timed(user_id):
+        started = time.perf_counter()
+        await connection.run_in_db_executor(find_user, user_id)
+        return time.perf_counter() - started
+
+    async def scenario():
+        started = time.perf_counter()
+        latencies = await asyncio.gather(*(timed(i) for i in range(requests)))
+        return latencies, time.perf_counter() - started
+
+    try:
+        latencies, elapsed = asyncio.run(scenario())
+    finally:
+        connection.close_mongodb()
+
+    pool = FakeMongoClient.instances[0].pool
+    latencies.sort()
+    print(
+        f"\n{requests} درخواست همزمان: {len(FakeMongoClient.instances)} کلاینت، "
+        f"{pool.opened} اتصال (حداکثر همزمان {pool.max_in_use})، "
+        f"p50={latencies[len(latencies) // 2] * 1000:.1f}ms p99={latencies[-1] * 1000:.1f}ms کل={elapsed * 1000:.1f}ms"
+    )
+    assert len(FakeMongoClient.instances) == 1
+    # اتصال‌ها از pool دوباره استفاده می‌شوند و از maxPoolSize بیشتر نمی‌شوند
+    assert pool.opened <= config.MONGODB_MAX_POOL_SIZE
+    assert pool.max_in_use == config.MONGODB_MAX_POOL_SIZE
+    # 64 درخواست با 8 اتصال در حدود 8 نوبت اجرا می‌شوند، نه 64 نوبت پشت سر هم
+    assert elapsed < requests * DELAY / 2
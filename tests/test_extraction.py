@@ -0,0 +1,81 @@
+import asyncio
+import time
+from graph.extraction import ExtractionPipeline
+
+class FakeModel:
+    """مدل ساختگی استخراج: هر دسته یک فراخوانی با تأخیر ثابت"""
+
+    def __init__(self, delay=0.01):
+        self.delay = delay
+        self.calls = []
+
+    async def handler(self, jobs):
+        self.calls.append([job.user_message for job in jobs])
+        await asyncio.sleep(self.delay)
+        return 1
+
+def run_pipeline(model, submissions, **kwargs):
+    pipeline = ExtractionPipeline(model.handler, **kwargs)
+
+    async def scenario():
+        await pipeline.start()
+        started = time.perf_counter()
+        accepted = [pipeline.submit(key, {}, message, "پاسخ", 0) for key, message in submissions]
+        await pipeline.stop()
+        return accepted, time.perf_counter() - started
+
+    accepted, elapsed = asyncio.run(scenario())
+    return pipeline, accepted, elapsed
+
+def test_submissions_are_batched():
+    model = FakeModel()
+    count, batch_size = 64, 8
+    pipeline, accepted, elapsed = run_pipeline(
+        model, [(i, f"پیام {i}") for i in range(count)],
+        max_size=count, workers=1, coalesce=False, batch_size=batch_size, batch_window=0.05,
+    )
+    metrics = pipeline.get_metrics()
+    print(f"\n{count} درخواست در {len(model.calls)} دسته: {count / elapsed:.0f} استخراج در ثانیه")
+    assert all(accepted)
+    assert metrics["processed"] == count
+    assert len(model.calls) == metrics["llm_calls"] == count // batch_size
+    # بدون دسته‌بندی 64 فراخوانی پشت سر هم حداقل 0.64 ثانیه طول می‌کشید
+    assert elapsed < count * model.delay / 2
+
+def test_pending_requests_of_one_user_are_coalesced():
+    model = FakeModel()
+    pipeline, accepted, _ = run_pipeline(
+        model, [(1, "اول"), (2, "دوم"), (1, "سوم")],
+        max_size=10, workers=1, coalesce=True, batch_size=8, batch_window=0.05,
+    )
+    assert all(accepted)
+    assert pipeline.metrics["coalesced"] == 1
+    assert model.calls == [["اول\nسوم", "دوم"]]
+
+def test_drop_oldest_keeps_the_newest_requests():
+    model = FakeModel()
+    pipeline, accepted, _ = run_pipeline(
+        model, [(i, f"پیام {i}") for i in range(5)],
+        max_size=3, workers=1, overflow_policy="drop_oldest", coalesce=True, batch_size=8, batch_window=0.05,
+    )
+    assert all(accepted)
+    assert pipeline.metrics["dropped"] == 2
+    assert model.calls == [["پیام 2", "پیام 3", "پیام 4"]]
+    # درخواست‌های حذف شده دیگر برای ادغام در نظر گرفته نمی‌شوند
+    assert pipeline._pending == {}
+
+def test_drop_new_rejects_requests_when_full():
+    model = FakeModel()
+    pipeline, accepted, _ = run_pipeline(
+        model, [(i, f"پیام {i}") for i in range(5)],
+        max_size=3, workers=1, overflow_policy="drop_new", coalesce=True, batch_size=8, batch_window=0.05,
+    )
+    assert accepted == [True, True, True, False, False]
+    assert model.calls == [["پیام 0", "پیام 1", "پیام 2"]]
+
+def test_submit_is_skipped_when_not_started():
+    model = FakeModel()
+    pipeline = ExtractionPipeline(model.handler)
+    assert pipeline.submit(1, {}, "پیام", "پاسخ", 0) is False
+    assert pipeline.metrics["skipped"] == 1
+    assert model.calls == []
@@ -0,0 +1,122 @@
+import asyncio
+import time
+import numpy as np
+import config
+from graph.fact_index import FactIndex, FactIndexStore
+from graph.records import MemoryFact
+
+DIMENSIONS = 8
+
+class FakeEmbeddings:
+    """embedding ساختگی با تأخیر قابل تنظیم"""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+
+    def _vector(self, text):
+        rng = np.random.default_rng(abs(hash(text)) % 2 ** 32)
+        return rng.standard_normal(DIMENSIONS).tolist()
+
+    async def aembed_query(self, text):
+        await asyncio.sleep(self.delay)
+        return self._vector(text)
+
+    async def aembed_documents(self, texts):
+        await asyncio.sleep(self.delay)
+        return [self._vector(text) for text in texts]
+
+def make_store(tmp_path, delay):
+    return FactIndexStore(directory=str(tmp_path), dimensions=DIMENSIONS, embeddings=FakeEmbeddings(delay))
+
+MEMORY = {"fact_sheet": {"goals": {"main": "پزشکی"}}, "long_term": [MemoryFact({"subjects": ["زیست"]}, 1)]}
+
+def test_slow_embeddings_do_not_block_the_reply(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "FACT_RETRIEVAL_TIMEOUT", 0.05)
+
+    async def scenario():
+        store = make_store(tmp_path, delay=1.0)
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        assert await store.search(1, "برنامه زیست", MEMORY) == []
+        assert loop.time() - started < 0.5
+        await store.stop()
+
+    asyncio.run(scenario())
+
+def test_backfill_runs_in_background(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "FACT_RETRIEVAL_TIMEOUT", 1.0)
+
+    async def scenario():
+        store = make_store(tmp_path, delay=0.01)
+        # اولین جستجو منتظر ساخت ایندکس نمی‌ماند
+        assert await store.search(1, "زیست", MEMORY, min_score=-1) == []
+        await asyncio.gather(*store._backfills)
+        results = await store.search(1, "زیست", MEMORY, min_score=-1)
+        assert len(results) == 2
+        await store.stop()
+
+    asyncio.run(scenario())
+
+def test_snapshot_is_not_affected_by_later_adds(tmp_path):
+    index = FactIndex(DIMENSIONS, capacity=100)
+    index.add(["a", "b"], np.ones((2, DIMENSIONS)))
+    snapshot = index.snapshot()
+    index.add(["c"], np.ones((1, DIMENSIONS)))
+    path = str(tmp_path / "1.npz")
+    FactIndex.write(path, snapshot)
+    loaded = FactIndex.load(path, DIMENSIONS, 100)
+    assert loaded.texts == ["a", "b"] and len(loaded) == 2
+
+def test_embedding_for_an_evicted_index_goes_to_the_current_one(tmp_path):
+    async def scenario():
+        store = make_store(tmp_path, delay=0.05)
+        stale = await store.aget(1)
+        embedding = asyncio.ensure_future(store._embed_into({1: (stale, ["رشته: پزشکی"])}))
+        await asyncio.sleep(0.01)
+        # در حین embedding ایندکس از کش خارج و نسخه جدیدتری بارگذاری می‌شود
+        store._cache.pop(1)
+        current = FactIndex(DIMENSIONS, capacity=100)
+        current.add(["پایه: دوازدهم"], np.ones((1, DIMENSIONS)))
+        store._cache.set(1, current)
+        await embedding
+        assert len(stale) == 0
+        assert current.texts == ["پایه: دوازدهم", "رشته: پزشکی"]
+        assert store._dirty == {1: current}
+
+        # اگر نسخه جدیدتری بارگذاری نشده باشد، ایندکس قدیمی علامت‌گذاری و ذخیره نمی‌شود
+        store._dirty.clear()
+        store._cache.pop(1)
+        await store._embed_into({1: (current, ["هدف: تهران"])})
+        assert store._dirty == {}
+        assert await store.flush() == 0
+
+    asyncio.run(scenario())
+
+def test_retrieval_latency_with_10k_facts(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "FACT_RETRIEVAL_TIMEOUT", 1.0)
+    dimensions, count = config.FACT_EMBEDDING_DIMENSIONS, 10000
+    rng = np.random.default_rng(0)
+    index = FactIndex(dimensions, capacity=count)
+    index.add([f"مورد {i}" for i in range(count)], rng.standard_normal((count, dimensions)))
+    queries = rng.standard_normal((200, dimensions))
+
+    class QueryEmbeddings:
+        async def aembed_query(self, text):
+            return queries[int(text)]
+
+    store = FactIndexStore(directory=str(tmp_path), dimensions=dimensions, embeddings=QueryEmbeddings())
+    store._cache.set(1, index)
+
+    async def scenario():
+        latencies = []
+        for i in range(len(queries)):
+            started = time.perf_counter()
+            results = await store.search(1, str(i), k=5, min_score=-1)
+            latencies.append(time.perf_counter() - started)
+            assert len(results) == 5
+        return sorted(latencies)
+
+    latencies = asyncio.run(scenario())
+    p50, p99 = latencies[len(latencies) // 2] * 1000, latencies[int(0.99 * len(latencies))] * 1000
+    print(f"\nبازیابی از {count} مورد ({dimensions} بعد): p50={p50:.2f}ms p99={p99:.2f}ms")
+    assert p99 < 20
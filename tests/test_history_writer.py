@@ -0,0 +1,100 @@
+import asyncio
+import time
+from types import SimpleNamespace
+from db import connection, history_writer as history_module
+from db.history_writer import ChatHistoryWriter
+
+class FakeChatHistory:
+    """کالکشن ساختگی؛ fail_times فراخوانی اول insert_many خطا می‌دهند"""
+
+    def __init__(self, fail_times=0, delay=0.001):
+        self.fail_times = fail_times
+        self.delay = delay
+        self.batches = []
+
+    def insert_many(self, documents, ordered=True):
+        time.sleep(self.delay)
+        if self.fail_times:
+            self.fail_times -= 1
+            raise ConnectionError("قطع اتصال")
+        self.batches.append([document["n"] for document in documents])
+
+def use_collection(monkeypatch, collection):
+    monkeypatch.setattr(history_module, "get_db", lambda: SimpleNamespace(chat_history=collection))
+    monkeypatch.setattr(connection, "_executor", None)
+
+def test_throughput_and_p99(monkeypatch):
+    collection = FakeChatHistory()
+    use_collection(monkeypatch, collection)
+    writer = ChatHistoryWriter(batch_size=100, flush_interval=0.01, max_pending=10000)
+    count = 5000
+
+    async def scenario():
+        await writer.start()
+        for n in range(count):
+            writer.add({"n": n})
+            if n % 100 == 0:
+                await asyncio.sleep(0)
+        await writer.stop()
+        return writer.stats()
+
+    try:
+        stats = asyncio.run(scenario())
+    finally:
+        connection.close_mongodb()
+    print(f"\n{stats['inserted']} پیام: {stats['inserts_per_second']:.0f} درج در ثانیه، p99 دسته={stats['p99_batch_latency'] * 1000:.1f}ms")
+    assert stats["inserted"] == count
+    assert stats["dropped"] == 0
+    assert [n for batch in collection.batches for n in batch] == list(range(count))
+    assert max(len(batch) for batch in collection.batches) <= 100
+    assert 0 < stats["p99_batch_latency"] < 1
+
+def test_failed_batch_is_requeued_in_order(monkeypatch):
+    collection = FakeChatHistory(fail_times=1)
+    use_collection(monkeypatch, collection)
+    writer = ChatHistoryWriter(batch_size=3, flush_interval=60, max_pending=10)
+
+    async def scenario():
+        await writer.start()
+        for n in range(5):
+            writer.add({"n": n})
+        failed = await writer.flush()
+        pending = [document["n"] for document in writer._buffer]
+        await writer.stop()
+        return failed, pending
+
+    try:
+        failed, pending = asyncio.run(scenario())
+    finally:
+        connection.close_mongodb()
+    assert failed is False
+    assert pending == [0, 1, 2, 3, 4]
+    assert collection.batches == [[0, 1, 2], [3, 4]]
+    assert writer.metrics["failed"] == 1
+    assert writer.metrics["dropped"] == 0
+
+def test_full_buffer_drops_oldest(monkeypatch):
+    collection = FakeChatHistory(fail_times=1)
+    use_collection(monkeypatch, collection)
+    writer = ChatHistoryWriter(batch_size=3, flush_interval=60, max_pending=4)
+
+    async def scenario():
+        await writer.start()
+        for n in range(6):
+            writer.add({"n": n})
+        pending = [document["n"] for document in writer._buffer]
+        # دسته ناموفق فقط تا سقف بافر بازگردانده می‌شود
+        await writer.flush()
+        writer.add({"n": 6})
+        writer.add({"n": 7})
+        after_failure = [document["n"] for document in writer._buffer]
+        await writer.stop()
+        return pending, after_failure
+
+    try:
+        pending, after_failure = asyncio.run(scenario())
+    finally:
+        connection.close_mongodb()
+    assert pending == [2, 3, 4, 5]
+    assert after_failure == [4, 5, 6, 7]
+    assert writer.metrics["dropped"] == 4
@@ -0,0 +1,50 @@
+import pytest
+from db.indexes import QueryPlanError, verify_query_plans
+
+IXSCAN = {"stage": "LIMIT", "inputStage": {"stage": "FETCH", "inputStage": {"stage": "IXSCAN", "indexName": "user_id_timestamp"}}}
+# موتور SBE طرح را زیر winningPlan.queryPlan قرار می‌دهد
+SBE_IXSCAN = {"queryPlan": IXSCAN, "slotBasedPlan": {"slots": "..."}}
+EXPRESS = {"stage": "EXPRESS_IXSCAN", "keyPattern": "{ user_id: 1 }"}
+COLLSCAN = {"stage": "LIMIT", "inputStage": {"stage": "COLLSCAN", "direction": "forward"}}
+SORT = {"stage": "SORT", "inputStage": {"stage": "FETCH", "inputStage": {"stage": "IXSCAN", "indexName": "user_id"}}}
+NO_IXSCAN = {"stage": "EOF"}
+OR_PLAN = {"stage": "FETCH", "inputStage": {"stage": "OR", "inputStages": [
+    {"stage": "IXSCAN", "indexName": "user_id"}, {"stage": "COLLSCAN"},
+]}}
+
+class FakeCursor:
+    def __init__(self, plan):
+        self._plan = plan
+
+    def limit(self, count):
+        return self
+
+    def sort(self, sort):
+        return self
+
+    def explain(self):
+        return {"queryPlanner": {"winningPlan": self._plan}}
+
+class FakeCollection:
+    def __init__(self, plan):
+        self._plan = plan
+
+    def find(self, query):
+        return FakeCursor(self._plan)
+
+def make_db(**plans):
+    plans = {"users": EXPRESS, "chat_history": IXSCAN, "exam_results": SBE_IXSCAN, **plans}
+    return {name: FakeCollection(plan) for name, plan in plans.items()}
+
+def test_index_plans_pass():
+    verify_query_plans(make_db())
+
+@pytest.mark.parametrize("plan, stage", [
+    (COLLSCAN, "COLLSCAN"), (SORT, "SORT"), (NO_IXSCAN, "EOF"), (OR_PLAN, "COLLSCAN"),
+])
+def test_plans_without_index_fail(plan, stage):
+    with pytest.raises(QueryPlanError) as error:
+        verify_query_plans(make_db(chat_history=plan))
+    assert "chat_history" in str(error.value)
+    assert stage in str(error.value)
+    assert "users" not in str(error.value)
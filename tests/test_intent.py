@@ -0,0 +1,36 @@
+import json
+import os
+import time
+from langchain.schema import HumanMessage
+from graph.nodes import router_node
+
+SAMPLES_PATH = os.path.join(os.path.dirname(__file__), "data", "intent_samples.json")
+
+def route(text):
+    state = {"messages": [HumanMessage(content=text)], "request_type": "general_chat"}
+    return router_node(state)
+
+def load_samples():
+    with open(SAMPLES_PATH, encoding="utf-8") as f:
+        return json.load(f)
+
+def test_router_accuracy_and_latency_on_labelled_samples():
+    samples = load_samples()
+    started = time.perf_counter()
+    predicted = [route(sample["text"])["request_type"] for sample in samples]
+    avg_ms = 1000 * (time.perf_counter() - started) / len(samples)
+    wrong = [(s["text"], s["label"], p) for s, p in zip(samples, predicted) if p != s["label"]]
+    accuracy = 1 - len(wrong) / len(samples)
+    print(f"intent router: accuracy {accuracy:.2f}, {avg_ms:.3f} ms/message, misrouted: {wrong}")
+    assert accuracy >= 0.9
+    assert avg_ms < 5
+
+def test_question_with_colon_is_not_rerouted_to_analysis():
+    state = route("سوال: رتبه ۵۰۰۰ برای پزشکی کافیه؟")
+    assert state["request_type"] == "general_chat"
+    assert "exam_results" not in state
+
+def test_only_numeric_scores_are_passed_as_exam_results():
+    state = route("تحلیل کن\nریاضی: ۱۸\nزیست: خوب")
+    assert state["request_type"] == "performance_analysis"
+    assert state["exam_results"] == {"ریاضی": 18.0}
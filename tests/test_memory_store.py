@@ -0,0 +1,138 @@
+import asyncio
+import config
+from graph import memory as memory_module
+from graph.extraction import ExtractionJob
+from graph.memory_store import MemoryBackend, MemoryStore, transient_memory
+from graph.records import MemoryMessage
+
+class FlakyBackend(MemoryBackend):
+    """backend ساختگی که تا زمان fail=False خطا می‌دهد"""
+
+    def __init__(self, document):
+        self.document = document
+        self.fail = True
+        self.saved = []
+
+    def load(self, user_id):
+        if self.fail:
+            raise TimeoutError("mongo timeout")
+        return self.document
+
+    def save_many(self, documents):
+        self.saved.extend(documents)
+
+STORED = {
+    "_id": 1,
+    "short_term": [{"role": "user", "content": "سلام", "ts": 1}],
+    "long_term": [{"info": {"goals": {"main": "پزشکی"}}, "ts": 1}],
+    "fact_sheet": {"subjects": ["زیست"]},
+    "turns": 1,
+    "last_greeting": None,
+}
+
+def test_backend_error_does_not_overwrite_stored_memory():
+    async def scenario():
+        backend = FlakyBackend(STORED)
+        store = MemoryStore(backend)
+
+        memory = await store.aget(1)
+        memory["short_term"].append(MemoryMessage("user", "پیام جدید", 2))
+        store.mark_dirty(1, memory)
+        assert await store.flush() == 0
+        assert backend.saved == []
+
+        # پس از رفع خطا، حافظه واقعی از backend بارگذاری می‌شود
+        backend.fail = False
+        memory = await store.aget(1)
+        assert memory["fact_sheet"] == {"subjects": ["زیست"]}
+        assert len(memory["long_term"]) == 1
+
+    asyncio.run(scenario())
+
+def test_evicted_memory_does_not_overwrite_a_newer_copy():
+    async def scenario():
+        backend = FlakyBackend(STORED)
+        backend.fail = False
+        store = MemoryStore(backend)
+
+        stale = await store.aget(1)
+        # حذف از کش (LRU) و بارگذاری نسخه جدید
+        store._cache.pop(1)
+        current = await store.aget(1)
+        assert current is not stale
+
+        stale["short_term"].append(MemoryMessage("user", "قدیمی", 2))
+        store.mark_dirty(1, stale)
+        assert await store.flush() == 0
+
+        current["short_term"].append(MemoryMessage("user", "جدید", 3))
+        store.mark_dirty(1, current)
+        assert await store.flush() == 1
+        assert [msg["content"] for msg in backend.saved[0]["short_term"]] == ["سلام", "جدید"]
+
+        # حافظه‌ای که از کش حذف شده ولی هنوز ذخیره نشده، همچنان نسخه فعلی است
+        store.mark_dirty(1, current)
+        store._cache.pop(1)
+        store.mark_dirty(1, current)
+        assert await store.flush() == 1
+
+    asyncio.run(scenario())
+
+def test_transient_memory_is_not_indexed(monkeypatch):
+    indexed = []
+
+    async def fake_batch(items):
+        return [{"goals": {"main": "پزشکی"}} for _ in items], 1
+
+    async def fake_add_many(facts):
+        indexed.append(facts)
+
+    monkeypatch.setattr(config, "FACT_INDEX_ENABLED", True)
+    monkeypatch.setattr(memory_module, "aextract_key_information_batch", fake_batch)
+    monkeypatch.setattr(memory_module.fact_index_store, "add_many", fake_add_many)
+    monkeypatch.setattr(memory_module, "_mark_dirty", lambda key, memory: None)
+    monkeypatch.setattr(memory_module.memory_compactor, "mark", lambda key, memory: None)
+
+    transient = transient_memory()
+    jobs = [ExtractionJob(1, transient, "هدفم پزشکی است", "عالی", 1)]
+    asyncio.run(memory_module._process_extraction_batch(jobs))
+    assert len(transient["long_term"]) == 1
+    assert indexed == []
+
+class HistoryBackend(MemoryBackend):
+    """backend بدون سند حافظه که حافظه کوتاه مدت از chat_history ساخته می‌شود"""
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def load(self, user_id):
+        return None
+
+    def load_recent_messages(self, user_id, limit):
+        return self.rows[:limit]
+
+    def load_recent_messages_bulk(self, user_ids, limit):
+        return {user_id: self.rows[:limit] for user_id in user_ids}
+
+    def load_many(self, user_ids):
+        return {}
+
+def test_current_message_is_not_duplicated_after_rebuild(monkeypatch):
+    monkeypatch.setattr(memory_module, "_mark_dirty", lambda key, memory: None)
+    # پیام فعلی پیش از بارگذاری حافظه در chat_history ذخیره شده است (از جدید به قدیم)
+    rows = [
+        {"type": "user", "content": "برنامه امروز؟", "timestamp": 3},
+        {"type": "bot", "content": "سلام!", "timestamp": 2},
+        {"type": "user", "content": "سلام", "timestamp": 1},
+    ]
+
+    async def scenario():
+        store = MemoryStore(HistoryBackend(rows))
+        memory = await store.aget(1)
+        memory_module.update_memory(memory, "برنامه امروز؟", "برنامه شما ...", 1)
+        await store.warm_up([2])
+        return memory, store._cache.get(2)
+
+    memory, warmed = asyncio.run(scenario())
+    assert [msg.content for msg in memory["short_term"]] == ["سلام", "سلام!", "برنامه امروز؟", "برنامه شما ..."]
+    assert [msg.content for msg in warmed["short_term"]] == ["سلام", "سلام!"]
@@ -0,0 +1,85 @@
+import asyncio
+import time
+from types import SimpleNamespace
+from db import connection, models
+
+DELAY = 0.2
+TICK = 0.01
+
+class SlowCursor:
+    def __init__(self, documents):
+        self._documents = documents
+
+    def sort(self, *args):
+        return self
+
+    def limit(self, count):
+        return self
+
+    def __iter__(self):
+        time.sleep(DELAY)
+        return iter(self._documents)
+
+class SlowCollection:
+    """کالکشن ساختگی با کوئری‌های blocking کند"""
+
+    def find_one(self, query):
+        time.sleep(DELAY)
+        return {"user_id": query["user_id"]}
+
+    def find(self, query):
+        return SlowCursor([{"user_id": query["user_id"]}])
+
+    def update_one(self, *args, **kwargs):
+        time.sleep(DELAY)
+        return SimpleNamespace(acknowledged=True, modified_count=1)
+
+    def insert_one(self, document):
+        time.sleep(DELAY)
+        return SimpleNamespace(acknowledged=True)
+
+def test_slow_queries_do_not_block_the_event_loop(monkeypatch):
+    collection = SlowCollection()
+    db = SimpleNamespace(users=collection, exam_results=collection, chat_history=collection)
+    monkeypatch.setattr(models, "get_db", lambda: db)
+    monkeypatch.setattr(models, "get_cached_profile", lambda user_id: (False, None))
+    monkeypatch.setattr(models, "cache_profile", lambda user_id, profile: None)
+    monkeypatch.setattr(models, "invalidate_profile", lambda user_id: None)
+    monkeypatch.setattr(connection, "_executor", None)
+
+    async def heartbeat(stop, lags):
+        loop = asyncio.get_running_loop()
+        while not stop.is_set():
+            started = loop.time()
+            await asyncio.sleep(TICK)
+            lags.append(loop.time() - started - TICK)
+
+    async def scenario():
+        stop = asyncio.Event()
+        lags = []
+        beat = asyncio.create_task(heartbeat(stop, lags))
+        started = time.perf_counter()
+        results = await asyncio.gather(
+            *(models.get_user_profile(i) for i in range(4)),
+            models.update_user_profile(1, {"name": "سارا"}),
+            models.save_exam_results(1, {"ریاضی": 80}),
+            models.get_user_exam_history(1),
+            models.get_user_chat_history(1),
+        )
+        elapsed = time.perf_counter() - started
+        stop.set()
+        await beat
+        return results, elapsed, lags
+
+    try:
+        results, elapsed, lags = asyncio.run(scenario())
+    finally:
+        connection.close_mongodb()
+
+    print(f"\n8 کوئری {DELAY * 1000:.0f}ms: کل={elapsed * 1000:.0f}ms، بیشترین تأخیر heartbeat={max(lags) * 1000:.1f}ms")
+    assert results[0] == {"user_id": 0}
+    assert results[-1] == [{"user_id": 1}]
+    # کوئری‌ها همزمان در thread pool اجرا می‌شوند و event loop در این مدت به کار خود ادامه می‌دهد
+    assert elapsed < 8 * DELAY / 2
+    assert len(lags) >= DELAY / TICK / 2
+    assert max(lags) < DELAY / 4
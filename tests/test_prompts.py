@@ -0,0 +1,36 @@
+import pytest
+from graph import context
+from graph.prompts import (
+    ADVISOR_SYSTEM, GENERAL_CHAT_PROMPT, PERFORMANCE_ANALYSIS_PROMPT, STUDY_PLAN_PROMPT,
+)
+
+# حداقل طول پیشوند برای کش پرامپت سمت سرویس‌دهنده
+PROMPT_CACHE_MIN_TOKENS = 1024
+# متن فارسی در o200k_base به طور متوسط کمتر از 4.5 کاراکتر در هر توکن دارد (کران محافظه‌کارانه)
+MAX_CHARS_PER_TOKEN = 4.5
+
+PROFILE = {"grade": "دوازدهم", "exam_date": "تیر", "favorite_subjects": "زیست", "disliked_subjects": "فیزیک",
+           "desired_major": "پزشکی"}
+
+def formatted_prompts():
+    return [
+        STUDY_PLAN_PROMPT.format_messages(**PROFILE, message="برنامه"),
+        PERFORMANCE_ANALYSIS_PROMPT.format_messages(**PROFILE, exam_results="زیست: 60"),
+        GENERAL_CHAT_PROMPT.format_messages(
+            name="سارا", relevant_info_text="", memory_context="", message="سلام", length_instruction=""
+        ),
+    ]
+
+def test_all_nodes_share_the_static_prefix():
+    prompts = formatted_prompts()
+    assert all(messages[0].content == ADVISOR_SYSTEM for messages in prompts)
+    # بخش ثابت هر نود فقط انتخاب وظیفه است و دستورالعمل‌ها در پیشوند مشترک قرار دارند
+    assert all(len(messages[1].content) < 50 for messages in prompts)
+
+def test_static_prefix_reaches_the_prompt_cache_minimum():
+    assert len(ADVISOR_SYSTEM) / MAX_CHARS_PER_TOKEN >= PROMPT_CACHE_MIN_TOKENS
+
+def test_static_prefix_token_count():
+    if context._get_encoding() is None:
+        pytest.skip("توکنایزر tiktoken در دسترس نیست")
+    assert context.count_tokens(ADVISOR_SYSTEM) >= PROMPT_CACHE_MIN_TOKENS
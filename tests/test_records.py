@@ -0,0 +1,48 @@
+import datetime
+import tracemalloc
+from collections import deque
+from graph.records import MemoryFact, MemoryMessage
+
+USERS, MESSAGES, FACTS = 500, 10, 5
+
+def old_memory(contents, infos, now):
+    """قالب قبلی: دیکشنری با زمان رشته‌ای برای هر مورد"""
+    short_term = deque(maxlen=MESSAGES)
+    for i, content in enumerate(contents):
+        short_term.append({
+            "role": "user" if i % 2 == 0 else "bot",
+            "content": content,
+            "timestamp": datetime.datetime.fromtimestamp(now).strftime("%Y-%m-%d %H:%M:%S"),
+        })
+    long_term = [
+        {"info": info, "timestamp": datetime.datetime.fromtimestamp(now).strftime("%Y-%m-%d %H:%M:%S")}
+        for info in infos
+    ]
+    return {"short_term": short_term, "long_term": long_term}
+
+def new_memory(contents, infos, now):
+    short_term = deque(maxlen=MESSAGES)
+    for i, content in enumerate(contents):
+        short_term.append(MemoryMessage("user" if i % 2 == 0 else "bot", content, now))
+    long_term = [MemoryFact(info, now) for info in infos]
+    return {"short_term": short_term, "long_term": long_term}
+
+def traced_size(build, data):
+    tracemalloc.start()
+    try:
+        memories = [build(contents, infos, 1700000000 + i) for i, (contents, infos) in enumerate(data)]
+        size, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert len(memories) == len(data)
+    return size
+
+def test_slotted_records_use_less_memory():
+    # متن پیام‌ها و اطلاعات کلیدی در هر دو قالب مشترک است و خارج از اندازه‌گیری ساخته می‌شود
+    data = [
+        ([f"پیام {u}-{m}" for m in range(MESSAGES)], [{"goal": f"هدف {u}-{f}"} for f in range(FACTS)])
+        for u in range(USERS)
+    ]
+    old, new = traced_size(old_memory, data), traced_size(new_memory, data)
+    print(f"\nحافظه {USERS} کاربر: دیکشنری {old / 1024:.0f}KB، رکورد slotted {new / 1024:.0f}KB ({1 - new / old:.0%} کمتر)")
+    assert new < old * 0.6
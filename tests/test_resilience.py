@@ -0,0 +1,149 @@
+import asyncio
+import pytest
+from langchain_core.messages import AIMessage, AIMessageChunk
+import config
+from graph.resilience import CircuitBreaker, CircuitOpenError, LLMUnavailableError, ResilientLLM
+
+class FakeModel:
+    """مدل ساختگی: mode یکی از ok، fail (خطای موقت) یا hang (بدون پاسخ)"""
+
+    def __init__(self):
+        self.mode = "ok"
+        self.calls = 0
+
+    async def _wait(self):
+        self.calls += 1
+        if self.mode == "fail":
+            raise asyncio.TimeoutError()
+        if self.mode == "hang":
+            await asyncio.sleep(3600)
+
+    async def ainvoke(self, messages, **kwargs):
+        await self._wait()
+        return AIMessage(content="ok")
+
+    async def astream(self, messages, **kwargs):
+        await self._wait()
+        for token in ("o", "k"):
+            yield AIMessageChunk(content=token)
+
+@pytest.fixture(autouse=True)
+def no_retries(monkeypatch):
+    monkeypatch.setattr(config, "LLM_MAX_RETRIES", 0)
+    monkeypatch.setattr(config, "LLM_HEDGING_ENABLED", False)
+
+def make_llm(model):
+    return ResilientLLM(model, "fake", timeout=5, breaker=CircuitBreaker(failure_threshold=5, reset_timeout=0.05))
+
+async def open_breaker(llm, model):
+    model.mode = "fail"
+    for _ in range(5):
+        with pytest.raises(LLMUnavailableError):
+            await llm.ainvoke([])
+    assert llm.breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        await llm.ainvoke([])
+    await asyncio.sleep(0.06)
+    assert llm.breaker.state == "half_open"
+
+def test_cancelled_trial_releases_half_open_slot():
+    async def scenario():
+        model = FakeModel()
+        llm = make_llm(model)
+        await open_breaker(llm, model)
+
+        model.mode = "hang"
+        trial = asyncio.ensure_future(llm.ainvoke([]))
+        await asyncio.sleep(0.01)
+        trial.cancel()
+        await asyncio.gather(trial, return_exceptions=True)
+
+        model.mode = "ok"
+        assert (await llm.ainvoke([])).content == "ok"
+        assert llm.breaker.state == "closed"
+
+    asyncio.run(scenario())
+
+def test_abandoned_stream_trial_releases_half_open_slot():
+    async def scenario():
+        model = FakeModel()
+        llm = make_llm(model)
+        await open_breaker(llm, model)
+
+        model.mode = "ok"
+        stream = llm.astream([])
+        await stream.__anext__()
+        await stream.aclose()
+
+        chunks = [chunk.content async for chunk in llm.astream([])]
+        assert chunks == ["o", "k"]
+        assert llm.breaker.state == "closed"
+
+    asyncio.run(scenario())
+
+def test_deadline_bounds_a_hanging_call():
+    async def scenario():
+        model = FakeModel()
+        model.mode = "hang"
+        llm = ResilientLLM(model, "fake", timeout=0.05)
+        with pytest.raises(LLMUnavailableError):
+            await llm.ainvoke([])
+        assert llm.stats["timeouts"] == 1
+
+    asyncio.run(scenario())
+
+class ScriptedModel:
+    """مدل ساختگی که رفتار هر فراخوانی را از لیست script برمی‌دارد: (پاسخ، تأخیر) یا None برای خطای موقت"""
+
+    def __init__(self, script):
+        self.script = list(script)
+        self.cancelled = 0
+
+    async def ainvoke(self, messages, **kwargs):
+        step = self.script.pop(0)
+        if step is None:
+            raise asyncio.TimeoutError()
+        content, delay = step
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        return AIMessage(content=content)
+
+def test_hedge_wins_when_the_first_attempt_is_slow(monkeypatch):
+    monkeypatch.setattr(config, "LLM_HEDGING_ENABLED", True)
+    monkeypatch.setattr(config, "LLM_HEDGE_MIN_SAMPLES", 5)
+
+    async def scenario():
+        model = ScriptedModel([("کند", 5), ("سریع", 0)])
+        llm = make_llm(model)
+        for _ in range(5):
+            llm.tracker.record(0.02)
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        result = await llm.ainvoke([])
+        assert loop.time() - started < 1
+        return model, llm, result
+
+    model, llm, result = asyncio.run(scenario())
+    assert result.content == "سریع"
+    assert llm.stats["hedged"] == 1 and llm.stats["hedge_wins"] == 1
+    # درخواست کند پس از رسیدن پاسخ hedge لغو می‌شود
+    assert model.cancelled == 1
+    assert model.script == []
+
+def test_transient_failure_is_retried(monkeypatch):
+    monkeypatch.setattr(config, "LLM_MAX_RETRIES", 2)
+    monkeypatch.setattr(config, "LLM_RETRY_BASE_DELAY", 0.01)
+
+    async def scenario():
+        model = ScriptedModel([None, ("ok", 0)])
+        llm = make_llm(model)
+        return model, llm, await llm.ainvoke([])
+
+    model, llm, result = asyncio.run(scenario())
+    assert result.content == "ok"
+    assert llm.stats["retries"] == 1 and llm.stats["failures"] == 0
+    assert llm.breaker.state == "closed" and llm.breaker.failures == 0
+    assert model.script == []
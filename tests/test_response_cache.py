@@ -0,0 +1,50 @@
+import asyncio
+import pytest
+from langchain.schema import AIMessage, HumanMessage
+from graph import nodes
+from graph.response_cache import ResponseCache
+
+PLAN = "امیدوارم موفق باشی! وضعیت فعلی درس ریاضی خوب است."
+
+class FakeLLM:
+    """مدل ساختگی که پیام‌های دریافتی را ثبت می‌کند"""
+
+    def __init__(self, reply):
+        self.reply = reply
+        self.prompts = []
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+    async def ainvoke(self, messages, **kwargs):
+        self.prompts.append(messages)
+        return AIMessage(content=self.reply)
+
+def make_state(name):
+    profile = {
+        "user_id": 1, "name": name, "complete": True, "grade": "دوازدهم",
+        "exam_date": "1404", "favorite_subjects": ["ریاضی"], "disliked_subjects": ["زیست"],
+        "desired_major": "مهندسی",
+    }
+    return {"messages": [HumanMessage(content="برنامه مطالعاتی")], "user_profile": profile, "memory": {}}
+
+@pytest.fixture(autouse=True)
+def fresh_cache(monkeypatch):
+    monkeypatch.setattr(nodes, "response_cache", ResponseCache(similarity_threshold=0))
+
+@pytest.mark.parametrize("first, second", [("امید", "سارا"), ("علی", "مریم")])
+def test_cached_plan_keeps_words_containing_the_name(first, second):
+    llm = FakeLLM(PLAN)
+    node = nodes.study_plan_node(llm)
+
+    first_state = asyncio.run(node(make_state(first)))
+    second_state = asyncio.run(node(make_state(second)))
+
+    assert len(llm.prompts) == 1
+    assert first_state["response"] == f"سلام {first} عزیز! 👋\n\n" + PLAN
+    assert second_state["response"] == f"سلام {second} عزیز! 👋\n\n" + PLAN
+
+def test_name_is_not_sent_to_the_model():
+    llm = FakeLLM(PLAN)
+    asyncio.run(nodes.study_plan_node(llm)(make_state("امید")))
+    assert all("امید" not in message.content for message in llm.prompts[0])
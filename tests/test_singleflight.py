@@ -0,0 +1,55 @@
+import asyncio
+from graph import builder
+from graph.singleflight import SingleFlight
+
+class CountingWorkflow:
+    """گراف ساختگی که تعداد اجراها را می‌شمارد"""
+
+    def __init__(self):
+        self.runs = 0
+
+    async def ainvoke(self, state):
+        self.runs += 1
+        await asyncio.sleep(0.01)
+        return {"response": f"پاسخ {self.runs}"}
+
+def make_input(request_type, message):
+    # پروفایل ناقص: پاسخ در حافظه ذخیره نمی‌شود
+    return {"type": request_type, "message": message, "user_profile": {"user_id": 1}, "memory": {"short_term": []}}
+
+def run_twice(monkeypatch, request_type, message):
+    monkeypatch.setattr(builder, "request_flight", SingleFlight(retain_seconds=10))
+    workflow = CountingWorkflow()
+
+    async def scenario():
+        first = await builder.process_with_langgraph(make_input(request_type, message), workflow)
+        second = await builder.process_with_langgraph(make_input(request_type, message), workflow)
+        return first, second
+
+    return workflow, asyncio.run(scenario())
+
+def test_repeated_short_chat_message_gets_a_fresh_reply(monkeypatch):
+    workflow, (first, second) = run_twice(monkeypatch, "general_chat", "باشه")
+    assert workflow.runs == 2
+    assert first != second
+
+def test_repeated_plan_request_reuses_the_reply(monkeypatch):
+    workflow, (first, second) = run_twice(monkeypatch, "study_plan", "برنامه")
+    assert workflow.runs == 1
+    assert first == second
+    assert builder.request_flight.get_stats()["shared_replies"] == 1
+
+def test_concurrent_identical_requests_share_one_run():
+    flight = SingleFlight(retain_seconds=0)
+    runs = []
+
+    async def work():
+        runs.append(1)
+        await asyncio.sleep(0.01)
+        return "پاسخ"
+
+    async def scenario():
+        return await asyncio.gather(*(flight.run(("u", "general_chat", "x"), work, retain=False) for _ in range(3)))
+
+    assert asyncio.run(scenario()) == ["پاسخ"] * 3
+    assert len(runs) == 1
@@ -0,0 +1,40 @@
+import asyncio
+import config
+from bot.streaming import StreamingReply
+
+class FakeSentMessage:
+    def __init__(self, text):
+        self.text = text
+
+    async def edit_text(self, text, parse_mode=None):
+        # تلگرام برای متن خالی BadRequest می‌دهد
+        assert text.strip(), "Message text is empty"
+        self.text = text
+
+class FakeMessage:
+    def __init__(self):
+        self.replies = []
+
+    async def reply_text(self, text, parse_mode=None):
+        sent = FakeSentMessage(text)
+        self.replies.append(sent)
+        return sent
+
+def run_reply(final_text):
+    async def scenario():
+        message = FakeMessage()
+        reply = StreamingReply(message, edit_interval=10, placeholder="...")
+        await reply.start()
+        await reply.finish(final_text)
+        return message
+
+    return asyncio.run(scenario())
+
+def test_empty_final_text_replaces_the_placeholder():
+    for text in ("", "  \n"):
+        message = run_reply(text)
+        assert [sent.text for sent in message.replies] == [config.DEFAULT_MESSAGES["empty_reply"]]
+
+def test_long_final_text_is_split():
+    message = run_reply("ا" * 5000)
+    assert [len(sent.text) for sent in message.replies] == [4096, 904]
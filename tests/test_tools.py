@@ -0,0 +1,39 @@
+import asyncio
+import pytest
+import config
+from cache import LRUCache
+from graph import tools
+
+class StubTool:
+    """ابزار ساختگی که فراخوانی‌ها را می‌شمارد"""
+    name = "web_search"
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.calls = 0
+
+    async def ainvoke(self, args):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        return f"نتایج جستجو برای: {args['query']}"
+
+@pytest.fixture(autouse=True)
+def fresh_cache(monkeypatch):
+    monkeypatch.setattr(tools, "tool_cache", LRUCache(max_entries=100))
+
+def call(call_id, query, name="web_search"):
+    return {"id": call_id, "name": name, "args": {"query": query}}
+
+def test_identical_calls_run_once_and_keep_order():
+    tool = StubTool(delay=0.01)
+    calls = [call("1", "کنکور"), call("2", "کنکور  "), call("3", "پزشکی"), call("4", "x", name="missing")]
+    messages = asyncio.run(tools.run_tool_calls(calls, [tool]))
+    assert tool.calls == 2
+    assert [m.tool_call_id for m in messages] == ["1", "2", "3", "4"]
+    assert messages[0].content == messages[1].content
+    assert "وجود ندارد" in messages[3].content
+
+def test_slow_tool_times_out(monkeypatch):
+    monkeypatch.setattr(config, "TOOL_TIMEOUT", 0.01)
+    messages = asyncio.run(tools.run_tool_calls([call("1", "کنکور")], [StubTool(delay=1.0)]))
+    assert "خطا" in messages[0].content
@@ -0,0 +1,131 @@
+import asyncio
+import json
+import queue
+import time
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+from bot.webhook import SECRET_HEADER, WebhookServer, _feed_from_queue, _parse_update, _stop_workers, update_owner
+
+SECRET = "s3cret"
+
+def make_update(update_id, user_id=7):
+    return {"update_id": update_id, "message": {"message_id": update_id, "date": 0, "text": "سلام",
+            "chat": {"id": user_id, "type": "private"}, "from": {"id": user_id, "is_bot": False, "first_name": "x"}}}
+
+async def post_updates(server, bodies, headers):
+    app = web.Application()
+    app.router.add_post(server.path, server.handle)
+    async with TestClient(TestServer(app)) as client:
+        statuses = []
+        for body in bodies:
+            response = await client.post(server.path, data=body, headers=headers)
+            statuses.append(response.status)
+        return statuses
+
+def test_secret_token_is_required():
+    with pytest.raises(ValueError):
+        WebhookServer(lambda data: True, secret_token="")
+
+def test_webhook_acknowledges_queues_and_rejects():
+    accepted = []
+    server = WebhookServer(lambda data: accepted.append(data) or len(accepted) <= 2, secret_token=SECRET)
+    bodies = [json.dumps(make_update(i)) for i in range(3)]
+    statuses = asyncio.run(post_updates(server, bodies + ["not json"], {SECRET_HEADER: SECRET}))
+    assert statuses == [200, 200, 503, 400]
+    assert asyncio.run(post_updates(server, bodies[:1], {SECRET_HEADER: "wrong"})) == [403]
+    assert server.stats["accepted"] == 2 and server.stats["unauthorized"] == 1
+
+def test_ingest_throughput_harness():
+    """ارسال آپدیت‌های ساختگی و اندازه‌گیری نرخ دریافت (فقط گزارش؛ آستانه حداقلی برای تشخیص خرابی)"""
+    received = []
+    server = WebhookServer(lambda data: received.append(data) or True, secret_token=SECRET)
+    bodies = [json.dumps(make_update(i, user_id=i % 50)) for i in range(500)]
+    started = time.perf_counter()
+    statuses = asyncio.run(post_updates(server, bodies, {SECRET_HEADER: SECRET}))
+    rate = len(bodies) / (time.perf_counter() - started)
+    print(f"webhook ingest: {rate:.0f} updates/s")
+    assert set(statuses) == {200} and len(received) == 500
+    assert rate > 50
+
+def test_update_owner_routes_by_user():
+    assert update_owner(make_update(1, user_id=42)) == 42
+    assert update_owner({"update_id": 9}) == 9
+
+class FakeApplication:
+    def __init__(self):
+        self.update_queue = asyncio.Queue()
+        self.bot = None
+
+def test_worker_drains_queue_until_sentinel():
+    update_queue = queue.Queue()
+    for i in range(5):
+        update_queue.put(make_update(i))
+    update_queue.put(None)
+    update_queue.put(make_update(99))
+
+    async def scenario():
+        application = FakeApplication()
+        await _feed_from_queue(application, update_queue)
+        return [application.update_queue.get_nowait().update_id for _ in range(application.update_queue.qsize())]
+
+    assert asyncio.run(scenario()) == [0, 1, 2, 3, 4]
+
+def test_non_ascii_secret_header_is_rejected():
+    server = WebhookServer(lambda data: True, secret_token=SECRET)
+    header = "سلام".encode().decode("latin-1")
+    assert asyncio.run(post_updates(server, [json.dumps(make_update(1))], {SECRET_HEADER: header})) == [403]
+    assert asyncio.run(post_updates(server, [json.dumps(make_update(1))], {SECRET_HEADER: "é"})) == [403]
+    assert server.stats["unauthorized"] == 2
+
+def test_invalid_updates_are_counted_and_skipped():
+    # update بدون فیلدهای لازم پیام، در Update.de_json خطا می‌دهد
+    broken = {"update_id": 5, "message": {"text": "سلام"}}
+
+    def dispatch(data):
+        _parse_update(data, None)
+        return True
+
+    server = WebhookServer(dispatch, secret_token=SECRET)
+    bodies = [json.dumps(broken), json.dumps(make_update(6))]
+    assert asyncio.run(post_updates(server, bodies, {SECRET_HEADER: SECRET})) == [400, 200]
+    assert server.stats["invalid"] == 1 and server.stats["accepted"] == 1
+
+    update_queue = queue.Queue()
+    for data in (make_update(1), broken, make_update(2), None):
+        update_queue.put(data)
+
+    async def scenario():
+        application = FakeApplication()
+        invalid = await _feed_from_queue(application, update_queue)
+        return invalid, [application.update_queue.get_nowait().update_id for _ in range(application.update_queue.qsize())]
+
+    assert asyncio.run(scenario()) == (1, [1, 2])
+
+class StuckProcess:
+    """پردازه ساختگی که تا kill متوقف نمی‌شود"""
+
+    def __init__(self, name):
+        self.name = name
+        self.alive = True
+        self.killed = False
+
+    def is_alive(self):
+        return self.alive
+
+    def join(self, timeout=None):
+        if timeout is None and self.alive:
+            raise AssertionError("join بدون timeout روی پردازه زنده")
+
+    def kill(self):
+        self.killed = True
+        self.alive = False
+
+def test_stuck_worker_is_killed_after_timeout():
+    queues = [queue.Queue(maxsize=1)]
+    queues[0].put(make_update(1))
+    process = StuckProcess("bot-worker-0")
+    started = time.monotonic()
+    _stop_workers(queues, [process], timeout=0.2)
+    assert time.monotonic() - started < 2
+    assert process.killed